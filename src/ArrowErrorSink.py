@@ -0,0 +1,245 @@
+import os
+
+from ErrorSink import columnDiffs
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    # pyarrow is optional, only the columnar report formats need it.
+    pa = None
+
+
+class ArrowErrorSink:
+    '''
+    Error sink that streams errors into a columnar report file, Parquet or Arrow IPC, one record batch of
+    `batchSize` errors at a time, for tools that would rather not parse csv.
+
+    Rows are written as a "key" column followed by "column_1" ... "column_n", every value as text (null for NULL),
+    so all the rows of a file share one schema whatever their types. Corruption errors are written as their column
+    level differences (see columnDiffs): "key", "column" (position in the row), "pre_migration", "post_migration".
+
+    The file cannot be cut back to a checkpoint, so a comparison writing columnar reports cannot be resumed.
+
+    Requires pyarrow, which is not installed by requirements.txt.
+    '''
+
+    FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+    def __init__(self, path, format='parquet', compression=None, batchSize=10000):
+        '''
+        :param path: the report file, created or truncated.
+        :param format: "parquet" or "arrow" (the Arrow IPC file format).
+        :param compression: codec of the file, "zstd" or for Parquet also "gzip", snappy for Parquet and none for
+                            Arrow by default.
+        :param batchSize: number of records written at once.
+        '''
+        if (pa is None):
+            raise ImportError("Parquet and Arrow reports require pyarrow, install it with `pip install pyarrow`.")
+        if (format not in self.FORMATS):
+            raise ValueError("unknown report format %s, expected one of %s" % (format, ', '.join(self.FORMATS)))
+        self.path = path
+        self.format = format
+        self.compression = compression
+        self.batchSize = batchSize
+        self.count = 0
+        # records not written yet, the schema is fixed by the first error.
+        self.records = []
+        self.schema = None
+        self.writer = None
+        self.closed = False
+
+        directory = os.path.dirname(path)
+        if (directory):
+            os.makedirs(directory, exist_ok=True)
+        if (os.path.exists(path)):
+            os.remove(path)
+
+    def add(self, *rows):
+        '''
+        Records a single error, written with the next batch.
+        :param rows: the row, or rows, that make up the error.
+        :return:
+        '''
+        if (self.schema is None):
+            self.schema = self.makeSchema(rows)
+        if (len(rows) == 2):
+            for key, column, before, after in columnDiffs(*rows):
+                self.records.append((text(key), column, text(before), text(after)))
+        else:
+            row = rows[0]
+            if (len(row) != len(self.schema)):
+                raise ValueError("%s holds rows of %d columns, this one has %d" %
+                                 (self.path, len(self.schema), len(row)))
+            self.records.append(tuple(text(value) for value in row))
+        self.count += 1
+        if (len(self.records) >= self.batchSize):
+            self.writeBatch()
+
+    def makeSchema(self, rows):
+        '''
+        :param rows: the rows of the first error.
+        :return: the schema of the report file.
+        '''
+        if (len(rows) == 2):
+            return pa.schema([('key', pa.string()), ('column', pa.int64()), ('pre_migration', pa.string()),
+                              ('post_migration', pa.string())])
+        return pa.schema([('key', pa.string())] +
+                         [('column_%d' % i, pa.string()) for i in range(1, len(rows[0]))])
+
+    def openWriter(self):
+        '''
+        Helper function that creates the report file.
+        :return:
+        '''
+        if (self.format == 'parquet'):
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression or 'snappy')
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            self.writer = pa.ipc.new_file(self.path, self.schema, options=options)
+
+    def writeBatch(self):
+        '''
+        Writes the pending records as one record batch.
+        :return:
+        '''
+        if (not self.records):
+            return
+        if (self.writer is None):
+            self.openWriter()
+        columns = list(zip(*self.records))
+        arrays = [pa.array(column, type=field.type) for column, field in zip(columns, self.schema)]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.records = []
+
+    def readBatches(self):
+        '''
+        Generator over the record batches of a closed report file.
+        :return:
+        '''
+        if (self.format == 'parquet'):
+            for batch in pq.ParquetFile(self.path).iter_batches(self.batchSize):
+                yield batch
+        else:
+            with pa.ipc.open_file(self.path) as reader:
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i)
+
+    def __len__(self):
+        return self.count
+
+    def flush(self):
+        self.writeBatch()
+
+    def checkpoint(self):
+        '''
+        Writes the pending records. The file cannot be restored to this point, see restore().
+        :return: the error count.
+        '''
+        self.writeBatch()
+        return self.count
+
+    def restore(self, state):
+        '''
+        Starting from scratch is the only state a columnar report can be restored to.
+        :param state: None.
+        :return:
+        '''
+        if (state):
+            raise ValueError("%s cannot be restored to a checkpoint, resume with csv reports" % self.path)
+
+    def merge(self, other):
+        '''
+        Appends the errors of another sink's file to this one and removes the other file.
+        :param other: a finished ArrowErrorSink of the same format and kind of error.
+        :return:
+        '''
+        other.close()
+        self.writeBatch()
+        for batch in other.readBatches():
+            if (self.schema is None):
+                self.schema = batch.schema
+            if (self.writer is None):
+                self.openWriter()
+            self.writer.write_batch(batch)
+        os.remove(other.path)
+        try:
+            # shard sub-directories are left empty once their files are merged.
+            os.rmdir(os.path.dirname(other.path))
+        except OSError:
+            pass
+        self.count += other.count
+
+    def close(self):
+        '''
+        Writes the pending records and completes the report file. Safe to call more than once.
+        :return:
+        '''
+        if (self.closed):
+            return
+        if (self.schema is None):
+            # no error at all still leaves a readable, empty file.
+            self.schema = pa.schema([('key', pa.string())])
+        self.writeBatch()
+        if (self.writer is None):
+            self.openWriter()
+        self.writer.close()
+        self.closed = True
+
+    def finish(self, reportDir):
+        '''
+        The errors are already in the report file, it only needs to be completed.
+        :param reportDir: unused, the file lives at the path given on construction.
+        :return:
+        '''
+        self.close()
+
+    def __getstate__(self):
+        # an open writer cannot cross a process boundary, the sink is closed and travels as its path and count.
+        self.close()
+        state = self.__dict__.copy()
+        state.update(writer=None)
+        return state
+
+
+class ArrowErrorSinkFactory:
+    '''
+    Creates the ArrowErrorSinks of a data comparator inside a report directory, see CsvErrorSinkFactory.
+    '''
+
+    def __init__(self, reportDir, format='parquet', compression=None, batchSize=10000):
+        '''
+        :param reportDir: directory the report files are written into.
+        :param format: "parquet" or "arrow".
+        :param compression: codec of the files, see ArrowErrorSink.
+        :param batchSize: number of records written at once.
+        '''
+        self.reportDir = reportDir
+        self.format = format
+        self.compression = compression
+        self.batchSize = batchSize
+
+    def __call__(self, filename):
+        '''
+        :param filename: name of the csv report file the sink replaces.
+        :return: a new ArrowErrorSink.
+        '''
+        path = os.path.join(self.reportDir, os.path.splitext(filename)[0] + ArrowErrorSink.FORMATS[self.format])
+        return ArrowErrorSink(path, self.format, self.compression, self.batchSize)
+
+    def forShard(self, shard):
+        '''
+        :param shard: number of a primary key range compared by a separate worker.
+        :return: a factory writing into a sub-directory of its own, whose files are merged back afterwards.
+        '''
+        return ArrowErrorSinkFactory(os.path.join(self.reportDir, "shard-%d" % shard), self.format, self.compression,
+                                     self.batchSize)
+
+
+def text(value):
+    '''
+    :param value: a column value.
+    :return: its text form, None for NULL.
+    '''
+    return None if value is None else str(value)
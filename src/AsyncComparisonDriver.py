@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+from AsyncPsycoConnection import AsyncPsycoConnection
+
+
+class AsyncComparisonDriver:
+    '''
+    Compares many tables, of any number of database pairs, from a single thread on one asyncio event loop.
+
+    Every comparison job opens its own pair of AsyncPsycoConnections and reads both databases at the same time.
+    While the data comparator works on the current chunk pair, the next pair is already being fetched, and while one
+    job waits on the network the loop runs the others. A semaphore caps the number of jobs, and so of open
+    connections, active at once.
+
+    Tables are read in the order of the primary key given with each job, usually discovered beforehand on a regular
+    connection (see MigrationReport.discoverPrimaryKey), and chunks are pushed through
+    DataComparator.prepareDataChunks(). The compact engine, which re-fetches rows on a blocking connection, cannot be
+    used.
+    '''
+
+    def __init__(self, maxConcurrent=16):
+        '''
+        :param maxConcurrent: number of comparisons running at the same time, each holding two connections.
+        '''
+        self.maxConcurrent = max(1, maxConcurrent)
+
+    def run(self, jobs, n):
+        '''
+        Runs every comparison job and waits for all of them.
+        :param jobs: list of (psqldbA, psqldbB, tablename, dataComparator, primaryKey) tuples.
+        :param n: size of data chunk from databases.
+        :return: list with, for every job, its finished data comparator or the exception that stopped it.
+        '''
+        return asyncio.run(self.runJobs(jobs, n))
+
+    async def runJobs(self, jobs, n):
+        '''
+        Coroutine behind run().
+        :param jobs: list of (psqldbA, psqldbB, tablename, dataComparator, primaryKey) tuples.
+        :param n: size of data chunk from databases.
+        :return: the results, in the order of the jobs.
+        '''
+        # created inside the running loop, which it belongs to.
+        semaphore = asyncio.Semaphore(self.maxConcurrent)
+
+        async def limited(job):
+            async with semaphore:
+                return await self.compareTable(*job, n)
+
+        # one broken comparison should not throw away the results of the others.
+        return await asyncio.gather(*[limited(job) for job in jobs], return_exceptions=True)
+
+    async def compareTable(self, psqldbA, psqldbB, tablename, dataComparator, primaryKey, n):
+        '''
+        Streams one table from two databases through a data comparator.
+        :param psqldbA: PSQLServer of the pre-migration database.
+        :param psqldbB: PSQLServer of the post-migration database.
+        :param tablename: the table to compare.
+        :param dataComparator: a DataComparator() object that records the errors.
+        :param primaryKey: the PrimaryKey of the table, whose order and select list the table is read with.
+        :param n: size of data chunk from databases.
+        :return: the finished data comparator.
+        '''
+        connections = [AsyncPsycoConnection(psqldbA), AsyncPsycoConnection(psqldbB)]
+        pending = None
+        try:
+            for connection in connections:
+                connection.tablename = tablename
+                connection.primaryKey = primaryKey
+            await asyncio.gather(*[connection.connect() for connection in connections])
+            psqlQuery, params = primaryKey.selectQuery()
+            await asyncio.gather(*[connection.query(psqlQuery, n, params) for connection in connections])
+
+            pending = self.fetchPair(connections)
+            while (True):
+                # only the time spent waiting for a chunk pair that is not there yet counts as fetching.
+                start = time.perf_counter()
+                a, b = await pending
+                dataComparator.metrics.time('fetch', time.perf_counter() - start)
+                a, b = primaryKey.keyRows(a), primaryKey.keyRows(b)
+                dataComparator.recordChunk(a, 'A')
+                dataComparator.recordChunk(b, 'B')
+                if (len(a) == 0 and len(b) == 0):
+                    break
+                # the next chunk pair is on its way while this one is compared. Yielding once lets both fetches send
+                # their FETCH statements before the comparison holds the loop.
+                pending = self.fetchPair(connections)
+                await asyncio.sleep(0)
+                dataComparator.prepareDataChunks(a, b)
+            dataComparator.finish()
+        finally:
+            if (pending and not pending.done()):
+                # the fetch has to be over before the connections are closed, close() then cancels the FETCH
+                # statements it left running.
+                pending.cancel()
+                try:
+                    await pending
+                except (asyncio.CancelledError, Exception):
+                    pass
+            for connection in connections:
+                if (connection.conn):
+                    try:
+                        await connection.close()
+                    except Exception as e:
+                        print("Closing connection to %s failed: %s" % (connection.psqldb.dbname, e))
+        return dataComparator
+
+    def fetchPair(self, connections):
+        '''
+        Starts fetching the next chunk of both databases at the same time. Both fetches are scheduled as tasks
+        right away, so they send their FETCH statement the next time the loop runs.
+        :param connections: the pre and post migration AsyncPsycoConnections.
+        :return: future of [chunk of A, chunk of B], the rows as the databases return them.
+        '''
+        return asyncio.gather(connections[0].fetchNext(), connections[1].fetchNext())
@@ -0,0 +1,162 @@
+import asyncio
+
+import psycopg2
+import psycopg2.extensions
+
+
+class AsyncPsycoConnection:
+    '''
+    Asynchronous counterpart of PsycoConnection, built on psycopg2's asynchronous connection mode.
+
+    Instead of blocking while postgres works, every statement is sent and the connection's socket is then watched
+    by the asyncio event loop (add_reader / add_writer) until psycopg2 reports the result is complete. A single
+    thread can therefore keep many connections busy at the same time.
+
+    Asynchronous connections have no implicit transactions and no named cursors, so streaming queries declare
+    their server-side cursor themselves (BEGIN, DECLARE ... CURSOR, FETCH FORWARD n) and close it with COMMIT.
+
+    The methods mirror PsycoConnection (query, fetchNext, close) but must be awaited. A statement whose wait was
+    cancelled is still running on the server, close() cancels it there before ending the connection's transaction.
+    '''
+
+    # name of the server-side cursor of the current streaming query.
+    CURSOR_NAME = "migration_report_async"
+
+    def __init__(self, PSQLdb):
+        '''
+        :param PSQLdb: the PSQLServer to connect to.
+        '''
+        self.psqldb = PSQLdb
+        self.conn = None
+        self.cursor = None
+        self.tablename = ''
+        self.n = 0
+        self.streaming = False
+        # primary key of the table, whose key is packed into row[0] of the fetched rows.
+        self.primaryKey = None
+
+    async def connect(self):
+        '''
+        Opens the asynchronous connection to the postgres server.
+        :return:
+        '''
+        self.conn = psycopg2.connect(
+            host="localhost",
+            database=self.psqldb.dbname,
+            user=self.psqldb.user,
+            password=self.psqldb.password,
+            port=self.psqldb.port,
+            async_=True
+        )
+        await self.wait()
+        self.cursor = self.conn.cursor()
+
+    async def wait(self):
+        '''
+        Waits on the event loop until the pending operation of the connection has completed.
+        :return:
+        '''
+        loop = asyncio.get_running_loop()
+        while (True):
+            state = self.conn.poll()
+            if (state == psycopg2.extensions.POLL_OK):
+                return
+            if (state == psycopg2.extensions.POLL_READ):
+                await self.waitForSocket(loop.add_reader, loop.remove_reader)
+            elif (state == psycopg2.extensions.POLL_WRITE):
+                await self.waitForSocket(loop.add_writer, loop.remove_writer)
+            else:
+                raise psycopg2.OperationalError("unexpected poll state %s" % state)
+
+    async def waitForSocket(self, add, remove):
+        '''
+        Helper function that suspends until the connection's socket is readable or writable.
+        :param add: the event loop's add_reader or add_writer.
+        :param remove: the matching remove_reader or remove_writer.
+        :return:
+        '''
+        future = asyncio.get_running_loop().create_future()
+        fileno = self.conn.fileno()
+        add(fileno, lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            remove(fileno)
+
+    async def run(self, statement, params=None):
+        '''
+        Helper function that sends one statement and waits for it to complete.
+        :param statement: the statement, with the table name already substituted.
+        :param params: optional sequence of bound parameters.
+        :return:
+        '''
+        self.cursor.execute(statement, params)
+        await self.wait()
+
+    async def query(self, psqlQuery:str, n=None, params=None):
+        '''
+        Starts streaming the result of a query through a server-side cursor. fetchNext() returns it in chunks.
+        :param psqlQuery: a string that contains postgres commands, %s is replaced with the table name.
+        :param n: size of the data chunk to increment.
+        :param params: optional sequence of bound parameters, marked with %%s in the query.
+        :return:
+        '''
+        await self.closeStream()
+        self.n = n
+        await self.run("BEGIN")
+        try:
+            await self.run("DECLARE %s NO SCROLL CURSOR FOR " % self.CURSOR_NAME + psqlQuery % self.tablename, params)
+        except Exception:
+            await self.run("ROLLBACK")
+            raise
+        self.streaming = True
+
+    async def fetchNext(self, n=None):
+        '''
+        Fetches the next chunk of the current streaming query.
+        :param n: number of rows wanted, defaults to the chunk size given to the query.
+        :return: list of rows, empty once the query is exhausted.
+        '''
+        await self.run("FETCH FORWARD %d FROM %s" % (n if n else self.n, self.CURSOR_NAME))
+        return self.cursor.fetchall()
+
+    async def cancel(self):
+        '''
+        Cancels the statement in progress, left running by a wait that was itself cancelled, and rolls its
+        transaction back. The connection cannot send anything else until that statement has ended.
+        :return:
+        '''
+        self.conn.cancel()
+        try:
+            await self.wait()
+        except psycopg2.extensions.QueryCanceledError:
+            pass
+        if (self.streaming):
+            # the cancelled statement aborted the transaction, which also drops the cursor.
+            self.streaming = False
+            await self.run("ROLLBACK")
+
+    async def closeStream(self):
+        '''
+        Closes the server-side cursor of the current streaming query and ends its transaction.
+        :return:
+        '''
+        if (self.streaming):
+            self.streaming = False
+            await self.run("CLOSE %s" % self.CURSOR_NAME)
+            await self.run("COMMIT")
+
+    async def close(self):
+        '''
+        Closes the connection to the docker psql server.
+        :return:
+        '''
+        if (self.conn):
+            try:
+                if (self.conn.isexecuting()):
+                    await self.cancel()
+                await self.closeStream()
+            finally:
+                self.cursor.close()
+                self.conn.close()
+                self.conn = None
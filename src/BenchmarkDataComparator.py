@@ -0,0 +1,213 @@
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+
+import TestDataComparator
+from DataComparator import DataComparator
+from MergeComparator import MergeComparator
+from CompactDataComparator import CompactDataComparator
+from VectorComparator import VectorComparator, np
+
+# comparison engines that can be benchmarked.
+ENGINES = {
+    'hash': DataComparator,
+    'merge': MergeComparator,
+    'compact': CompactDataComparator,
+}
+if (np is not None):
+    ENGINES['vector'] = VectorComparator
+
+# primary key layouts of the generated tables.
+PATTERNS = ['dense', 'gappy', 'skewed']
+
+
+class BenchmarkDataComparator:
+    '''
+    Benchmarks the data comparators on synthetic tables built with the TestDataComparator generators.
+
+    For every combination of engine, chunk size, row width, error rate and primary key pattern, the tables are fed
+    through prepareDataChunks() one chunk pair at a time, as MigrationReport.compareData does, and the benchmark
+    records the throughput in rows per second, the latency of every chunk and the peak memory allocated by the
+    comparator. Throughput and memory are measured in separate runs because tracemalloc slows Python down.
+
+    Key patterns:
+    1. dense - consecutive primary keys, the chunks of both tables line up.
+    2. gappy - primary keys with random gaps between them.
+    3. skewed - the post-migration table starts with a block of created rows three chunks long, so its chunks
+                lag behind and rows wait in the leftover hashmaps.
+    '''
+
+    def __init__(self, rows=20000, repeat=3, measureMemory=True, seed=0):
+        '''
+        :param rows: number of rows in each generated pre-migration table.
+        :param repeat: number of timed runs per combination, the fastest is kept.
+        :param measureMemory: also run each combination under tracemalloc to record peak memory.
+        :param seed: seed for the random table generation, so runs are comparable.
+        '''
+        self.rows = rows
+        self.repeat = max(1, repeat)
+        self.measureMemory = measureMemory
+        self.seed = seed
+        # the generators are methods of the test case, it is only used as a helper here.
+        self.generator = TestDataComparator.TestDataComparator()
+        self.datasets = {}
+
+    def generateTables(self, rowWidth, errorRate, pattern, chunkSize):
+        '''
+        Generates, or returns the cached, pre and post migration tables of a combination.
+        :param rowWidth: number of columns including the primary key.
+        :param errorRate: fraction of rows to turn into errors, split evenly between the three kinds.
+        :param pattern: one of PATTERNS.
+        :param chunkSize: chunk size of the run, which sets the length of the skewed block.
+        :return: (alist, blist) ordered tables.
+        '''
+        skew = 3 * chunkSize if pattern == 'skewed' else 0
+        key = (rowWidth, errorRate, pattern, skew)
+        if (key in self.datasets):
+            return self.datasets[key]
+
+        random.seed(self.seed)
+        primaryKey = 0
+        alist = []
+        for i in range(self.rows):
+            alist.append(self.generator.generateRandomRow(primaryKey, rowWidth))
+            primaryKey += random.randint(1, 10) if pattern == 'gappy' else 1
+
+        errors = int(self.rows * errorRate) // 3
+        blist = self.generator.setupBData(alist, errors, errors, errors)
+        if (skew):
+            blist = [self.generator.generateRandomRow(i - skew, rowWidth) for i in range(skew)] + blist
+
+        # created rows can drift past their neighbours on high error rates, restore the database ordering.
+        blist.sort(key=lambda row: row[0])
+        self.datasets[key] = (alist, blist)
+        return self.datasets[key]
+
+    def runOnce(self, engine, alist, blist, chunkSize):
+        '''
+        Feeds the tables through a fresh data comparator, one chunk pair at a time.
+        :param engine: the DataComparator class.
+        :param alist: pre-migration table.
+        :param blist: post-migration table.
+        :param chunkSize: rows per chunk.
+        :return: (finished data comparator, total seconds, list of per chunk seconds).
+        '''
+        dataComparator = engine()
+        latencies = []
+        start = time.perf_counter()
+        for i in range(0, max(len(alist), len(blist)), chunkSize):
+            chunkStart = time.perf_counter()
+            dataComparator.prepareDataChunks(alist[i:i + chunkSize], blist[i:i + chunkSize])
+            latencies.append(time.perf_counter() - chunkStart)
+        dataComparator.finish()
+        return dataComparator, time.perf_counter() - start, latencies
+
+    def measure(self, engineName, chunkSize, rowWidth, errorRate, pattern):
+        '''
+        Benchmarks a single combination.
+        :return: dictionary of the combination and its measurements.
+        '''
+        alist, blist = self.generateTables(rowWidth, errorRate, pattern, chunkSize)
+        engine = ENGINES[engineName]
+
+        best = None
+        for i in range(self.repeat):
+            run = self.runOnce(engine, alist, blist, chunkSize)
+            if (best is None or run[1] < best[1]):
+                best = run
+        dataComparator, seconds, latencies = best
+
+        peakMemory = None
+        if (self.measureMemory):
+            tracemalloc.start()
+            self.runOnce(engine, alist, blist, chunkSize)
+            peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        latencies.sort()
+        rows = len(alist) + len(blist)
+        return {
+            'engine': engineName,
+            'chunkSize': chunkSize,
+            'rowWidth': rowWidth,
+            'errorRate': errorRate,
+            'pattern': pattern,
+            'rows': rows,
+            'seconds': seconds,
+            'rowsPerSecond': rows / seconds if seconds > 0 else None,
+            'chunkLatency': {
+                'chunks': len(latencies),
+                'mean': sum(latencies) / len(latencies) if latencies else 0.0,
+                'p50': self.percentile(latencies, 0.5),
+                'p95': self.percentile(latencies, 0.95),
+                'max': latencies[-1] if latencies else 0.0,
+            },
+            'peakMemoryBytes': peakMemory,
+            'errors': {
+                'corruption': dataComparator.numCorruptionErrors,
+                'omission': dataComparator.numCopyOmissionErrors,
+                'creation': dataComparator.numCreationErrors,
+            },
+        }
+
+    def percentile(self, ordered, fraction):
+        '''
+        Helper function that reads a percentile off a sorted list.
+        :param ordered: ascending list of values.
+        :param fraction: the percentile as a fraction between 0 and 1.
+        :return: the value, 0.0 for an empty list.
+        '''
+        if (not ordered):
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def run(self, engines, chunkSizes, rowWidths, errorRates, patterns):
+        '''
+        Benchmarks every combination of the given parameters.
+        :return: the benchmark results, ready to be dumped as JSON.
+        '''
+        results = []
+        for rowWidth in rowWidths:
+            for errorRate in errorRates:
+                for pattern in patterns:
+                    for chunkSize in chunkSizes:
+                        for engineName in engines:
+                            result = self.measure(engineName, chunkSize, rowWidth, errorRate, pattern)
+                            print("%-6s chunk=%-6d width=%-3d errors=%-5g %-7s %12.0f rows/s  p95 chunk %.2fms" %
+                                  (engineName, chunkSize, rowWidth, errorRate, pattern, result['rowsPerSecond'] or 0,
+                                   result['chunkLatency']['p95'] * 1000))
+                            results.append(result)
+
+        return {
+            'python': platform.python_version(),
+            'numpy': np.__version__ if np is not None else None,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'tableRows': self.rows,
+            'repeat': self.repeat,
+            'seed': self.seed,
+            'results': results,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data comparators on synthetic tables.")
+    parser.add_argument("--rows", type=int, default=20000, help="rows in each generated pre-migration table")
+    parser.add_argument("--engines", nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument("--chunk-sizes", nargs='+', type=int, default=[100, 1000, 10000])
+    parser.add_argument("--row-widths", nargs='+', type=int, default=[5, 20])
+    parser.add_argument("--error-rates", nargs='+', type=float, default=[0.0, 0.05])
+    parser.add_argument("--patterns", nargs='+', choices=PATTERNS, default=PATTERNS)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per combination, the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json", help="file the JSON results are written to")
+    args = parser.parse_args()
+
+    benchmark = BenchmarkDataComparator(args.rows, args.repeat, not args.no_memory, args.seed)
+    report = benchmark.run(args.engines, args.chunk_sizes, args.row_widths, args.error_rates, args.patterns)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results written to %s" % args.output)
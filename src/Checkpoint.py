@@ -0,0 +1,93 @@
+import os
+import pickle
+import time
+
+
+class Checkpoint:
+    '''
+    Periodically saves the progress of a table comparison so that a comparison that died can be resumed instead of
+    started over.
+
+    A checkpoint is taken between two chunk pairs. It holds the primary key of the last row read from each database,
+    the state of the data comparator (counters, rows still waiting for a match and the offsets of its error sinks,
+    see DataComparator.checkpointState) and whether the comparison finished. Resuming restores the data comparator
+    and reads each database again from the row after its saved key, so no row is compared twice.
+
+    The checkpoint file is written next to itself and then renamed over the old one, so a crash while saving leaves
+    the previous checkpoint intact.
+    '''
+
+    def __init__(self, path, interval=300.0):
+        '''
+        :param path: the checkpoint file.
+        :param interval: seconds between two checkpoints.
+        '''
+        self.path = path
+        self.interval = interval
+        self.lastKeyA = None
+        self.lastKeyB = None
+        self.finished = False
+        self.lastSave = time.monotonic()
+        self.saves = 0
+
+    def chunkDone(self, dataComparator, alist, blist):
+        '''
+        Records that a chunk pair has been processed, and saves a checkpoint if the interval has passed.
+        :param dataComparator: the data comparator that processed the chunks.
+        :param alist: the rows from database A.
+        :param blist: the rows from database B.
+        :return:
+        '''
+        if (len(alist) > 0):
+            self.lastKeyA = alist[-1][0]
+        if (len(blist) > 0):
+            self.lastKeyB = blist[-1][0]
+        if (time.monotonic() - self.lastSave >= self.interval):
+            self.save(dataComparator)
+
+    def save(self, dataComparator, finished=False):
+        '''
+        Writes a checkpoint of the comparison.
+        :param dataComparator: the data comparator, between two chunk pairs.
+        :param finished: the comparison is complete, a resume only needs to restore its results.
+        :return:
+        '''
+        self.finished = finished
+        state = {
+            'lastKeyA': self.lastKeyA,
+            'lastKeyB': self.lastKeyB,
+            'finished': finished,
+            'comparator': dataComparator.checkpointState(),
+        }
+        directory = os.path.dirname(self.path)
+        if (directory):
+            os.makedirs(directory, exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self.lastSave = time.monotonic()
+        self.saves += 1
+
+    def restore(self, dataComparator):
+        '''
+        Restores the data comparator from the checkpoint file. Without a checkpoint the data comparator starts
+        empty, which also clears report files kept for resuming.
+        :param dataComparator: a new data comparator of the same class as the one that was saved.
+        :return: True if a checkpoint was restored.
+        '''
+        if (not os.path.exists(self.path)):
+            for sink in dataComparator.errorSinks():
+                sink.restore(None)
+            return False
+
+        with open(self.path, 'rb') as f:
+            state = pickle.load(f)
+        dataComparator.restoreState(state['comparator'])
+        self.lastKeyA = state['lastKeyA']
+        self.lastKeyB = state['lastKeyB']
+        self.finished = state['finished']
+        print("Resuming from checkpoint %s after keys %s / %s" % (self.path, self.lastKeyA, self.lastKeyB))
+        return True
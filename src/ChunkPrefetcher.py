@@ -0,0 +1,89 @@
+import queue
+import threading
+
+
+class ChunkPrefetcher:
+    '''
+    Reads chunks from a PsycoConnection on a background thread so the next chunks are already on their way while
+    the data comparator works on the current one.
+
+    One prefetcher is started per database, so both servers are read at the same time. Each one keeps at most
+    `depth` chunks in its bounded queue, which caps memory at depth * chunk size rows per database. psycopg2 releases
+    the GIL while it waits on the network, so the fetch threads and the comparison overlap in practice.
+
+    fetchNext() has the same contract as PsycoConnection.fetchNext, so a prefetcher can be handed to
+    DataComparator.compareStreams in place of the connection.
+    '''
+
+    # marks the end of the stream in the queue.
+    DONE = object()
+
+    def __init__(self, connection, depth=2, chunkSizer=None):
+        '''
+        :param connection: a PsycoConnection whose query has already been issued.
+        :param depth: number of chunks that may be fetched ahead of the consumer.
+        :param chunkSizer: optional ChunkSizer that picks the size of every fetch.
+        '''
+        self.connection = connection
+        self.chunkSizer = chunkSizer
+        self.chunks = queue.Queue(maxsize=max(1, depth))
+        self.stopped = threading.Event()
+        self.finished = False
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        '''
+        Body of the fetch thread. Pushes chunks into the queue until the connection returns an empty chunk.
+        :return:
+        '''
+        try:
+            while (not self.stopped.is_set()):
+                if (self.chunkSizer):
+                    chunk = self.chunkSizer.fetch(self.connection.fetchNext)
+                else:
+                    chunk = self.connection.fetchNext()
+                if (len(chunk) == 0):
+                    break
+                self.put(chunk)
+        except Exception as e:
+            # handed over to the consumer thread, which re-raises it from fetchNext().
+            self.error = e
+        self.put(self.DONE)
+
+    def put(self, item):
+        '''
+        Helper function that blocks until there is room in the queue, or until the prefetcher is closed.
+        :param item: a chunk of rows or the DONE marker.
+        :return:
+        '''
+        while (not self.stopped.is_set()):
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def fetchNext(self):
+        '''
+        Returns the next prefetched chunk, waiting for it if it has not arrived yet.
+        :return: a list of rows, empty once the stream is exhausted.
+        '''
+        if (self.finished):
+            return []
+        chunk = self.chunks.get()
+        if (chunk is self.DONE):
+            self.finished = True
+            if (self.error):
+                raise self.error
+            return []
+        return chunk
+
+    def close(self):
+        '''
+        Stops the fetch thread and waits for it to exit. Must be called before the connection is reused.
+        :return:
+        '''
+        self.stopped.set()
+        self.thread.join()
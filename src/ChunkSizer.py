@@ -0,0 +1,186 @@
+import sys
+import threading
+import time
+
+
+class ChunkSizer:
+    '''
+    Tunes the number of rows fetched per chunk while a table is being read.
+
+    Every fetch reports how many rows it returned, roughly how many bytes they take in memory and how long it took.
+    Once a window of fetches has been observed the sizer compares their throughput, in rows per second, with the
+    previous window: while throughput keeps improving the chunk size keeps moving in the same direction, when it
+    drops the direction is reversed and the step made smaller, so the size settles around the fastest value.
+
+    The size is always capped by the memory budget: the measured bytes per row times the number of chunks that can
+    be held at once (both databases, the prefetch queues and the chunks being compared) must fit into it. Narrow
+    tables therefore grow to large chunks and few round trips, wide tables stay small.
+
+    The sizes chosen are recorded and written into the migration report.
+    '''
+
+    def __init__(self, initial=100, memoryBudget=64 << 20, chunksInFlight=4, minSize=10, maxSize=100000,
+                 window=4):
+        '''
+        :param initial: chunk size of the first fetch.
+        :param memoryBudget: bytes that all chunks held at the same time may take.
+        :param chunksInFlight: number of chunks held in memory at the same time.
+        :param minSize: smallest chunk size.
+        :param maxSize: largest chunk size.
+        :param window: number of fetches whose throughput is measured before the size is changed.
+        '''
+        self.memoryBudget = memoryBudget
+        self.chunksInFlight = max(1, chunksInFlight)
+        self.minSize = max(1, minSize)
+        self.maxSize = max(self.minSize, maxSize)
+        self.window = max(1, window)
+        self.size = min(max(initial, self.minSize), self.maxSize)
+        self.initial = self.size
+
+        # growth factor of the next change, and whether it grows (1) or shrinks (-1) the size.
+        self.factor = 2.0
+        self.direction = 1
+        self.lastThroughput = None
+        self.bytesPerRow = None
+
+        self.windowRows = 0
+        self.windowSeconds = 0.0
+        self.windowFetches = 0
+
+        self.fetches = 0
+        self.totalRows = 0
+        self.totalBytes = 0
+        self.totalSeconds = 0.0
+        # (fetch number, new chunk size) for every change of the size.
+        self.history = []
+        self.lock = threading.Lock()
+
+    def fetch(self, fetchNext):
+        '''
+        Fetches one chunk at the current size and observes it.
+        :param fetchNext: a fetchNext function taking the number of rows wanted, e.g. PsycoConnection.fetchNext.
+        :return: the chunk.
+        '''
+        size = self.size
+        start = time.perf_counter()
+        chunk = fetchNext(size)
+        self.observe(len(chunk), estimateChunkBytes(chunk), time.perf_counter() - start, size)
+        return chunk
+
+    def observe(self, rows, nbytes, seconds, requested=None):
+        '''
+        Records a fetch and adjusts the chunk size once a full window of fetches has been observed.
+        :param rows: number of rows returned.
+        :param nbytes: approximate size in bytes of the rows in memory.
+        :param seconds: time the fetch took.
+        :param requested: number of rows asked for, defaults to the current size.
+        :return: the chunk size to use for the next fetch.
+        '''
+        with self.lock:
+            self.fetches += 1
+            self.totalRows += rows
+            self.totalBytes += nbytes
+            self.totalSeconds += seconds
+            if (rows > 0):
+                rowBytes = nbytes / rows
+                self.bytesPerRow = rowBytes if self.bytesPerRow is None else 0.8 * self.bytesPerRow + 0.2 * rowBytes
+
+            if (rows < (requested if requested else self.size)):
+                # the end of the table, a short chunk says nothing about the chunk size.
+                self.resize(self.size)
+                return self.size
+
+            self.windowRows += rows
+            self.windowSeconds += seconds
+            self.windowFetches += 1
+            if (self.windowFetches < self.window):
+                # the memory budget is enforced straight away.
+                self.resize(self.size)
+                return self.size
+
+            throughput = self.windowRows / self.windowSeconds if self.windowSeconds > 0 else float('inf')
+            if (self.lastThroughput is not None and throughput < self.lastThroughput * 0.95):
+                # got slower, turn around with a smaller step.
+                self.direction = -self.direction
+                self.factor = max(1.1, self.factor ** 0.5)
+            self.lastThroughput = throughput
+            self.windowRows = 0
+            self.windowSeconds = 0.0
+            self.windowFetches = 0
+
+            self.resize(int(round(self.size * self.factor ** self.direction)))
+            return self.size
+
+    def resize(self, target):
+        '''
+        Helper function that clamps a new chunk size to the limits and the memory budget, and records it if it changed.
+        :param target: the chunk size wanted.
+        :return:
+        '''
+        limit = self.maxSize
+        if (self.bytesPerRow):
+            limit = min(limit, int(self.memoryBudget / (self.bytesPerRow * self.chunksInFlight)))
+        size = min(max(target, self.minSize), max(limit, self.minSize))
+        if (size != self.size):
+            self.size = size
+            self.history.append((self.fetches, size))
+
+    def merge(self, other):
+        '''
+        Adds the observations of another sizer, e.g. the one of another primary key range of the same table.
+        :param other: a ChunkSizer.
+        :return:
+        '''
+        self.fetches += other.fetches
+        self.totalRows += other.totalRows
+        self.totalBytes += other.totalBytes
+        self.totalSeconds += other.totalSeconds
+        self.history.extend(other.history)
+
+    def writeSummary(self, f):
+        '''
+        Writes the chunk sizes that were chosen to an open text report.
+        :param f: a writable text file.
+        :return:
+        '''
+        sizes = [self.initial] + [size for fetch, size in self.history]
+        f.write("\nAdaptive Chunk Sizing (memory budget %d bytes):\n" % self.memoryBudget)
+        f.write("\tInitial Chunk Size:\t%d\n" % self.initial)
+        f.write("\tFinal Chunk Size:\t%d\n" % self.size)
+        f.write("\tSmallest / Largest:\t%d / %d\n" % (min(sizes), max(sizes)))
+        f.write("\tSize Changes:\t\t%d\n" % len(self.history))
+        f.write("\tFetches:\t\t%d\n" % self.fetches)
+        if (self.totalRows > 0):
+            f.write("\tAverage Row Size:\t%d bytes\n" % (self.totalBytes // self.totalRows))
+        if (self.totalSeconds > 0):
+            f.write("\tFetch Throughput:\t%d rows/s\n" % (self.totalRows / self.totalSeconds))
+        if (self.history):
+            f.write("\tChunk Sizes Chosen (fetch: size):\t%s\n" %
+                    ', '.join("%d: %d" % change for change in self.history[:50]))
+
+    def __getstate__(self):
+        # the lock cannot be pickled, a sizer sent to a worker process gets a new one.
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+def estimateChunkBytes(chunk, sample=16):
+    '''
+    Estimates the memory taken by a chunk of rows from a few evenly spaced rows.
+    :param chunk: list of row tuples.
+    :param sample: number of rows that are measured.
+    :return: approximate size in bytes of the whole chunk.
+    '''
+    if (not chunk):
+        return 0
+    step = max(1, len(chunk) // sample)
+    measured = chunk[::step]
+    nbytes = 0
+    for row in measured:
+        nbytes += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return nbytes * len(chunk) // len(measured)
@@ -0,0 +1,115 @@
+import json
+
+from PrimaryKey import quoteIdentifier
+
+
+class ColumnProjection:
+    '''
+    Per-table choice of the columns that are compared and of how each one is normalized, applied in the SQL so the
+    servers only send the bytes that matter, already in a comparable form.
+
+    The configuration is a JSON file:
+
+        {
+            "tables": {
+                "orders": {
+                    "exclude": ["attachment"],
+                    "normalize": {"total": "round:2", "placed_at": "utc", "details": "jsonb", "notes": "md5"}
+                },
+                "*": {"normalize": {"updated_at": "utc"}}
+            }
+        }
+
+    "include" lists the only columns compared, "exclude" the columns left out, the primary key is always read.
+    "normalize" maps a column to one of the PRESETS or to a SQL expression where {column} stands for the column.
+    The "*" entry applies to tables without an entry of their own. Normalized values are also what the error
+    reports show.
+    '''
+
+    # normalization presets, {column} is replaced with the quoted column name and {digits} with the preset argument.
+    PRESETS = {
+        'round': "round({column}::numeric, {digits})",
+        'utc': "({column} AT TIME ZONE 'UTC')",
+        'jsonb': "{column}::jsonb::text",
+        'md5': "md5({column}::text)",
+        'lower': "lower({column})",
+        'trim': "btrim({column})",
+        'text': "{column}::text",
+    }
+
+    def __init__(self, tables):
+        '''
+        :param tables: dictionary of table name, or "*", to its settings (include, exclude, normalize).
+        '''
+        self.tables = tables
+        for tablename, settings in tables.items():
+            unknown = set(settings) - {'include', 'exclude', 'normalize'}
+            if (unknown):
+                raise ValueError("unknown settings %s for table %s" % (', '.join(sorted(unknown)), tablename))
+
+    @classmethod
+    def fromFile(cls, path):
+        '''
+        :param path: a JSON configuration file.
+        :return: the ColumnProjection it describes.
+        '''
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config.get('tables', {}))
+
+    def settings(self, tablename):
+        '''
+        :param tablename: a table.
+        :return: the settings of the table, or None when its rows are compared whole.
+        '''
+        return self.tables.get(tablename, self.tables.get('*'))
+
+    def expressions(self, tablename, columns, keyColumns):
+        '''
+        Builds the select list of the compared columns of a table, without its primary key columns.
+        :param tablename: the table.
+        :param columns: names of all the columns of the table, in table order.
+        :param keyColumns: names of the primary key columns.
+        :return: list of SQL expressions, or None when the table's rows are compared whole.
+        '''
+        settings = self.settings(tablename)
+        if (not settings):
+            return None
+        include = settings.get('include')
+        exclude = set(settings.get('exclude', []))
+        normalize = settings.get('normalize', {})
+        named = set(include or []) | exclude | set(normalize)
+        missing = named - set(columns)
+        if (missing and tablename in self.tables):
+            raise ValueError("table %s has no column %s" % (tablename, ', '.join(sorted(missing))))
+
+        expressions = []
+        for column in (include if include is not None else columns):
+            if (column in keyColumns or column in exclude or column not in columns):
+                continue
+            if (column in normalize):
+                expressions.append("%s AS %s" % (normalizeExpression(normalize[column], column),
+                                                 quoteIdentifier(column)))
+            else:
+                expressions.append(quoteIdentifier(column))
+        return expressions
+
+
+def normalizeExpression(normalization, column):
+    '''
+    :param normalization: a preset name, optionally with an argument ("round:2"), or a SQL expression using {column}.
+    :param column: the column name.
+    :return: the SQL expression of the normalized column.
+    '''
+    name, _, argument = normalization.partition(':')
+    if (name in ColumnProjection.PRESETS):
+        template = ColumnProjection.PRESETS[name]
+    elif ('{column}' in normalization):
+        template = normalization
+        argument = ''
+    else:
+        raise ValueError("unknown normalization %s of column %s" % (normalization, column))
+    if ('%' in template):
+        # the select list passes through the query string formatting, where % is special.
+        raise ValueError("normalization %s of column %s may not contain %%" % (normalization, column))
+    return template.replace('{digits}', argument or '2').replace('{column}', quoteIdentifier(column))
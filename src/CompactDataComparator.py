@@ -0,0 +1,288 @@
+import hashlib
+import sys
+from array import array
+from bisect import bisect_left
+from typing import List
+
+from DataComparator import DataComparator
+
+
+class CompactDataComparator(DataComparator):
+    """
+    Data comparator whose leftover maps keep a fixed size digest per primary key instead of the whole row.
+
+    A row waiting for its match is reduced to a 16 byte digest of its non key columns, stored in a DigestStore.
+    When the match arrives the digests are compared instead of the columns. Rows only become whole again when
+    they end up in an error report: they are re-fetched by primary key, in batches, through the row fetchers bound
+    with bindConnections() (PsycoConnection.fetchByKeys). Without row fetchers errors are reported as (primary key,)
+    rows. On wide tables with gappy or interleaved keys this keeps leftover memory an order of magnitude smaller.
+
+    The digests are computed from the repr of the values, so values that are equal but print differently (e.g.
+    Decimal('1.0') and Decimal('1.00'), or -0.0 and 0.0) have different digests. A digest mismatch is only a
+    candidate: once both rows are fetched they are compared with compareData() like the other engines do, and
+    equal rows are dropped. Without row fetchers the candidates cannot be checked and are reported as they are.
+    Re-fetching needs the connection to be free for a second query, which rules out COPY extraction.
+    """
+
+    def __init__(self, sinkFactory=None, rowDecoder=None, batchSize=1000):
+        '''
+        :param sinkFactory: see DataComparator.
+        :param rowDecoder: see DataComparator.
+        :param batchSize: number of errors whose rows are re-fetched together.
+        '''
+        super().__init__(sinkFactory, rowDecoder)
+        self.leftoverA = DigestStore()
+        self.leftoverB = DigestStore()
+        self.batchSize = batchSize
+        self.fetchRowsA = None
+        self.fetchRowsB = None
+        # errors whose rows still have to be fetched: (kind, primary key, row of A or None, row of B or None).
+        self.pendingErrors = []
+
+    def bindConnections(self, connectionA, connectionB):
+        '''
+        Sets the connections error rows are re-fetched from.
+        :param connectionA: PsycoConnection to the pre-migration database, with its table name set.
+        :param connectionB: PsycoConnection to the post-migration database, with its table name set.
+        :return:
+        '''
+        self.fetchRowsA = connectionA.fetchByKeys
+        self.fetchRowsB = connectionB.fetchByKeys
+
+    def processDataChunks(self, alist:List, blist:List):
+        '''
+        Matches the incoming rows against the digests waiting in the other database's leftover store.
+        :param alist: the rows that just arrived from database A.
+        :param blist: the rows that just arrived from database B.
+        :return:
+        '''
+        for row in alist:
+            primaryKey = row[0]
+            digest = self.leftoverB.pop(primaryKey, None)
+            if (digest is None):
+                self.leftoverA.put(primaryKey, rowDigest(row))
+            elif (digest != rowDigest(row)):
+                self.pendingErrors.append(('corruption', primaryKey, row, None))
+
+        for row in blist:
+            primaryKey = row[0]
+            digest = self.leftoverA.pop(primaryKey, None)
+            if (digest is None):
+                self.leftoverB.put(primaryKey, rowDigest(row))
+            elif (digest != rowDigest(row)):
+                self.pendingErrors.append(('corruption', primaryKey, None, row))
+
+        if (len(self.pendingErrors) >= self.batchSize):
+            self.resolveErrors()
+
+    def resolveErrors(self):
+        '''
+        Fetches the missing rows of the pending errors, one query per database, and records the errors. The rows of
+        a corruption are compared in full first, their digests may differ while their values are equal.
+        :return:
+        '''
+        if (not self.pendingErrors):
+            return
+        keysA = set(primaryKey for kind, primaryKey, a, b in self.pendingErrors if a is None and kind != 'creation')
+        keysB = set(primaryKey for kind, primaryKey, a, b in self.pendingErrors if b is None and kind != 'omission')
+        rowsA = self.fetchRows(self.fetchRowsA, keysA)
+        rowsB = self.fetchRows(self.fetchRowsB, keysB)
+
+        for kind, primaryKey, a, b in self.pendingErrors:
+            a = a if a is not None else rowsA.get(primaryKey, (primaryKey,))
+            b = b if b is not None else rowsB.get(primaryKey, (primaryKey,))
+            if (kind == 'omission'):
+                self.addCopyOmissionError(a)
+            elif (kind == 'creation'):
+                self.addCreationError(b)
+            elif (len(a) == 1 or len(b) == 1 or len(a) != len(b) or not self.compareData(a, b)):
+                # rows that could not be fetched are reported, the digest mismatch is all there is to go on.
+                self.addCorruptionError(a, b)
+        self.pendingErrors = []
+
+    def fetchRows(self, fetch, keys):
+        '''
+        Helper function that re-fetches rows by primary key.
+        :param fetch: a row fetcher such as PsycoConnection.fetchByKeys, or None.
+        :param keys: set of primary keys.
+        :return: dictionary of primary key to row, empty without a row fetcher.
+        '''
+        if (not fetch or not keys):
+            return {}
+        return dict((row[0], row) for row in fetch(sorted(keys)))
+
+    def flushA(self):
+        '''
+        Everything left in A's digest store had no counterpart in B, they are Copy Omission Errors.
+        :return:
+        '''
+        for primaryKey in self.leftoverA.keys():
+            self.pendingErrors.append(('omission', primaryKey, None, None))
+        self.leftoverA.clear()
+        self.largestAPrimaryKey = None
+
+    def flushB(self):
+        '''
+        Everything left in B's digest store had no counterpart in A, they are Creation Errors.
+        :return:
+        '''
+        for primaryKey in self.leftoverB.keys():
+            self.pendingErrors.append(('creation', primaryKey, None, None))
+        self.leftoverB.clear()
+        self.largestBPrimaryKey = None
+
+    def finish(self):
+        '''
+        Flushes the digest stores and records every error that is still waiting for its rows.
+        :return:
+        '''
+        super().finish()
+        self.resolveErrors()
+
+    def __getstate__(self):
+        # the row fetchers are bound to open connections, a comparator sent back from a worker process drops them.
+        state = self.__dict__.copy()
+        state.update(fetchRowsA=None, fetchRowsB=None)
+        return state
+
+    def checkpointState(self):
+        '''
+        Errors waiting for their rows are recorded first, so a checkpoint only holds digests.
+        :return: see DataComparator.checkpointState.
+        '''
+        self.resolveErrors()
+        return super().checkpointState()
+
+
+class DigestStore:
+    '''
+    Map of primary key to fixed size row digest that keeps no python object per entry. Chunks arrive in primary key
+    order, so integer keys are appended to an ascending array('q') and found by binary search, with their digests
+    packed into one bytearray at the same positions and a removed flag for each position in another. Removed
+    positions are dropped once they make up half of the arrays. Keys of other types (text, composite keys, integers
+    beyond 64 bits) and integer keys put out of order are kept in a dict of key to digest instead.
+    '''
+
+    DIGEST_SIZE = 16
+
+    def __init__(self):
+        self.clear()
+
+    def __contains__(self, primaryKey):
+        if (isCompactKey(primaryKey) and self.locate(primaryKey) >= 0):
+            return True
+        return primaryKey in self.otherDigests
+
+    def __len__(self):
+        return len(self.sortedKeys) - self.removed + len(self.otherDigests)
+
+    def put(self, primaryKey, digest):
+        '''
+        :param primaryKey: the primary key.
+        :param digest: its DIGEST_SIZE bytes digest.
+        :return:
+        '''
+        if (isCompactKey(primaryKey) and not (self.otherDigests and primaryKey in self.otherDigests)):
+            keys = self.sortedKeys
+            if (not keys or primaryKey > keys[-1]):
+                keys.append(primaryKey)
+                self.digests += digest
+                self.removedFlags.append(0)
+                return
+            position = bisect_left(keys, primaryKey)
+            if (keys[position] == primaryKey):
+                if (self.removedFlags[position]):
+                    self.removedFlags[position] = 0
+                    self.removed -= 1
+                self.digests[position * self.DIGEST_SIZE:(position + 1) * self.DIGEST_SIZE] = digest
+                return
+        self.otherDigests[primaryKey] = digest
+
+    def pop(self, primaryKey, *default):
+        '''
+        :param primaryKey: a primary key.
+        :param default: optional value returned when the key is not in the store, like dict.pop.
+        :return: its digest, which is removed from the store.
+        '''
+        position = self.locate(primaryKey) if isCompactKey(primaryKey) else -1
+        if (position < 0):
+            return self.otherDigests.pop(primaryKey, *default)
+        digest = bytes(self.digests[position * self.DIGEST_SIZE:(position + 1) * self.DIGEST_SIZE])
+        self.removedFlags[position] = 1
+        self.removed += 1
+        if (self.removed * 2 >= len(self.sortedKeys)):
+            self.compact()
+        return digest
+
+    def keys(self):
+        '''
+        :return: list of the keys in the store, the ascending integer keys first.
+        '''
+        keys = [primaryKey for primaryKey, removed in zip(self.sortedKeys, self.removedFlags) if not removed]
+        return keys + list(self.otherDigests)
+
+    def clear(self):
+        self.sortedKeys = array('q')
+        self.digests = bytearray()
+        self.removedFlags = bytearray()
+        self.removed = 0
+        self.otherDigests = {}
+
+    def nbytes(self):
+        '''
+        :return: bytes held by the store: its arrays, and the dict of other keys with those keys and their digests.
+        '''
+        size = sys.getsizeof(self.sortedKeys) + sys.getsizeof(self.digests) + sys.getsizeof(self.removedFlags)
+        return size + sys.getsizeof(self.otherDigests) + sum(sys.getsizeof(primaryKey) + sys.getsizeof(digest)
+                                                             for primaryKey, digest in self.otherDigests.items())
+
+    def locate(self, primaryKey):
+        '''
+        Helper function that binary searches the ascending integer keys.
+        :param primaryKey: an integer key.
+        :return: its position, -1 when it is not in the arrays.
+        '''
+        keys = self.sortedKeys
+        position = bisect_left(keys, primaryKey)
+        if (position < len(keys) and keys[position] == primaryKey and not self.removedFlags[position]):
+            return position
+        return -1
+
+    def compact(self):
+        '''
+        Helper function that drops the removed positions from the arrays, copying the runs of kept positions whole.
+        :return:
+        '''
+        flags = self.removedFlags
+        size = self.DIGEST_SIZE
+        keys = array('q')
+        digests = bytearray()
+        start = flags.find(0)
+        while (start >= 0):
+            end = flags.find(1, start)
+            if (end < 0):
+                end = len(flags)
+            keys += self.sortedKeys[start:end]
+            digests += self.digests[start * size:end * size]
+            start = flags.find(0, end)
+        self.sortedKeys = keys
+        self.digests = digests
+        self.removedFlags = bytearray(len(keys))
+        self.removed = 0
+
+
+def isCompactKey(primaryKey):
+    '''
+    :param primaryKey: a primary key.
+    :return: whether the key fits the arrays of DigestStore, a 64 bit integer.
+    '''
+    return type(primaryKey) is int and -0x8000000000000000 <= primaryKey <= 0x7FFFFFFFFFFFFFFF
+
+
+def rowDigest(row):
+    '''
+    Digest of the non key columns of a row.
+    :param row: a row tuple.
+    :return: DigestStore.DIGEST_SIZE bytes.
+    '''
+    return hashlib.blake2b(repr(tuple(row[1:])).encode('utf-8'), digest_size=DigestStore.DIGEST_SIZE).digest()
@@ -0,0 +1,162 @@
+import os
+import threading
+
+import psycopg2
+from psycopg2 import errors, pool
+
+from RetryPolicy import RetryPolicy
+
+# errors a broken connection raises. Healthy connections raise some of them too, connectionLost() tells which
+# mean the connection is gone and are worth a new connection and another try.
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+# SQLSTATEs of a server that ended the session: admin_shutdown, crash_shutdown, cannot_connect_now.
+SHUTDOWN_STATES = ('57P01', '57P02', '57P03')
+# the classes psycopg2 raises for the connection exception SQLSTATEs (class 08) and the shutdowns.
+CONNECTION_LOST_ERRORS = tuple(errors.lookup(code) for code in
+                               ('08000', '08003', '08006', '08001', '08004', '08007', '08P01') + SHUTDOWN_STATES)
+
+
+class ConnectionPool:
+    '''
+    Pool of connections to one postgres server, shared by every PsycoConnection of the process that reads from it.
+
+    Connections are opened on demand, with retries and backoff while the server cannot be reached, and kept open
+    once returned, so the tables compared one after the other reuse warm connections instead of paying for a new
+    connection and authentication each. A checkout blocks while all `size` connections are in use.
+
+    Returned connections are rolled back and get the default session characteristics again, a snapshot or a
+    read only transaction of one table never leaks into the next. Connections that broke are closed instead.
+    '''
+
+    def __init__(self, psqldb, size=16, retryPolicy=None):
+        '''
+        :param psqldb: the PSQLServer to connect to.
+        :param size: the most connections open to the server at the same time.
+        :param retryPolicy: RetryPolicy of the connection attempts, and of the PsycoConnections using the pool.
+        '''
+        self.psqldb = psqldb
+        self.size = size
+        self.retryPolicy = retryPolicy if retryPolicy else RetryPolicy()
+        self.pool = pool.ThreadedConnectionPool(0, size, host="localhost", database=psqldb.dbname,
+                                                user=psqldb.user, password=psqldb.password, port=psqldb.port)
+        # psycopg2 closes returned connections beyond minconn idle ones. The pool was created with 0 so that no
+        # connection is opened upfront, every connection returned is kept from now on.
+        self.pool.minconn = size
+        self.available = threading.BoundedSemaphore(size)
+
+    def getconn(self, retry=True):
+        '''
+        Checks out a connection, opening one if no idle connection is left.
+        :param retry: retry with backoff while the server cannot be reached. False for callers that retry
+                        themselves, such as PsycoConnection.reconnect(), so the attempts do not multiply.
+        :return: a psycopg2 connection.
+        :raises psycopg2.OperationalError: if the server could not be reached, after all retries.
+        '''
+        self.available.acquire()
+        try:
+            if (not retry):
+                return self.checkout()
+            return self.retryPolicy.call(self.checkout, CONNECTION_ERRORS, self.connectFailed, connectionLost)
+        except Exception:
+            self.available.release()
+            raise
+
+    def checkout(self):
+        '''
+        Helper function that takes a connection from the pool and makes sure it still answers.
+        :return: a psycopg2 connection.
+        '''
+        conn = self.pool.getconn()
+        try:
+            # an idle connection may have been dropped by the server or the network since it was returned.
+            with conn.cursor() as cursor:
+                cursor.execute("select 1")
+            conn.rollback()
+        except CONNECTION_ERRORS:
+            self.pool.putconn(conn, close=True)
+            raise
+        return conn
+
+    def connectFailed(self, attempt, error):
+        '''
+        Reports a failed connection attempt before it is retried.
+        :param attempt: number of the retry.
+        :param error: the error of the failed attempt.
+        :return:
+        '''
+        print("Connection to database %s on port %d failed (%s), retry %d of %d." %
+              (self.psqldb.dbname, self.psqldb.port, str(error).strip(), attempt, self.retryPolicy.retries))
+
+    def putconn(self, conn, broken=False):
+        '''
+        Returns a connection to the pool.
+        :param conn: a connection checked out with getconn().
+        :param broken: True when the connection failed and must be closed rather than reused.
+        :return:
+        '''
+        try:
+            if (not broken and not conn.closed):
+                conn.rollback()
+                conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+        except CONNECTION_ERRORS:
+            broken = True
+        try:
+            self.pool.putconn(conn, close=broken or bool(conn.closed))
+        finally:
+            self.available.release()
+
+    def closeall(self):
+        '''
+        Closes every connection of the pool.
+        :return:
+        '''
+        self.pool.closeall()
+
+
+def connectionLost(error):
+    '''
+    Tells the errors of a connection that broke from those of a healthy one. A statement timeout, a deadlock, a full
+    disk or a lock that is not available also raise OperationalError, but another connection would not help them.
+    :param error: an exception.
+    :return: True when the connection to the server is gone or could not be made.
+    '''
+    if (isinstance(error, psycopg2.InterfaceError) or isinstance(error, CONNECTION_LOST_ERRORS)):
+        return True
+    if (not isinstance(error, psycopg2.OperationalError)):
+        return False
+    if (error.pgcode):
+        return error.pgcode.startswith('08') or error.pgcode in SHUTDOWN_STATES
+    # psycopg2 raises a subclass for every SQLSTATE it knows, a bare OperationalError without one comes from the
+    # client, which could not reach the server or lost it.
+    return type(error) is psycopg2.OperationalError
+
+
+_pools = {}
+_poolsLock = threading.Lock()
+
+
+def connectionPool(psqldb, size=16, retryPolicy=None):
+    '''
+    Returns the pool of the current process for a server, creating it with the given settings on first use.
+    :param psqldb: the PSQLServer.
+    :param size: the most connections open to the server at the same time, for a new pool.
+    :param retryPolicy: RetryPolicy of a new pool.
+    :return: the ConnectionPool.
+    '''
+    # the process id is part of the key, so a forked worker opens connections of its own. The inherited pools are
+    # left alone, closing them would end the parent's sessions.
+    key = (os.getpid(), psqldb.dbname, psqldb.port, psqldb.user)
+    with _poolsLock:
+        if (key not in _pools):
+            _pools[key] = ConnectionPool(psqldb, size, retryPolicy)
+        return _pools[key]
+
+
+def closePools():
+    '''
+    Closes the connections of every pool of the current process.
+    :return:
+    '''
+    with _poolsLock:
+        for key in [key for key in _pools if key[0] == os.getpid()]:
+            _pools.pop(key).closeall()
@@ -0,0 +1,183 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+import psycopg2
+
+from PSQLServer import PSQLServer
+
+
+class ContainerManager:
+    '''
+    Starts the postgres docker containers of a migration report through the docker SDK.
+
+    Every image of the initialization file is launched at the same time, and each launch then waits until its server
+    accepts connections, probing it with a short connection attempt and an exponential backoff. Containers launched
+    here carry a label naming their image, user and database. A running container with the label of a server and
+    its postgres port published is reused instead of launching a new one, containers started by anything else are
+    never adopted. The host ports of the launched containers are picked once the ports of the reused ones are known,
+    so the two never collide. Containers are bound to their PSQLServer by container id.
+    '''
+
+    # postgres port inside the containers.
+    CONTAINER_PORT = '5432/tcp'
+    # label of the containers launched by this tool, its value identifies the server, see serverLabel().
+    LABEL = 'migration-report.server'
+
+    def __init__(self, client=None, timeout=60.0):
+        '''
+        :param client: docker client, defaults to the one configured by the environment.
+        :param timeout: seconds a container may take to accept connections.
+        '''
+        self.client = client if client else docker.from_env()
+        self.timeout = timeout
+        # containers started by this manager, only those are stopped by stopAll().
+        self.started = []
+        self.claimed = set()
+        self.lock = threading.Lock()
+
+    def readIniFile(self, inifile, port=5432):
+        '''
+        Reads the initialization file, one `<user>,<database>,<password>,<docker_image>` line per server.
+        :param inifile: name of the initialization file.
+        :param port: host port of the first server, the following servers get monotonically increasing ports.
+        :return: list of PSQLServers in file order, the pre-migration database first.
+        '''
+        servers = []
+        for line in open(inifile):
+            if (not line.strip()):
+                continue
+            singlePSQLiniLine = line.strip().split(',')
+            user = singlePSQLiniLine[0]
+            dbname = singlePSQLiniLine[1]
+            password = singlePSQLiniLine[2]
+            servers.append(PSQLServer(user, dbname, password, port, singlePSQLiniLine[3]))
+            port += 1
+        return servers
+
+    def start(self, servers):
+        '''
+        Launches, or reuses, a container for every server at the same time and waits until all of them are ready.
+        :param servers: list of PSQLServers with their image set, on increasing ports from the first one. Their port
+                        and containerId are filled in.
+        :return: list of the containers, in the order of the servers.
+        '''
+        reused = [self.findRunning(server) for server in servers]
+        self.assignPorts(servers, reused)
+        with ThreadPoolExecutor(max_workers=max(1, len(servers))) as pool:
+            return list(pool.map(self.startServer, servers, reused))
+
+    def assignPorts(self, servers, reused):
+        '''
+        Helper function that gives the servers without a container the lowest free host ports from the port of the
+        first server on, skipping the ports of the reused containers.
+        :param servers: list of PSQLServers.
+        :param reused: the reused container of each server, or None for the servers that are launched.
+        :return:
+        '''
+        if (not servers):
+            return
+        taken = set(server.port for server, container in zip(servers, reused) if container)
+        port = servers[0].port
+        for server, container in zip(servers, reused):
+            if (container):
+                continue
+            while (port in taken):
+                port += 1
+            server.port = port
+            port += 1
+
+    def startServer(self, server, container=None):
+        '''
+        Launches the container of one server, unless one is reused, and waits until it accepts connections.
+        :param server: a PSQLServer with its image and port set.
+        :param container: the running container found for the server by findRunning(), or None to launch one.
+        :return: the container.
+        '''
+        if (container):
+            print("Reusing container %s of %s on port %d" % (container.short_id, server.image, server.port))
+        else:
+            # run() pulls the image first if the daemon does not have it.
+            container = self.client.containers.run(server.image, detach=True,
+                                                   ports={self.CONTAINER_PORT: server.port},
+                                                   labels={self.LABEL: serverLabel(server)})
+            with self.lock:
+                self.started.append(container)
+                self.claimed.add(container.id)
+            print("Started container %s of %s on port %d" % (container.short_id, server.image, server.port))
+        server.containerId = container.id
+        self.waitUntilReady(server, container)
+        return container
+
+    def findRunning(self, server):
+        '''
+        Helper function that looks for a running, unclaimed container launched by this tool for the same server that
+        publishes the postgres port. The server adopts the host port of a container it finds.
+        :param server: a PSQLServer with its image set.
+        :return: the container, or None.
+        '''
+        filters = {'label': '%s=%s' % (self.LABEL, serverLabel(server)), 'status': 'running'}
+        for container in self.client.containers.list(filters=filters):
+            bindings = (container.attrs.get('NetworkSettings', {}).get('Ports') or {}).get(self.CONTAINER_PORT)
+            if (not bindings):
+                continue
+            with self.lock:
+                if (container.id in self.claimed):
+                    continue
+                self.claimed.add(container.id)
+            server.port = int(bindings[0]['HostPort'])
+            return container
+        return None
+
+    def waitUntilReady(self, server, container):
+        '''
+        Polls the server until it accepts connections, backing off between attempts.
+        :param server: the PSQLServer running in the container.
+        :param container: the container of the server.
+        :return:
+        '''
+        deadline = time.monotonic() + self.timeout
+        delay = 0.1
+        while (True):
+            if (self.isReady(server)):
+                return
+            container.reload()
+            if (container.status in ('exited', 'dead')):
+                raise RuntimeError("Container %s of %s stopped while starting:\n%s" %
+                                   (container.short_id, server.image, container.logs(tail=20).decode(errors='replace')))
+            if (time.monotonic() + delay > deadline):
+                raise TimeoutError("%s did not accept connections on port %d within %d seconds" %
+                                   (server.image, server.port, self.timeout))
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    def isReady(self, server):
+        '''
+        Helper function that checks whether the server accepts connections, like pg_isready.
+        :param server: a PSQLServer.
+        :return: True if a connection could be made.
+        '''
+        try:
+            psycopg2.connect(host="localhost", database=server.dbname, user=server.user, password=server.password,
+                             port=server.port, connect_timeout=2).close()
+            return True
+        except psycopg2.OperationalError:
+            return False
+
+    def stopAll(self):
+        '''
+        Stops the containers started by this manager. Reused containers were running before and are left alone.
+        :return:
+        '''
+        for container in self.started:
+            container.kill()
+        self.started = []
+
+
+def serverLabel(server):
+    '''
+    :param server: a PSQLServer.
+    :return: value of ContainerManager.LABEL on the containers launched for the server.
+    '''
+    return '%s/%s/%s' % (server.image, server.user, server.dbname)
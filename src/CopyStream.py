@@ -0,0 +1,166 @@
+import queue
+import re
+import threading
+
+
+class CopyStream:
+    '''
+    Streams the result of a query out of postgres with `COPY (...) TO STDOUT` instead of a cursor.
+
+    COPY hands over large raw buffers without building a Python object per cell, which skips psycopg2's type
+    casting entirely. psycopg2's copy_expert() pushes the buffers into a file object, so it runs on a background
+    thread that feeds a bounded queue; when the queue is full the copy stalls and the server is held back, which
+    keeps memory bounded.
+
+    Each line of the text format is one row. Rows are returned as (primary key, rest of the line) pairs: only the
+    first column is split off and decoded, parsed as an integer when the key column is of an integer type, the
+    remaining columns stay raw bytes and are compared in one go.
+    decodeCopyRow() turns such a row back into a row of python values when it is needed for a report.
+    '''
+
+    # marks the end of the copy in the queue.
+    DONE = object()
+
+    def __init__(self, cursor, psqlQuery, bufferSize=1 << 20, depth=8, integerKey=False):
+        '''
+        :param cursor: a psycopg2 cursor, used by the background thread only.
+        :param psqlQuery: the select statement to copy out, with any parameters already bound.
+        :param bufferSize: size in bytes of the buffers read from the server.
+        :param depth: number of buffers that may be read ahead of the consumer.
+        :param integerKey: True when the first column is of an integer type, its keys are then parsed into ints.
+        '''
+        self.cursor = cursor
+        self.integerKey = integerKey
+        self.buffers = queue.Queue(maxsize=max(1, depth))
+        self.stopped = threading.Event()
+        self.finished = False
+        self.error = None
+        # bytes of a row whose end has not been received yet.
+        self.partial = b''
+        self.rows = []
+        self.thread = threading.Thread(target=self.run, args=("COPY (%s) TO STDOUT" % psqlQuery, bufferSize),
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self, copyQuery, bufferSize):
+        '''
+        Body of the copy thread.
+        :param copyQuery: the full COPY statement.
+        :param bufferSize: size in bytes of the buffers read from the server.
+        :return:
+        '''
+        try:
+            self.cursor.copy_expert(copyQuery, self, size=bufferSize)
+        except Exception as e:
+            if (not self.stopped.is_set()):
+                self.error = e
+        self.put(self.DONE)
+
+    def write(self, data):
+        '''
+        File interface used by copy_expert(), called on the copy thread with each buffer.
+        :param data: bytes received from the server.
+        :return:
+        '''
+        if (self.stopped.is_set()):
+            # aborts the copy, copy_expert() raises the error back into run().
+            raise IOError("copy stream closed")
+        self.put(data)
+
+    def put(self, item):
+        '''
+        Helper function that blocks until there is room in the queue, or until the stream is closed.
+        :param item: a buffer or the DONE marker.
+        :return:
+        '''
+        while (not self.stopped.is_set()):
+            try:
+                self.buffers.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def fetchNext(self, n):
+        '''
+        Returns the next rows of the copy.
+        :param n: the number of rows wanted.
+        :return: a list of at most n (primary key, raw bytes) rows, empty once the copy is exhausted.
+        '''
+        while (len(self.rows) < n and not self.finished):
+            data = self.buffers.get()
+            if (data is self.DONE):
+                self.finished = True
+                if (self.error):
+                    raise self.error
+                break
+            lines = (self.partial + data).split(b'\n')
+            self.partial = lines.pop()
+            self.rows.extend(splitCopyLine(line, self.integerKey) for line in lines)
+
+        chunk = self.rows[:n]
+        del self.rows[:n]
+        return chunk
+
+    def close(self):
+        '''
+        Stops the copy, if it is still running, and waits for the thread to exit.
+        :return:
+        '''
+        self.stopped.set()
+        if (self.thread.is_alive()):
+            # the server would otherwise keep sending the rest of the table.
+            self.cursor.connection.cancel()
+        self.thread.join()
+
+
+def splitCopyLine(line, integerKey=False):
+    '''
+    Splits a line of COPY text output into its primary key and the raw bytes of the remaining columns.
+    Integer keys are parsed so they order the same way as in the database, other keys are kept as text, which
+    keeps '007' and '7' apart.
+    :param line: one row of COPY text output, without the line terminator.
+    :param integerKey: True when the key column is of an integer type.
+    :return: a (primary key, rest) tuple, or just (primary key,) for a single column table.
+    '''
+    key, tab, rest = line.partition(b'\t')
+    if (integerKey):
+        key = int(key)
+    else:
+        key = unescapeCopyField(key)
+    return (key, rest) if tab else (key,)
+
+
+# backslash escapes of the COPY text format.
+COPY_ESCAPE = re.compile(rb'\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)')
+COPY_ESCAPES = {b'b': b'\b', b'f': b'\f', b'n': b'\n', b'r': b'\r', b't': b'\t', b'v': b'\v'}
+
+
+def unescapeCopyField(field):
+    '''
+    Decodes a single field of COPY text output.
+    :param field: the raw bytes of the field.
+    :return: the field as a string, or None for a null.
+    '''
+    if (field == b'\\N'):
+        return None
+
+    def replace(match):
+        escape = match.group(1)
+        if (escape[:1] == b'x'):
+            return bytes([int(escape[1:], 16)])
+        if (escape[:1].isdigit()):
+            return bytes([int(escape, 8) & 0xff])
+        return COPY_ESCAPES.get(escape, escape)
+    return COPY_ESCAPE.sub(replace, field).decode('utf-8')
+
+
+def decodeCopyRow(row):
+    '''
+    Turns a (primary key, rest) row produced by CopyStream into a full row for the reports. Values other than the
+    primary key are returned as their postgres text representation.
+    :param row: a row produced by CopyStream.
+    :return: tuple of the row's values.
+    '''
+    if (len(row) != 2 or not isinstance(row[1], bytes)):
+        return row
+    return (row[0],) + tuple(unescapeCopyField(field) for field in row[1].split(b'\t'))
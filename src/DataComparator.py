@@ -1,8 +1,12 @@
 import queue
 from typing import List
-import csv
+import json
 import os
 
+from ChunkSizer import estimateChunkBytes
+from ErrorSink import ListErrorSink
+from Metrics import Metrics
+
 class DataComparator:
     """
     Top level class for comparing data from two different relational databases and producing report files
@@ -17,15 +21,35 @@ class DataComparator:
 
     Note: This data comparator will not work if primary keys cannot be trusted (i.e. can be corrupted
     or duplicated).
+
+    Every row carries its primary key in row[0], a tuple for composite keys (see PrimaryKey).
+
+    Errors are handed to error sinks (see ErrorSink). By default they are kept in memory and written out by
+    produceReports(), a CsvErrorSinkFactory streams them into the report files as they are found instead.
+
+    Every comparator records the time spent in each stage, the rows and bytes it read and the size of its leftover
+    maps in a Metrics object, written to metrics.json next to the report.
     """
 
-    def __init__(self):
+    # attributes saved by a checkpoint, together with the error sink offsets.
+    CHECKPOINTED = ('totalTableSizeA', 'totalTableSizeB', 'numCorruptionErrors', 'numCreationErrors',
+                    'numCopyOmissionErrors', 'leftoverA', 'leftoverB', 'largestAPrimaryKey', 'largestBPrimaryKey')
+
+    def __init__(self, sinkFactory=None, rowDecoder=None):
+        '''
+        :param sinkFactory: callable taking a report file name and returning the error sink for it,
+                            defaults to in-memory ListErrorSinks.
+        :param rowDecoder: optional callable that turns a row into its report form, applied only to rows that
+                            end up in an error report (e.g. CopyStream.decodeCopyRow for raw COPY rows).
+        '''
         self.totalTableSizeA = 0
         self.totalTableSizeB = 0
 
-        self.corruptionErrors = []
-        self.creationErrors = []
-        self.copyOmissionErrors = []
+        self.sinkFactory = sinkFactory if sinkFactory else ListErrorSink
+        self.rowDecoder = rowDecoder
+        self.corruptionErrors = self.sinkFactory("corruption-errors.csv")
+        self.creationErrors = self.sinkFactory("creation-errors.csv")
+        self.copyOmissionErrors = self.sinkFactory("omission-errors.csv")
 
         self.numCorruptionErrors = 0
         self.numCreationErrors = 0
@@ -40,6 +64,23 @@ class DataComparator:
         self.incomingA = []
         self.incomingB = []
 
+        # ChunkSizer that picked the chunk sizes of this comparison, if they were tuned while it ran.
+        self.chunkSizer = None
+        # TableSampler whose estimates are reported, when this comparison ran on a sample or was escalated from one.
+        self.sampler = None
+
+        self.metrics = Metrics()
+
+    def bindConnections(self, connectionA, connectionB):
+        '''
+        Hook called with the connections of the tables being compared, for comparators that need to read rows
+        again. The rows handed to this comparator are all it needs, so it does nothing.
+        :param connectionA: PsycoConnection to the pre-migration database.
+        :param connectionB: PsycoConnection to the post-migration database.
+        :return:
+        '''
+        pass
+
     def compareData(self, a, b):
         """
         Compares one row of data between 2 databases
@@ -70,7 +111,9 @@ class DataComparator:
         :param data: a single row from a database that was not correctly copied.
         :return:
         '''
-        self.copyOmissionErrors.append(data)
+        if (self.rowDecoder):
+            data = self.rowDecoder(data)
+        self.copyOmissionErrors.add(data)
         self.numCopyOmissionErrors += 1
 
     def addCreationError(self, data):
@@ -79,7 +122,9 @@ class DataComparator:
         :param data: a single row from a database that was created during migration, but is false.
         :return:
         '''
-        self.creationErrors.append(data)
+        if (self.rowDecoder):
+            data = self.rowDecoder(data)
+        self.creationErrors.add(data)
         self.numCreationErrors += 1
 
     def addCorruptionError(self, a, b): # gets its own interface because its multiple data sources.
@@ -89,7 +134,10 @@ class DataComparator:
         :param b: The row containing the corrupted data from the post-migration database.
         :return:
         '''
-        self.corruptionErrors.append([a, b])
+        if (self.rowDecoder):
+            a = self.rowDecoder(a)
+            b = self.rowDecoder(b)
+        self.corruptionErrors.add(a, b)
         self.numCorruptionErrors += 1
 
     def flushA(self):
@@ -98,8 +146,7 @@ class DataComparator:
         into the CopyOmissionError pipeline. This is called when it is impossible for future data from
         B to match any of the information in LeftOverA.
 
-        We do this to allow for future memory optimization
-        if there were large amounts of errors and we needed to write them to a file.
+        With a streaming error sink the flushed rows go straight to the report file.
         :return:
         '''
         for key in self.leftoverA:  # things leftover in A must be CopyOmissionErrors
@@ -113,8 +160,7 @@ class DataComparator:
         into the CreationError pipeline. This is called when it is impossible for future data from
         A to match any of the information in LeftOverB.
 
-        We do this to allow for future memory optimization
-        if there were large amounts of errors and we needed to write them to a file.
+        With a streaming error sink the flushed rows go straight to the report file.
         :return:
         '''
         for key in self.leftoverB:  # things leftover in A must be Creation Errors
@@ -140,123 +186,263 @@ class DataComparator:
         self.totalTableSizeA += len(alist)
         self.totalTableSizeB += len(blist)
 
-        if (self.largestAPrimaryKey):
+        with self.metrics.timer('prepare'):
+            if (self.largestAPrimaryKey):
+                if (len(blist) > 0):
+                    if (blist[0][0] > self.largestAPrimaryKey):
+                        with self.metrics.timer('flush'):
+                            self.flushA()
+
+            # We likewise do the same for B.
+            if (self.largestBPrimaryKey):
+                if (len(alist) > 0):
+                    if (alist[0][0] > self.largestBPrimaryKey):
+                        with self.metrics.timer('flush'):
+                            self.flushB()
+
+            # setup the new largest primary keys that will exist in each of the hashmaps.
+            if (len(alist) > 0):
+                self.largestAPrimaryKey = alist[len(alist) - 1][0]
             if (len(blist) > 0):
-                if (blist[0][0] > self.largestAPrimaryKey):
-                    self.flushA()
+                self.largestBPrimaryKey = blist[len(blist) - 1][0]
 
-        # We likewise do the same for B.
-        if (self.largestBPrimaryKey):
-            if (len(alist) > 0):
-                if (alist[0][0] > self.largestBPrimaryKey):
-                    self.flushB()
+            with self.metrics.timer('process'):
+                self.processDataChunks(alist, blist)
+        self.recordLeftovers()
+
+    def recordLeftovers(self):
+        '''
+        Updates the gauges of the number of rows waiting for a match in each database.
+        :return:
+        '''
+        sizeA, sizeB = self.leftoverSizes()
+        self.metrics.gauge('leftoverA', sizeA)
+        self.metrics.gauge('leftoverB', sizeB)
+
+    def leftoverSizes(self):
+        '''
+        :return: number of rows of A and of B still waiting for a match.
+        '''
+        return len(self.leftoverA), len(self.leftoverB)
 
-        # setup the new largest primary keys that will exist in each of the hashmaps.
-        if (len(alist) > 0):
-            self.largestAPrimaryKey = alist[len(alist) - 1][0]
-        if (len(blist) > 0):
-            self.largestBPrimaryKey = blist[len(blist) - 1][0]
+    def processDataChunks(self, alist:List, blist:List):
+        '''
+        Identifies any corruption errors within the newly arrived data chunks via a hashmap lookup
+        then individual column comparison.
 
-        # we now add the data into their respective hashmaps.
+        Only the incoming rows are probed against the other database's leftover hashmap, so the cost of a
+        chunk is proportional to the chunk size and not to the number of rows still waiting for a match.
+        :param alist: the rows that just arrived from database A.
+        :param blist: the rows that just arrived from database B.
+        :return:
+        '''
         for row in alist:
             # we use the primary key as the map key
-            self.leftoverA[row[0]] = row
+            primaryKey = row[0]
+            if (primaryKey in self.leftoverB):
+                # if there is a match, check data, then pop it from the leftover hashmap.
+                match = self.leftoverB.pop(primaryKey)
+                if (not self.compareData(row, match)):
+                    # the primary keys match but the data does not, this is a corruption error.
+                    self.addCorruptionError(row, match)
+            else:
+                # leave it in the hashmap to see if it will match a future primary key.
+                self.leftoverA[primaryKey] = row
+
+        # rows from A in this same chunk are already in leftoverA, so probing in this direction
+        # also catches matches within the current chunk.
         for row in blist:
-            self.leftoverB[row[0]] = row
+            primaryKey = row[0]
+            if (primaryKey in self.leftoverA):
+                match = self.leftoverA.pop(primaryKey)
+                if (not self.compareData(match, row)):
+                    self.addCorruptionError(match, row)
+            else:
+                self.leftoverB[primaryKey] = row
+
+    def compareStreams(self, fetchA, fetchB, checkpoint=None):
+        '''
+        Drives the comparison of two whole tables. Chunks are pulled from each database until both
+        are exhausted, then any remaining mismatches are flushed.
+        :param fetchA: callable returning the next chunk of rows from database A, or an empty list when done.
+        :param fetchB: callable returning the next chunk of rows from database B, or an empty list when done.
+        :param checkpoint: optional Checkpoint that is told about every processed chunk pair and periodically
+                            saves the state of the comparison.
+        :return:
+        '''
+        response = True
+        while (response):
+            response = False
+
+            a = self.fetchChunk(fetchA, 'A')
+            b = self.fetchChunk(fetchB, 'B')
+            self.prepareDataChunks(a, b)
+            if (checkpoint):
+                checkpoint.chunkDone(self, a, b)
 
-        self.processDataChunks(self.leftoverA, self.leftoverB)
+            if (len(a) > 0 or len(b) > 0):
+                response = True
+        self.finish()
 
-    def processDataChunks(self, aData:dict, bData:dict):
+    def fetchChunk(self, fetch, side):
         '''
-        Identifies any corruption errors within the corresponding data chunks via a hashmap lookup
-        then individual column comparison.
-        :param aData: a dictionary of row data from database A.
-        :param bData: a dictionary of row data from database B.
-        :return:
+        Helper function that fetches the next chunk of a database and records how long the comparison waited
+        for it and how many rows and bytes it holds.
+        :param fetch: callable returning the next chunk of rows, or an empty list when done.
+        :param side: 'A' or 'B', the database the rows come from.
+        :return: the chunk.
         '''
-        # we expect aData and bData to generally be the same size, but at the end of the function.
-        # we expect them to differ, therefore, we check each time.
-        poplist = []
-        for primaryKey in aData:
-            if (primaryKey in bData):
-                # if there is a match, check data, then pop
-                if (not self.compareData(aData[primaryKey], bData[primaryKey])):
-                    # the primary keys do not match, we can increment corruption errors and add to the report.
-                    self.addCorruptionError(aData[primaryKey], bData[primaryKey])
-                    # if the primary key is not in bData, we can just leave it in the hashmap to see if it will match a
-                    # future primary key.
-                # whether or not the internal data matches, we can pop it from our leftover hashmaps.
-                poplist.append(primaryKey)
-
-        # remove the matches
-        for primaryKey in poplist:
-            aData.pop(primaryKey)
-            bData.pop(primaryKey)
+        with self.metrics.timer('fetch'):
+            chunk = fetch()
+        self.recordChunk(chunk, side)
+        return chunk
 
+    def recordChunk(self, chunk, side):
+        '''
+        Adds a fetched chunk to the row and byte counters of its database.
+        :param chunk: list of rows.
+        :param side: 'A' or 'B', the database the rows come from.
+        :return:
+        '''
+        self.metrics.count('rows' + side, len(chunk))
+        self.metrics.count('bytes' + side, estimateChunkBytes(chunk))
 
     def finish(self):
         '''
         Flushes any remaining mismatches in the LeftOver hashmaps into their respective error counters.
         :return:
         '''
-        self.flushA()
-        self.flushB()
+        with self.metrics.timer('flush'):
+            self.flushA()
+            self.flushB()
+        self.metrics.stop()
 
         # print("Corruption Error: %d" % self.numCorruptionErrors)
         # print("Creation Error: %d" % self.numCreationErrors)
         # print("Copy Omission Error: %d" % self.numCopyOmissionErrors)
 
-    def produceReports(self):
+    def errorSinks(self):
         '''
-        Generate reports according to the gathered error data within the data comparator object.
-        :return:
+        :return: the corruption, creation and copy omission error sinks.
         '''
+        return [self.corruptionErrors, self.creationErrors, self.copyOmissionErrors]
 
-        if (not 'reports' in os.listdir('./')):
-            os.makedirs('../reports/')
-        reportDir = "../reports/"
-        with open(reportDir + "migration-report.txt", 'w') as f:
-            f.write('*' * 80 + '\n')
-            f.write("Migration Report\n")
-            f.write('*' * 80 + '\n\n')
-
-            f.write("Total Rows Pre-migration:\t%d\n" % self.totalTableSizeA)
-            f.write("Total Rows Post-migration:\t%d\n\n" % self.totalTableSizeB)
-
-            f.write("Total Migration Errors:" + '\t'*7 + "%d" % (self.numCorruptionErrors +
-                                                                 self.numCreationErrors +
-                                                                 self.numCopyOmissionErrors))
-            f.write("\t%2.2f" % ((self.numCorruptionErrors + self.numCreationErrors + self.numCopyOmissionErrors) *
-                                 100.0 / self.totalTableSizeA ) + '%\n')
-
-            f.write("\tTotal Rows Corrupted During Migration: \t\t%d\n" % self.numCorruptionErrors)
-            f.write("\tTotal Omitted Rows From Original: \t\t\t%d\n" % self.numCopyOmissionErrors)
-            f.write("\tTotal False Rows Created in Migrated: \t\t%d\n" % self.numCreationErrors)
-
-        with open(reportDir + "corruption-errors.csv", 'w') as f:
-            csvwriter = csv.writer(f, delimiter=',')
-            for corruptedSet in self.corruptionErrors:
-                csvwriter.writerow(corruptedSet[0])
-                csvwriter.writerow(corruptedSet[1])
-
-        with open(reportDir + "creation-errors.csv", 'w') as f:
-            csvwriter = csv.writer(f, delimiter=',')
-            for creationError in self.creationErrors:
-                csvwriter.writerow(creationError)
-
-        with open(reportDir + "omission-errors.csv", 'w') as f:
-            csvwriter = csv.writer(f, delimiter=',')
-            for omissionError in self.copyOmissionErrors:
-                csvwriter.writerow(omissionError)
-
-
-
-
-
+    def checkpointState(self):
+        '''
+        Captures everything needed to carry on with the comparison later: the counters, the rows still waiting for
+        a match and the position of each error sink. Must be called between two chunk pairs.
+        :return: a picklable dictionary.
+        '''
+        state = dict((name, getattr(self, name)) for name in self.CHECKPOINTED)
+        state['sinks'] = [sink.checkpoint() for sink in self.errorSinks()]
+        return state
 
+    def restoreState(self, state):
+        '''
+        Puts the comparison back into the state captured by checkpointState().
+        :param state: a dictionary returned by checkpointState().
+        :return:
+        '''
+        for name in self.CHECKPOINTED:
+            setattr(self, name, state[name])
+        for sink, sinkState in zip(self.errorSinks(), state['sinks']):
+            sink.restore(sinkState)
 
+    def merge(self, other):
+        '''
+        Adds the row totals and errors of another finished data comparator to this one. Used to combine the
+        results of comparisons that ran separately over disjoint primary key ranges of the same table.
+        :param other: a DataComparator whose finish() has been called.
+        :return:
+        '''
+        self.totalTableSizeA += other.totalTableSizeA
+        self.totalTableSizeB += other.totalTableSizeB
 
+        self.corruptionErrors.merge(other.corruptionErrors)
+        self.creationErrors.merge(other.creationErrors)
+        self.copyOmissionErrors.merge(other.copyOmissionErrors)
 
+        self.numCorruptionErrors += other.numCorruptionErrors
+        self.numCreationErrors += other.numCreationErrors
+        self.numCopyOmissionErrors += other.numCopyOmissionErrors
 
+        self.metrics.merge(other.metrics)
 
+        if (other.chunkSizer):
+            if (self.chunkSizer):
+                self.chunkSizer.merge(other.chunkSizer)
+            else:
+                self.chunkSizer = other.chunkSizer
 
+    def produceReports(self, reportDir="../reports/"):
+        '''
+        Generate reports according to the gathered error data within the data comparator object: the text
+        summary migration-report.txt, the same figures as summary.json, the error files and metrics.json.
+        :param reportDir: directory the reports are written into, created if it does not exist.
+        :return:
+        '''
+        os.makedirs(reportDir, exist_ok=True)
+        with self.metrics.timer('report'):
+            with open(os.path.join(reportDir, "migration-report.txt"), 'w') as f:
+                f.write('*' * 80 + '\n')
+                f.write("Migration Report\n")
+                f.write('*' * 80 + '\n\n')
+                self.writeSummary(f)
+            with open(os.path.join(reportDir, "summary.json"), 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+
+            # in-memory sinks write their files now, streaming sinks already did and are only closed.
+            self.corruptionErrors.finish(reportDir)
+            self.creationErrors.finish(reportDir)
+            self.copyOmissionErrors.finish(reportDir)
+        self.metrics.write(os.path.join(reportDir, "metrics.json"))
+
+    def summary(self):
+        '''
+        :return: dictionary of the row totals, error counts and error rate of this comparison, and the estimates of
+                    its sample if it has one, as written to summary.json.
+        '''
+        totalErrors = self.numCorruptionErrors + self.numCreationErrors + self.numCopyOmissionErrors
+        summary = {
+            'rowsPreMigration': self.totalTableSizeA,
+            'rowsPostMigration': self.totalTableSizeB,
+            'errors': totalErrors,
+            # an empty original table has no meaningful error rate.
+            'errorRate': totalErrors / self.totalTableSizeA if self.totalTableSizeA > 0 else None,
+            'corruptionErrors': self.numCorruptionErrors,
+            'copyOmissionErrors': self.numCopyOmissionErrors,
+            'creationErrors': self.numCreationErrors,
+        }
+        if (self.sampler):
+            summary['sample'] = {'method': self.sampler.method, 'confidence': self.sampler.confidence}
+            for kind, (errors, sampled, rate, lower, upper, estimate) in self.sampler.estimates().items():
+                summary['sample'][kind] = {'errors': errors, 'sampled': sampled, 'rate': rate, 'lower': lower,
+                                           'upper': upper, 'estimatedErrors': estimate}
+        return summary
+
+    def writeSummary(self, f):
+        '''
+        Writes the row totals and error counts of this comparison to an open text report.
+        :param f: a writable text file.
+        :return:
+        '''
+        totalErrors = self.numCorruptionErrors + self.numCreationErrors + self.numCopyOmissionErrors
+
+        f.write("Total Rows Pre-migration:\t%d\n" % self.totalTableSizeA)
+        f.write("Total Rows Post-migration:\t%d\n\n" % self.totalTableSizeB)
+
+        f.write("Total Migration Errors:" + '\t'*7 + "%d" % totalErrors)
+        if (self.totalTableSizeA > 0):
+            f.write("\t%2.2f" % (totalErrors * 100.0 / self.totalTableSizeA) + '%\n')
+        else:
+            # an empty original table has no meaningful error rate.
+            f.write("\tn/a\n")
+
+        f.write("\tTotal Rows Corrupted During Migration: \t\t%d\n" % self.numCorruptionErrors)
+        f.write("\tTotal Omitted Rows From Original: \t\t\t%d\n" % self.numCopyOmissionErrors)
+        f.write("\tTotal False Rows Created in Migrated: \t\t%d\n" % self.numCreationErrors)
+
+        if (self.sampler):
+            self.sampler.writeSummary(f)
+        if (self.chunkSizer):
+            self.chunkSizer.writeSummary(f)
@@ -0,0 +1,148 @@
+from MergeComparator import MergeComparator
+from PrimaryKey import DEFAULT_PRIMARY_KEY, quoteIdentifier
+
+
+class DigestPrePass:
+    '''
+    Two phase comparison that streams (primary key, row digest) pairs first and full rows only where they differ.
+
+    1. Both tables are streamed as primary key plus the 16 byte md5 of the row's text, and the pairs go through a
+       MergeComparator, so the usual classification finds every key that is only in A (Copy Omission), only in B
+       (Creation) or in both with different digests (Corruption), in primary key order.
+    2. The full rows of those keys are fetched from both databases in batches and handed to the real data
+       comparator, which classifies them again and writes the complete reports.
+
+    Rows whose digests match never leave either server in full, so clean data costs about 24 bytes per row.
+
+    Note: equal rows must produce the same text on both servers (same column order and types). With a column
+    projection the digest covers the projected columns only, in the configured form.
+    '''
+
+    def __init__(self, connectionA, connectionB, batchSize=1000):
+        '''
+        :param connectionA: connection to the pre-migration database, with its table name and primary key set.
+        :param connectionB: connection to the post-migration database, with its table name and primary key set.
+        :param batchSize: number of differing keys whose rows are fetched together.
+        '''
+        self.connectionA = connectionA
+        self.connectionB = connectionB
+        self.batchSize = batchSize
+        self.keysA = []
+        self.keysB = []
+        self.dataComparator = None
+
+        self.fetchedA = 0
+        self.fetchedB = 0
+        self.rowsDigested = 0
+
+    def digestKey(self):
+        '''
+        :return: (PrimaryKey that selects the digest after the key, query reading the digests in key order).
+        '''
+        primaryKey = self.connectionA.primaryKey if self.connectionA.primaryKey else DEFAULT_PRIMARY_KEY
+        keys = ", ".join(quoteIdentifier(column) for column in primaryKey.columns)
+        if (primaryKey.projection is None):
+            digest = "decode(md5(t::text), 'hex')"
+            source = "%s t"
+        else:
+            # the projected columns are hashed as one row, the derived table lets the aliased expressions in.
+            digest = "decode(md5(p::text), 'hex')"
+            source = "(select %s from %%s t) p" % primaryKey.selectList()
+        digestKey = primaryKey.project([digest])
+        query = "select %s, %s from %s order by %s" % (keys, digest, source, primaryKey.orderBy())
+        return digestKey, query
+
+    def compare(self, dataComparator, n=10000):
+        '''
+        Compares the whole table and records every difference in the data comparator.
+        :param dataComparator: a DataComparator() object that collects the errors.
+        :param n: number of digests fetched at a time.
+        :return:
+        '''
+        self.dataComparator = dataComparator
+        digestKey, query = self.digestKey()
+        digestComparator = MergeComparator(self.keySink)
+        try:
+            self.connectionA.query(query, n)
+            self.connectionB.query(query, n)
+            digestComparator.compareStreams(self.digestFetcher(self.connectionA, digestKey),
+                                            self.digestFetcher(self.connectionB, digestKey))
+            self.fetchRows()
+        finally:
+            self.connectionA.closeStream()
+            self.connectionB.closeStream()
+
+        # identical rows are only counted, none of them left either server in full.
+        self.rowsDigested = digestComparator.totalTableSizeA + digestComparator.totalTableSizeB
+        dataComparator.totalTableSizeA += digestComparator.totalTableSizeA - self.fetchedA
+        dataComparator.totalTableSizeB += digestComparator.totalTableSizeB - self.fetchedB
+        dataComparator.metrics.merge(digestComparator.metrics)
+        dataComparator.finish()
+
+    def digestFetcher(self, connection, digestKey):
+        '''
+        :param connection: a connection whose digest query has been issued.
+        :param digestKey: the PrimaryKey of the digest query.
+        :return: callable returning the next chunk of (primary key, digest) pairs.
+        '''
+        def fetch():
+            return [(key, bytes(digest)) for key, digest in digestKey.keyRows(connection.fetchNext())]
+        return fetch
+
+    def keySink(self, filename):
+        '''
+        Error sink factory of the digest comparator: its errors are the keys whose rows have to be fetched.
+        :param filename: the report file the sink stands for.
+        :return: a KeySink.
+        '''
+        return KeySink(self, filename)
+
+    def addKeys(self, keyA, keyB):
+        '''
+        Queues the key of a differing row, fetching a batch once enough have been queued.
+        :param keyA: key whose row of A is needed, or None.
+        :param keyB: key whose row of B is needed, or None.
+        :return:
+        '''
+        if (keyA is not None):
+            self.keysA.append(keyA)
+        if (keyB is not None):
+            self.keysB.append(keyB)
+        if (len(self.keysA) + len(self.keysB) >= self.batchSize):
+            self.fetchRows()
+
+    def fetchRows(self):
+        '''
+        Fetches the full rows of the queued keys from both databases and compares them.
+        :return:
+        '''
+        if (not self.keysA and not self.keysB):
+            return
+        alist = self.connectionA.fetchByKeys(self.keysA) if self.keysA else []
+        blist = self.connectionB.fetchByKeys(self.keysB) if self.keysB else []
+        self.keysA = []
+        self.keysB = []
+        self.fetchedA += len(alist)
+        self.fetchedB += len(blist)
+        self.dataComparator.prepareDataChunks(alist, blist)
+
+
+class KeySink:
+    '''
+    Error sink of the digest comparator that passes the primary keys of its errors on to the DigestPrePass.
+    '''
+
+    def __init__(self, prePass, filename):
+        self.prePass = prePass
+        self.filename = filename
+
+    def add(self, *rows):
+        if (self.filename == "corruption-errors.csv"):
+            self.prePass.addKeys(rows[0][0], rows[1][0])
+        elif (self.filename == "omission-errors.csv"):
+            self.prePass.addKeys(rows[0][0], None)
+        else:
+            self.prePass.addKeys(None, rows[0][0])
+
+    def finish(self, reportDir):
+        pass
@@ -0,0 +1,321 @@
+import csv
+import gzip
+import io
+import os
+import shutil
+
+try:
+    import zstandard
+except ImportError:
+    # zstandard is optional, only zstd compressed reports need it.
+    zstandard = None
+
+# file name suffix of each compression of the csv reports.
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def columnDiffs(a, b):
+    '''
+    Column level differences of a corruption error, which report files hold instead of both full rows.
+    :param a: the pre-migration row.
+    :param b: the post-migration row.
+    :return: list of [primary key, column position, pre-migration value, post-migration value] records, one per
+                column whose values differ. Positions count from 1, the primary key being at 0. A column that only
+                one of the rows has is reported with None on the other side.
+    '''
+    diffs = []
+    for i in range(1, max(len(a), len(b))):
+        if (i >= len(a) or i >= len(b)):
+            diffs.append([a[0], i, a[i] if i < len(a) else None, b[i] if i < len(b) else None])
+        elif (a[i] != b[i]):
+            diffs.append([a[0], i, a[i], b[i]])
+    return diffs
+
+
+def compressionName(compress):
+    '''
+    :param compress: False or None, True or "gzip", or "zstd".
+    :return: None, "gzip" or "zstd".
+    '''
+    if (compress is True):
+        return 'gzip'
+    if (not compress):
+        return None
+    if (compress not in COMPRESSION_SUFFIXES):
+        raise ValueError("unknown compression %s, expected gzip or zstd" % compress)
+    if (compress == 'zstd' and zstandard is None):
+        raise ImportError("zstd compressed reports require zstandard, install it with `pip install zstandard`.")
+    return compress
+
+
+class ListErrorSink(list):
+    '''
+    Default error sink that keeps every error in memory and writes its report file once the comparison is over.
+
+    Each error is one record: a single row for creation and omission errors, or a [pre-migration row,
+    post-migration row] pair for corruption errors. It is a list so the recorded errors can be inspected directly.
+    '''
+
+    def __init__(self, filename, diffs=False):
+        '''
+        :param filename: name of the report file written by finish().
+        :param diffs: write the column level differences of corruption errors (see columnDiffs) instead of both rows.
+        '''
+        super().__init__()
+        self.filename = filename
+        self.diffs = diffs
+        # set once an error made of several rows is recorded, every error of a sink has the same shape.
+        self.multiRow = False
+
+    def add(self, *rows):
+        '''
+        Records a single error.
+        :param rows: the row, or rows, that make up the error.
+        :return:
+        '''
+        if (len(rows) == 1):
+            self.append(rows[0])
+        else:
+            self.multiRow = True
+            self.append(list(rows))
+
+    def merge(self, other):
+        '''
+        Appends the errors recorded by another sink of the same kind.
+        :param other: a ListErrorSink.
+        :return:
+        '''
+        self.extend(other)
+        self.multiRow = self.multiRow or other.multiRow
+
+    def checkpoint(self):
+        '''
+        :return: the errors recorded so far, to be saved with a checkpoint.
+        '''
+        return (list(self), self.multiRow)
+
+    def restore(self, state):
+        '''
+        Replaces the recorded errors with the ones saved by a checkpoint.
+        :param state: a value returned by checkpoint(), or None to start empty.
+        :return:
+        '''
+        records, multiRow = state if state else ([], False)
+        self[:] = records
+        self.multiRow = multiRow
+
+    def finish(self, reportDir):
+        '''
+        Writes every recorded error into the report file.
+        :param reportDir: directory the report file is written into.
+        :return:
+        '''
+        with open(os.path.join(reportDir, self.filename), 'w', newline='') as f:
+            csvwriter = csv.writer(f, delimiter=',')
+            for record in self:
+                if (not self.multiRow):
+                    csvwriter.writerow(record)
+                elif (self.diffs):
+                    csvwriter.writerows(columnDiffs(*record))
+                else:
+                    csvwriter.writerows(record)
+
+
+class CsvErrorSink:
+    '''
+    Error sink that writes errors into their csv report file as soon as they are found, through a large write
+    buffer and optionally gzip or zstd compressed. Memory use does not depend on the number of errors, and
+    everything that has been flushed survives a crash of the comparison.
+
+    Compressed files are written as a sequence of gzip members or zstd frames, so separate files can be
+    concatenated (see merge()) and the result is still a valid compressed file.
+    '''
+
+    def __init__(self, path, compress=False, bufferSize=1 << 20, resume=False, diffs=False):
+        '''
+        :param path: the report file, created or truncated.
+        :param compress: "gzip" (or True) or "zstd" to compress the report file.
+        :param bufferSize: size in bytes of the write buffer.
+        :param resume: keep the contents of an existing file, restore() then cuts it back to a checkpoint.
+        :param diffs: write the column level differences of corruption errors (see columnDiffs) instead of both rows.
+        '''
+        self.path = path
+        self.compress = compressionName(compress)
+        self.bufferSize = bufferSize
+        self.diffs = diffs
+        self.count = 0
+        self.raw = None
+        self.stream = None
+        self.text = None
+        self.writer = None
+
+        directory = os.path.dirname(path)
+        if (directory):
+            os.makedirs(directory, exist_ok=True)
+        # append mode, so that writes land at the end of the file after restore() truncated it.
+        self.raw = open(path, 'ab', buffering=bufferSize)
+        if (not resume):
+            self.raw.truncate(0)
+        self.startMember()
+
+    def startMember(self):
+        '''
+        Helper function that layers the (compressed) text writer on top of the raw file.
+        :return:
+        '''
+        if (self.compress == 'gzip'):
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+        elif (self.compress == 'zstd'):
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        self.text = io.TextIOWrapper(self.stream, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.text, delimiter=',')
+
+    def endMember(self):
+        '''
+        Helper function that flushes the text writer and completes the current gzip member or zstd frame, leaving
+        the raw file open and positioned at a member boundary.
+        :return:
+        '''
+        self.text.flush()
+        self.text.detach()
+        if (self.compress):
+            self.stream.close()
+        self.text = None
+        self.writer = None
+
+    def add(self, *rows):
+        '''
+        Writes a single error, each of its rows, or each differing column of a corruption, becoming one csv line.
+        :param rows: the row, or rows, that make up the error.
+        :return:
+        '''
+        if (self.diffs and len(rows) == 2):
+            self.writer.writerows(columnDiffs(*rows))
+        else:
+            self.writer.writerows(rows)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def flush(self):
+        '''
+        Pushes everything written so far to the operating system.
+        :return:
+        '''
+        if (self.text):
+            self.text.flush()
+            if (self.compress):
+                self.stream.flush()
+            self.raw.flush()
+
+    def checkpoint(self):
+        '''
+        Completes the current gzip member or zstd frame and forces the file to disk, so everything up to the returned offset
+        survives a crash.
+        :return: the (file offset, error count) of this point.
+        '''
+        self.endMember()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        state = (self.raw.tell(), self.count)
+        self.startMember()
+        return state
+
+    def restore(self, state):
+        '''
+        Cuts the file back to a checkpoint, dropping the errors written after it.
+        :param state: a value returned by checkpoint(), or None to start empty.
+        :return:
+        '''
+        offset, count = state if state else (0, 0)
+        self.endMember()
+        self.raw.flush()
+        self.raw.truncate(offset)
+        self.count = count
+        self.startMember()
+
+    def merge(self, other):
+        '''
+        Appends the contents of another sink's file to this one and removes the other file.
+        :param other: a finished CsvErrorSink with the same compression.
+        :return:
+        '''
+        other.close()
+        self.endMember()
+        with open(other.path, 'rb') as f:
+            shutil.copyfileobj(f, self.raw, self.bufferSize)
+        os.remove(other.path)
+        try:
+            # shard sub-directories are left empty once their files are merged.
+            os.rmdir(os.path.dirname(other.path))
+        except OSError:
+            pass
+        self.count += other.count
+        self.startMember()
+
+    def close(self):
+        '''
+        Flushes and closes the report file. Safe to call more than once.
+        :return:
+        '''
+        if (self.raw):
+            if (self.text):
+                self.endMember()
+            self.raw.close()
+            self.raw = None
+
+    def finish(self, reportDir):
+        '''
+        The errors are already in the report file, it only needs to be closed.
+        :param reportDir: unused, the file lives at the path given on construction.
+        :return:
+        '''
+        self.close()
+
+    def __getstate__(self):
+        # an open file cannot cross a process boundary, the sink is closed and travels as its path and count.
+        self.close()
+        state = self.__dict__.copy()
+        state.update(raw=None, stream=None, text=None, writer=None)
+        return state
+
+
+class CsvErrorSinkFactory:
+    '''
+    Creates the CsvErrorSinks of a data comparator inside a report directory. It is a class rather than a closure so
+    that it can be sent to worker processes.
+    '''
+
+    def __init__(self, reportDir, compress=False, bufferSize=1 << 20, resume=False, diffs=False):
+        '''
+        :param reportDir: directory the report files are written into.
+        :param compress: "gzip" (or True) or "zstd" to compress the report files, which then get a .gz or .zst
+                            suffix.
+        :param bufferSize: size in bytes of each file's write buffer.
+        :param resume: keep existing report files so a resumed comparison can carry on writing them.
+        :param diffs: write the column level differences of corruption errors instead of both rows.
+        '''
+        self.reportDir = reportDir
+        self.compress = compressionName(compress)
+        self.bufferSize = bufferSize
+        self.resume = resume
+        self.diffs = diffs
+
+    def __call__(self, filename):
+        '''
+        :param filename: name of the report file.
+        :return: a new CsvErrorSink.
+        '''
+        path = os.path.join(self.reportDir, filename + COMPRESSION_SUFFIXES[self.compress])
+        return CsvErrorSink(path, self.compress, self.bufferSize, self.resume, self.diffs)
+
+    def forShard(self, shard):
+        '''
+        :param shard: number of a primary key range compared by a separate worker.
+        :return: a factory writing into a sub-directory of its own, whose files are merged back afterwards.
+        '''
+        return CsvErrorSinkFactory(os.path.join(self.reportDir, "shard-%d" % shard), self.compress, self.bufferSize,
+                                   diffs=self.diffs)
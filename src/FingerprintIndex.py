@@ -0,0 +1,249 @@
+import json
+import mmap
+import os
+import struct
+
+from PrimaryKey import DEFAULT_PRIMARY_KEY
+
+
+class FingerprintIndex:
+    '''
+    A file of (primary key, row digest) pairs of a source table, sorted by primary key and memory-mapped, so the same
+    source can be verified against many migration attempts without reading it from its server every time.
+
+    The file starts with a header (magic, number of records, length of the source identity), the source identity as
+    JSON (see sourceIdentity()), then fixed size records of a little endian int64 primary key and the 16 byte md5 of
+    the row's text representation, the same row text RangeChecksum hashes. An index opened for a source whose
+    identity differs from the recorded one is refused, so it is never compared against another server's table.
+    Being sorted, the index is merged against the digests of a target table streamed in primary key order:
+    matching digests are only counted, and the full rows are fetched, from both servers, only for the keys whose
+    digests differ or that exist on one side only. Those rows go through a DataComparator as usual.
+
+    Records are keyed by the single column integer primary key set on the connections (see
+    PsycoConnection.discoverPrimaryKey), or `id` when none is set; tables with any other key are refused.
+
+    Note: this relies on both servers producing the same text for equal rows. Rows fetched for a mismatch reflect
+    the source as it is now, not as it was when the index was built.
+    '''
+
+    MAGIC = b'MRFPIDX2'
+    HEADER = struct.Struct('<8sQI')
+    RECORD = struct.Struct('<q16s')
+
+    def __init__(self, path, identity=None):
+        '''
+        :param path: an index file written by buildFingerprintIndex().
+        :param identity: identity of the source the index is opened for, or None to accept any.
+        '''
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, identityLength = (None, 0, 0)
+        if (len(self.mm) >= self.HEADER.size):
+            magic, self.count, identityLength = self.HEADER.unpack_from(self.mm, 0)
+        self.offset = self.HEADER.size + identityLength
+        if (magic != self.MAGIC or len(self.mm) != self.offset + self.count * self.RECORD.size):
+            self.close()
+            raise ValueError("%s is not a complete fingerprint index" % path)
+        self.identity = json.loads(self.mm[self.HEADER.size:self.offset].decode('utf-8'))
+        if (identity is not None and identity != self.identity):
+            self.close()
+            raise ValueError("%s was built from %s, not %s" % (path, self.identity, identity))
+
+        self.rowsFetched = 0
+        self.rowsMatched = 0
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i):
+        '''
+        :param i: position of a record.
+        :return: the (primary key, digest) record at that position.
+        '''
+        return self.RECORD.unpack_from(self.mm, self.offset + i * self.RECORD.size)
+
+    def records(self, blockSize=4096):
+        '''
+        Generator over every record in primary key order, unpacked a block at a time.
+        :param blockSize: number of records unpacked at once.
+        :return:
+        '''
+        for start in range(0, self.count, blockSize):
+            offset = self.offset + start * self.RECORD.size
+            block = self.mm[offset:offset + min(blockSize, self.count - start) * self.RECORD.size]
+            for record in self.RECORD.iter_unpack(block):
+                yield record
+
+    def find(self, key):
+        '''
+        Looks up the digest of a primary key with a binary search.
+        :param key: the primary key.
+        :return: the digest, or None if the key is not in the index.
+        '''
+        lo = 0
+        hi = self.count
+        while (lo < hi):
+            mid = (lo + hi) // 2
+            midKey, digest = self.record(mid)
+            if (midKey == key):
+                return digest
+            if (midKey < key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def compare(self, sourceConnection, targetConnection, dataComparator, n=10000, batchSize=1000):
+        '''
+        Compares a target table against the index and records every difference in the data comparator.
+        :param sourceConnection: PsycoConnection to the source database, only used to fetch rows that differ.
+        :param targetConnection: PsycoConnection to the target database, with its table name set.
+        :param dataComparator: a DataComparator() object that collects the errors.
+        :param n: number of target digests fetched at a time.
+        :param batchSize: number of differing keys whose rows are fetched together.
+        :return:
+        '''
+        targetConnection.query(digestQuery(targetConnection), n)
+        source = self.records()
+        target = self.targetDigests(targetConnection)
+        sourceKeys = []
+        targetKeys = []
+        matched = 0
+
+        s = next(source, None)
+        t = next(target, None)
+        while (s is not None or t is not None):
+            if (t is None or (s is not None and s[0] < t[0])):
+                # only in the source, an omission unless the row changed its key.
+                sourceKeys.append(s[0])
+                s = next(source, None)
+            elif (s is None or t[0] < s[0]):
+                targetKeys.append(t[0])
+                t = next(target, None)
+            else:
+                if (s[1] == t[1]):
+                    matched += 1
+                else:
+                    sourceKeys.append(s[0])
+                    targetKeys.append(t[0])
+                s = next(source, None)
+                t = next(target, None)
+
+            if (len(sourceKeys) + len(targetKeys) >= batchSize):
+                self.compareRows(sourceConnection, targetConnection, sourceKeys, targetKeys, dataComparator)
+                sourceKeys = []
+                targetKeys = []
+
+        self.compareRows(sourceConnection, targetConnection, sourceKeys, targetKeys, dataComparator)
+        targetConnection.closeStream()
+        # identical rows are only counted, none of them left either server.
+        dataComparator.totalTableSizeA += matched
+        dataComparator.totalTableSizeB += matched
+        self.rowsMatched += matched
+        dataComparator.finish()
+
+    def targetDigests(self, targetConnection):
+        '''
+        Generator over the (primary key, digest) pairs of the target table, in primary key order.
+        :param targetConnection: a connection whose digest query has been issued.
+        :return:
+        '''
+        chunk = targetConnection.fetchNext()
+        while (len(chunk) > 0):
+            for key, digest in chunk:
+                yield key, bytes(digest)
+            chunk = targetConnection.fetchNext()
+
+    def compareRows(self, sourceConnection, targetConnection, sourceKeys, targetKeys, dataComparator):
+        '''
+        Fetches the full rows of the differing keys from both databases and compares them.
+        :param sourceConnection: connection to the source database.
+        :param targetConnection: connection to the target database.
+        :param sourceKeys: ascending keys whose source rows are needed.
+        :param targetKeys: ascending keys whose target rows are needed.
+        :param dataComparator: a DataComparator() object that collects the errors.
+        :return:
+        '''
+        if (not sourceKeys and not targetKeys):
+            return
+        alist = sourceConnection.fetchByKeys(sourceKeys) if sourceKeys else []
+        blist = targetConnection.fetchByKeys(targetKeys) if targetKeys else []
+        self.rowsFetched += len(alist) + len(blist)
+        dataComparator.prepareDataChunks(alist, blist)
+
+    def close(self):
+        '''
+        Unmaps and closes the index file.
+        :return:
+        '''
+        self.mm.close()
+        self.file.close()
+
+
+def digestQuery(connection):
+    '''
+    :param connection: PsycoConnection with its table name and primary key set.
+    :return: query streaming the primary key and binary md5 of every row in key order, the table is aliased to t so
+    the whole row can be cast to text.
+    '''
+    primaryKey = connection.primaryKey if connection.primaryKey else DEFAULT_PRIMARY_KEY
+    if (primaryKey.composite or not primaryKey.integer[0]):
+        raise ValueError("a fingerprint index needs a single column integer primary key, %s has %s" %
+                         (connection.tablename, primaryKey))
+    return "select %s, decode(md5(t::text), 'hex') from %%s t order by %s" % (primaryKey.expressions()[0],
+                                                                           primaryKey.orderBy())
+
+
+def sourceIdentity(connection):
+    '''
+    Identifies the source table an index is built from: its server, database, name and key, and the oid and
+    relfilenode of the table, which differ between two databases holding a table of the same name and change when
+    the table is recreated or rewritten.
+    :param connection: PsycoConnection to the source database, with its table name and primary key set.
+    :return: dictionary of the identity, as stored in the index header.
+    '''
+    primaryKey = connection.primaryKey if connection.primaryKey else DEFAULT_PRIMARY_KEY
+    oid, relfilenode = connection.execute("select c.oid, c.relfilenode from pg_class c where c.oid = '%s'::regclass")[0]
+    return {'host': 'localhost', 'port': int(connection.psqldb.port), 'dbname': connection.psqldb.dbname,
+            'table': connection.tablename, 'key': primaryKey.columns, 'oid': int(oid), 'relfilenode': int(relfilenode)}
+
+
+def buildFingerprintIndex(connection, path, n=10000, identity=None):
+    '''
+    Streams the digest of every row of a table into a new index file. The file is written next to its final path
+    and renamed once complete, so an interrupted build never leaves a partial index behind.
+    :param connection: PsycoConnection to the source database, with its table name set.
+    :param path: the index file.
+    :param n: number of digests fetched at a time.
+    :param identity: identity of the source recorded in the header, see sourceIdentity().
+    :return: the FingerprintIndex.
+    '''
+    psqlQuery = digestQuery(connection)
+    identityBytes = json.dumps(identity, sort_keys=True).encode('utf-8')
+    directory = os.path.dirname(path)
+    if (directory):
+        os.makedirs(directory, exist_ok=True)
+    temporary = path + ".tmp"
+    count = 0
+    lastKey = None
+    connection.query(psqlQuery, n)
+    with open(temporary, 'wb') as f:
+        f.write(FingerprintIndex.HEADER.pack(FingerprintIndex.MAGIC, 0, len(identityBytes)))
+        f.write(identityBytes)
+        chunk = connection.fetchNext()
+        while (len(chunk) > 0):
+            for key, digest in chunk:
+                if (lastKey is not None and key <= lastKey):
+                    raise ValueError("primary keys of %s are not unique and ascending" % connection.tablename)
+                f.write(FingerprintIndex.RECORD.pack(key, bytes(digest)))
+                lastKey = key
+                count += 1
+            chunk = connection.fetchNext()
+        f.seek(0)
+        f.write(FingerprintIndex.HEADER.pack(FingerprintIndex.MAGIC, count, len(identityBytes)))
+        f.flush()
+        os.fsync(f.fileno())
+    connection.closeStream()
+    os.replace(temporary, path)
+    return FingerprintIndex(path, identity)
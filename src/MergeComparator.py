@@ -0,0 +1,150 @@
+from collections import deque
+from typing import List
+
+from DataComparator import DataComparator
+
+
+class MergeComparator(DataComparator):
+    """
+    Data comparator that classifies migration errors with a two-pointer sorted merge instead of hashmaps.
+
+    Both databases must deliver their rows in ascending primary key order (which is what the primary key
+    ordered scans in MigrationReport guarantee). Because the streams are sorted, the row with the
+    smaller primary key can be classified immediately:
+    1. Equal primary keys are compared column by column (Corruption Errors).
+    2. A row in A that is smaller than the current row in B can never be matched (Copy Omission Error).
+    3. A row in B that is smaller than the current row in A can never be matched (Creation Error).
+
+    The counters, error lists and reports are the ones provided by DataComparator, so this class can be
+    passed anywhere a DataComparator is expected.
+    """
+
+    CHECKPOINTED = DataComparator.CHECKPOINTED + ('pendingA', 'pendingB')
+
+    def __init__(self, sinkFactory=None, rowDecoder=None):
+        super().__init__(sinkFactory, rowDecoder)
+        # rows that have been received but not yet classified, in primary key order.
+        self.pendingA = deque()
+        self.pendingB = deque()
+
+    def compareStreams(self, fetchA, fetchB, checkpoint=None):
+        '''
+        Merges two whole tables while holding at most one chunk per database in memory. Chunks are pulled
+        from whichever database is behind, so gaps in either table never cause rows to accumulate.
+        :param fetchA: callable returning the next chunk of rows from database A, or an empty list when done.
+        :param fetchB: callable returning the next chunk of rows from database B, or an empty list when done.
+        :param checkpoint: optional Checkpoint. The state of the pull based merge cannot be saved halfway through
+                            a chunk, so with a checkpoint the chunks are pushed through prepareDataChunks() in
+                            pairs instead, and the rows one database is ahead by wait in the pending queues.
+        :return:
+        '''
+        if (checkpoint):
+            super().compareStreams(fetchA, fetchB, checkpoint)
+            return
+
+        rowsA = self.iterateRows(fetchA, 'A')
+        rowsB = self.iterateRows(fetchB, 'B')
+        a = next(rowsA, None)
+        b = next(rowsB, None)
+
+        while (a is not None and b is not None):
+            if (a[0] == b[0]):
+                if (not self.compareData(a, b)):
+                    self.addCorruptionError(a, b)
+                a = next(rowsA, None)
+                b = next(rowsB, None)
+            elif (a[0] < b[0]):
+                self.addCopyOmissionError(a)
+                a = next(rowsA, None)
+            else:
+                self.addCreationError(b)
+                b = next(rowsB, None)
+
+        # once one of the databases is exhausted, nothing left in the other can be matched.
+        while (a is not None):
+            self.addCopyOmissionError(a)
+            a = next(rowsA, None)
+        while (b is not None):
+            self.addCreationError(b)
+            b = next(rowsB, None)
+        self.finish()
+
+    def iterateRows(self, fetch, side):
+        '''
+        Generator that yields the rows of a database one at a time, pulling a new chunk only once the
+        previous one has been consumed.
+        :param fetch: callable returning the next chunk of rows, or an empty list when done.
+        :param side: 'A' or 'B', the database the rows belong to, used for the table size counters.
+        :return:
+        '''
+        chunk = self.fetchChunk(fetch, side)
+        while (len(chunk) > 0):
+            if (side == 'A'):
+                self.totalTableSizeA += len(chunk)
+            else:
+                self.totalTableSizeB += len(chunk)
+            for row in chunk:
+                yield row
+            chunk = self.fetchChunk(fetch, side)
+
+    def prepareDataChunks(self, alist:List, blist:List):
+        '''
+        Push based interface that accepts aligned chunks from each database, as DataComparator does.
+        Rows are merged as far as both pending queues allow. Whatever remains waits for the next chunk,
+        so memory is bounded by how far one database runs ahead of the other.
+        :param alist: data loaded from database A.
+        :param blist: data loaded from database B.
+        :return:
+        '''
+        with self.metrics.timer('prepare'):
+            self.totalTableSizeA += len(alist)
+            self.totalTableSizeB += len(blist)
+            self.pendingA.extend(alist)
+            self.pendingB.extend(blist)
+            with self.metrics.timer('process'):
+                self.processDataChunks(alist, blist)
+        self.recordLeftovers()
+
+    def leftoverSizes(self):
+        '''
+        :return: number of rows of A and of B waiting in the pending queues.
+        '''
+        return len(self.pendingA), len(self.pendingB)
+
+    def processDataChunks(self, alist:List, blist:List):
+        '''
+        Merges the pending rows of both databases until one of the queues runs dry.
+        :param alist: the rows that just arrived from database A (already queued).
+        :param blist: the rows that just arrived from database B (already queued).
+        :return:
+        '''
+        pendingA = self.pendingA
+        pendingB = self.pendingB
+        while (pendingA and pendingB):
+            a = pendingA[0]
+            b = pendingB[0]
+            if (a[0] == b[0]):
+                if (not self.compareData(a, b)):
+                    self.addCorruptionError(a, b)
+                pendingA.popleft()
+                pendingB.popleft()
+            elif (a[0] < b[0]):
+                self.addCopyOmissionError(pendingA.popleft())
+            else:
+                self.addCreationError(pendingB.popleft())
+
+    def flushA(self):
+        '''
+        Everything still pending in A had no counterpart in B, they are Copy Omission Errors.
+        :return:
+        '''
+        while (self.pendingA):
+            self.addCopyOmissionError(self.pendingA.popleft())
+
+    def flushB(self):
+        '''
+        Everything still pending in B had no counterpart in A, they are Creation Errors.
+        :return:
+        '''
+        while (self.pendingB):
+            self.addCreationError(self.pendingB.popleft())
@@ -0,0 +1,213 @@
+import cProfile
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Metrics:
+    '''
+    Collects the timings, counters and gauges of a comparison so the slowest stage can be found.
+
+    1. Timers - total, count and longest duration of each stage (fetch, prepare, process, flush, report...).
+                Stages nest: prepare includes the process and flush stages it runs.
+    2. Counters - running totals such as rows and bytes read, reported with their rate per second.
+    3. Gauges - last and largest value of a size, such as the number of rows waiting in the leftover maps.
+
+    When tracemalloc is tracing, the peak of traced memory is included as well. Hooks are callables that receive
+    every event as hook(event, name, value), with event one of 'begin', 'end', 'count' or 'gauge'; they let a
+    profiler or an external metrics system follow the stages (see CProfileHook).
+
+    The prefetch and worker threads of a comparison record into the same object, so the updates are made under a
+    lock. Hooks are called outside of it.
+    '''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.timers = {}
+        self.counters = {}
+        self.gauges = {}
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def addHook(self, hook):
+        '''
+        :param hook: callable taking (event, name, value).
+        :return:
+        '''
+        self.hooks.append(hook)
+
+    @contextmanager
+    def timer(self, name):
+        '''
+        Context manager that times a stage.
+        :param name: the stage.
+        :return:
+        '''
+        for hook in self.hooks:
+            hook('begin', name, None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.time(name, time.perf_counter() - start)
+
+    def time(self, name, seconds):
+        '''
+        Records one run of a stage.
+        :param name: the stage.
+        :param seconds: how long it took.
+        :return:
+        '''
+        with self.lock:
+            timer = self.timers.get(name)
+            if (timer is None):
+                timer = self.timers[name] = [0, 0.0, 0.0]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+        for hook in self.hooks:
+            hook('end', name, seconds)
+
+    def count(self, name, amount=1):
+        '''
+        :param name: the counter.
+        :param amount: added to the counter.
+        :return:
+        '''
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+        for hook in self.hooks:
+            hook('count', name, amount)
+
+    def gauge(self, name, value):
+        '''
+        :param name: the gauge.
+        :param value: its current value.
+        :return:
+        '''
+        with self.lock:
+            gauge = self.gauges.get(name)
+            if (gauge is None):
+                self.gauges[name] = [value, value]
+            else:
+                gauge[0] = value
+                gauge[1] = max(gauge[1], value)
+        for hook in self.hooks:
+            hook('gauge', name, value)
+
+    def stop(self):
+        '''
+        Freezes the elapsed time the rates are computed over.
+        :return:
+        '''
+        if (self.elapsed is None):
+            self.elapsed = time.perf_counter() - self.started
+
+    def merge(self, other):
+        '''
+        Adds the metrics of another comparison, e.g. one primary key range of the same table.
+        :param other: a Metrics object.
+        :return:
+        '''
+        with other.lock:
+            timers = [(name, list(timer)) for name, timer in other.timers.items()]
+            counters = list(other.counters.items())
+            gauges = [(name, list(gauge)) for name, gauge in other.gauges.items()]
+        with self.lock:
+            for name, (count, total, longest) in timers:
+                timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += count
+                timer[1] += total
+                timer[2] = max(timer[2], longest)
+            for name, value in counters:
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, (last, largest) in gauges:
+                gauge = self.gauges.setdefault(name, [last, largest])
+                gauge[1] = max(gauge[1], largest)
+
+    def toDict(self):
+        '''
+        :return: the metrics as a dictionary ready to be dumped as JSON.
+        '''
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        with self.lock:
+            timers = sorted((name, tuple(timer)) for name, timer in self.timers.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted((name, tuple(gauge)) for name, gauge in self.gauges.items())
+        metrics = {
+            'elapsedSeconds': elapsed,
+            'timers': dict((name, {'count': count, 'totalSeconds': total, 'maxSeconds': longest,
+                                   'meanSeconds': total / count if count else 0.0,
+                                   'share': total / elapsed if elapsed > 0 else 0.0})
+                           for name, (count, total, longest) in timers),
+            'counters': dict((name, {'total': value, 'perSecond': value / elapsed if elapsed > 0 else 0.0})
+                             for name, value in counters),
+            'gauges': dict((name, {'last': last, 'max': largest})
+                           for name, (last, largest) in gauges),
+        }
+        if (tracemalloc.is_tracing()):
+            current, peak = tracemalloc.get_traced_memory()
+            metrics['memory'] = {'currentBytes': current, 'peakBytes': peak}
+        return metrics
+
+    def write(self, path, extra=None):
+        '''
+        Writes the metrics into a JSON file.
+        :param path: the metrics file.
+        :param extra: optional dictionary of further sections, e.g. the metrics of each table.
+        :return:
+        '''
+        metrics = self.toDict()
+        if (extra):
+            metrics.update(extra)
+        with open(path, 'w') as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+
+    def __getstate__(self):
+        # hooks usually hold resources of their own process, a Metrics object sent to another process drops them.
+        # the lock cannot be pickled, it gets a new one.
+        state = self.__dict__.copy()
+        state['hooks'] = []
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class CProfileHook:
+    '''
+    Metrics hook that runs cProfile while the chosen stages are running, on the thread that runs them.
+    '''
+
+    def __init__(self, stages):
+        '''
+        :param stages: names of the stages to profile.
+        '''
+        self.stages = set(stages)
+        self.profiler = cProfile.Profile()
+        self.depth = 0
+
+    def __call__(self, event, name, value):
+        if (name not in self.stages):
+            return
+        if (event == 'begin'):
+            if (self.depth == 0):
+                self.profiler.enable()
+            self.depth += 1
+        elif (event == 'end' and self.depth > 0):
+            self.depth -= 1
+            if (self.depth == 0):
+                self.profiler.disable()
+
+    def dump(self, path):
+        '''
+        Writes the collected profile, readable with pstats or snakeviz.
+        :param path: the profile file.
+        :return:
+        '''
+        self.profiler.dump_stats(path)
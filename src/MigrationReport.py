@@ -1,97 +1,279 @@
 import requests
 import json
-import docker
-import subprocess
 import os
 import time
 import requests
+import argparse
+import multiprocessing
+import tracemalloc
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from PSQLServer import PSQLServer
+from ContainerManager import ContainerManager
 from PsycoConnection import PsycoConnection
+from ConnectionPool import connectionPool, closePools
+from RetryPolicy import RetryPolicy
 from DataComparator import DataComparator
+from MergeComparator import MergeComparator
+from CompactDataComparator import CompactDataComparator
+from VectorComparator import VectorComparator
+from RangeChecksum import RangeChecksum
+from ChunkPrefetcher import ChunkPrefetcher
+from TableSharder import TableSharder, compareShard
+from ErrorSink import CsvErrorSinkFactory, ListErrorSink
+from ArrowErrorSink import ArrowErrorSink, ArrowErrorSinkFactory
+from CopyStream import decodeCopyRow
+from ChunkSizer import ChunkSizer
+from Checkpoint import Checkpoint
+from AsyncComparisonDriver import AsyncComparisonDriver
+from FingerprintIndex import FingerprintIndex, buildFingerprintIndex, sourceIdentity
+from MultiTargetComparator import MultiTargetComparator
+from TableSampler import TableSampler
+from DigestPrePass import DigestPrePass
+from ColumnProjection import ColumnProjection
+from Metrics import Metrics, CProfileHook
+
+# comparison engines that can be selected from the command line.
+COMPARATORS = {
+    'hash': DataComparator,
+    'merge': MergeComparator,
+    'vector': VectorComparator,
+    'compact': CompactDataComparator,
+}
 
 
 class MigrationReport:
 
-    def __init__(self, inifile, port=5432):
+    def __init__(self, inifile, port=5432, streaming=False, itersize=2000, reportDir="../reports/",
+                 streamErrors=False, compressErrors=False, copy=False, chunkMemory=None,
+                 startupTimeout=60.0, checkpointDir=None, checkpointInterval=300.0, resume=False,
+                 indexDir="../indexes/", rebuildIndex=False, traceMemory=False, profileStages=None, keyset=False,
+                 sampleMethod="bernoulli", samplePercent=1.0, sampleSeed=0, sampleRanges=100, sampleRangeSize=1000,
+                 confidence=0.95, escalate=False, columnConfig=None, poolSize=16, retries=5, retryBackoff=0.5,
+                 reportFormat="csv", corruptionDiffs=True):
         '''
         The docker connect class takes in a list of filenames to construct a docker container communication platform.
         The filename is an initialization file that consists of the image names for each container.
         :param inifile: contains the names of the docker images that contain the postgres servers in question.
+        :param streaming: read tables through server-side cursors so memory is bounded by the chunk size.
+        :param itersize: rows per round trip for server-side cursors.
+        :param reportDir: directory the reports are written into.
+        :param streamErrors: write errors into the report files as they are found instead of keeping them in memory.
+        :param compressErrors: "gzip" (or True) or "zstd" to compress the streamed error files, the codec of
+                            columnar error files.
+        :param copy: extract full table scans with COPY and compare rows as raw text instead of python values.
+        :param chunkMemory: memory budget in bytes for the chunks held in memory. When given, chunk sizes are tuned
+                            while tables are read instead of staying at the requested size.
+        :param startupTimeout: seconds each postgres container may take to accept connections.
+        :param checkpointDir: directory the progress of each table comparison is periodically saved into, None
+                            disables checkpoints. Sharded comparisons are not checkpointed.
+        :param checkpointInterval: seconds between two checkpoints of a table.
+        :param resume: carry on from the checkpoints in checkpointDir instead of starting over.
+        :param indexDir: directory of the source fingerprint indexes used by the index mode.
+        :param rebuildIndex: rebuild the fingerprint indexes from the source even if they exist.
+        :param traceMemory: trace memory allocations with tracemalloc and report their peak in metrics.json. Slows
+                            the comparison down noticeably.
+        :param profileStages: names of comparator stages (e.g. "process", "flush") run under cProfile, each
+                            comparison writes its profile next to its report as profile.prof. Sharded ranges are
+                            compared in other processes and are not profiled.
+        :param keyset: full mode, read tables with keyset pagination in short transactions instead of holding a
+                            cursor, and with it a snapshot, open for the whole table.
+        :param sampleMethod: sample mode, "bernoulli" or "system" for TABLESAMPLE, "ranges" for random primary key
+                            ranges. See TableSampler.
+        :param samplePercent: sample mode, percentage of the rows sampled by TABLESAMPLE.
+        :param sampleSeed: sample mode, seed of the sample.
+        :param sampleRanges: sample mode, number of random key ranges.
+        :param sampleRangeSize: sample mode, rows per random key range.
+        :param confidence: sample mode, confidence level of the estimated error rates.
+        :param escalate: sample mode, compare a table in full when its sample holds any error.
+        :param columnConfig: JSON file of the columns compared in each table and their normalization, see
+                            ColumnProjection. Applies to the full, sample and digest modes, sharded and asynchronous
+                            comparisons included. The checksum and index modes hash whole rows on the server and
+                            do not support it.
+        :param poolSize: connections kept open to each server and shared by the tables compared, at least one more
+                            than the number of tables compared at the same time.
+        :param retries: times a connection attempt, or an operation whose connection broke, is retried.
+        :param retryBackoff: seconds waited before the first retry, doubled for every further one.
+        :param reportFormat: "csv" for csv error files, "parquet" or "arrow" for columnar ones, which are always
+                            streamed and need pyarrow. See ArrowErrorSink.
+        :param corruptionDiffs: report the columns that differ for each corruption error instead of both rows.
         '''
 
-        client = docker.from_env()
-        self.dbs = {}
+        self.streaming = streaming
+        self.itersize = itersize
+        self.reportDir = reportDir
+        self.streamErrors = streamErrors
+        self.compressErrors = compressErrors
+        self.copy = copy
+        self.chunkMemory = chunkMemory
+        self.checkpointDir = checkpointDir
+        self.checkpointInterval = checkpointInterval
+        self.resume = resume
+        self.indexDir = indexDir
+        self.rebuildIndex = rebuildIndex
+        self.profileStages = profileStages
+        self.keyset = keyset
+        self.sampleMethod = sampleMethod
+        self.samplePercent = samplePercent
+        self.sampleSeed = sampleSeed
+        self.sampleRanges = sampleRanges
+        self.sampleRangeSize = sampleRangeSize
+        self.confidence = confidence
+        self.escalate = escalate
+        self.projection = ColumnProjection.fromFile(columnConfig) if columnConfig else None
+        self.poolSize = poolSize
+        self.reportFormat = reportFormat
+        self.corruptionDiffs = corruptionDiffs
+        self.retryPolicy = RetryPolicy(retries, retryBackoff)
+        # CProfileHooks of the comparators, by table name ('' for a single table comparison).
+        self.profilers = {}
+        # timings of the run itself: container startup and the connections of the main databases.
+        self.metrics = Metrics()
+        if (traceMemory and not tracemalloc.is_tracing()):
+            tracemalloc.start()
+        # number of tables read at the same time, which share the chunk memory budget.
+        self.concurrentTables = 1
+        self.containerManager = ContainerManager(timeout=startupTimeout)
+        self.servers = []
+        self.containers = []
         self.initialize(inifile, port)
-        self.containers = client.containers.list()
         self.connections = []
+        self.tableNames = []
+        self.missingTables = []
+        self.extraTables = []
         self.connectToPsql()
         self.verifyConnections()
         self.dataComparator = None
+        self.tableComparators = {}
+        self.tableFailures = {}
+        # N-way comparisons: target name -> table name -> data comparator, or the exception of a failed table.
+        self.targetComparators = {}
+        self.targetFailures = {}
+        self.targetMissingTables = {}
 
     def initialize(self, inifile, port):
         '''
         Consumes the initialization file to launch docker containers with corresponding PSQL servers on monotonically
-        increasing ports on the host computer.
+        increasing ports on the host computer. All containers start at the same time, containers this tool already
+        launched for a server are reused, and this returns once every server accepts connections. The containers
+        started are stopped again if any server fails to start. See ContainerManager.
         :param inifile: name of the initialization file.
         :param port: starting port for multiple docker images to serve PSQL on.
         :return:
         '''
-        bashCommand = "docker run -d -p %d:5432 %s"
-        for line in open(inifile):
-            # starts containers while distributing monotonically increasing ports.
-            # Opted to bash launch the containers then scrape the containers off the daemon
-            # Made because original documentation was given for bash.
-
-            # client.containers.run(line, ports={'%d/tcp' % port : 5432}, detach=True)
-            singlePSQLiniLine = line.strip().split(',')
-            user = singlePSQLiniLine[0]
-            dbname = singlePSQLiniLine[1]
-            password = singlePSQLiniLine[2]
-            self.dbs[singlePSQLiniLine[3]] = PSQLServer(user, dbname, password, port)
-            process = subprocess.run((bashCommand % (port, line.split(',')[3])).split())
-            port += 1
+        self.servers = self.containerManager.readIniFile(inifile, port)
+        with self.metrics.timer('startup'):
+            try:
+                self.containers = self.containerManager.start(self.servers)
+            except Exception:
+                # containers that did start would otherwise be left running with nothing to stop them.
+                self.containerManager.stopAll()
+                raise
 
     def connectToPsql(self):
         '''
         Populates the list of connections by launching Psycopg2 and pointing it at each of the docker
-        containers launched with initialize().
+        containers launched with initialize(), in the order of the initialization file.
         :return:
         '''
-        for container in self.containers[::-1]:
-            PSQLdb = self.dbs[container.image.attrs['RepoTags'][0]]
-            self.connections.append(PsycoConnection(PSQLdb))
+        for PSQLdb in self.servers:
+            pool = connectionPool(PSQLdb, self.poolSize, self.retryPolicy)
+            self.connections.append(PsycoConnection(PSQLdb, self.streaming, self.itersize, self.metrics, pool))
 
     def verifyConnections(self):
         '''
-        Tries to make a basic connection with each of the databases. Ensures that the databases' tables
-        are named the same.
+        Tries to make a basic connection with each of the databases and lists their tables. Tables present in
+        both databases are the ones that will be compared, tables present in only one of them are reported.
         :return:
         '''
         # this also handles the connection of the table name to the object, and ensures
         # that the table in each database has equivalent names.
-        tableNames = None
+        tables = []
         for psycoconnection in self.connections:
-
             cur = psycoconnection.cursor
             cur.execute("select relname from pg_class where relkind='r' and relname !~ '^(pg_|sql_)';")
-            psycoconnection.tablename = cur.fetchall()[0][0]
-            if not tableNames:
-                tableNames = cur.fetchall()
-            else:
-                if tableNames != cur.fetchall():
-                    print("No equivalent tables found.")
+            tables.append(set(row[0] for row in cur.fetchall()))
+        # tables of every server, in the order of the connections, for N-way comparisons.
+        self.serverTables = tables
+
+        self.tableNames = sorted(tables[0] & tables[1])
+        self.missingTables = sorted(tables[0] - tables[1])
+        self.extraTables = sorted(tables[1] - tables[0])
+        if (not self.tableNames):
+            print("No equivalent tables found.")
+        if (self.missingTables):
+            print("Tables missing from the post-migration database: %s" % ', '.join(self.missingTables))
+        if (self.extraTables):
+            print("Tables only in the post-migration database: %s" % ', '.join(self.extraTables))
 
+        # single table comparisons run against the first table both databases share.
+        for psycoconnection in self.connections:
+            psycoconnection.tablename = self.tableNames[0] if self.tableNames else ''
+
+    def makeComparator(self, comparatorClass=DataComparator, tablename=None, target=None):
+        '''
+        Creates a data comparator whose error sinks match the report settings of this migration report.
+        :param comparatorClass: the DataComparator class to instantiate.
+        :param tablename: the table it will compare in a multi-table comparison, its reports go into a
+                            sub-directory named after it.
+        :param target: name of the target database in an N-way comparison, its reports go into a sub-directory
+                            named after it.
+        :return: the new data comparator.
+        '''
+        # raw COPY rows are only decoded once they reach a report.
+        rowDecoder = decodeCopyRow if self.copy else None
+        reportPath = os.path.join(target or '', tablename or '')
+        reportDir = os.path.join(self.reportDir, reportPath)
+        if (self.reportFormat in ArrowErrorSink.FORMATS):
+            compression = 'gzip' if self.compressErrors is True else (self.compressErrors or None)
+            dataComparator = comparatorClass(ArrowErrorSinkFactory(reportDir, self.reportFormat, compression),
+                                             rowDecoder)
+        elif (not self.streamErrors):
+            dataComparator = comparatorClass(partial(ListErrorSink, diffs=self.corruptionDiffs), rowDecoder)
+        else:
+            # report files written before a crash are kept and cut back to the checkpoint when resuming.
+            resume = bool(self.resume and self.checkpointDir)
+            dataComparator = comparatorClass(CsvErrorSinkFactory(reportDir, self.compressErrors, resume=resume,
+                                                                 diffs=self.corruptionDiffs), rowDecoder)
+        if (self.profileStages):
+            profiler = CProfileHook(self.profileStages)
+            dataComparator.metrics.addHook(profiler)
+            self.profilers[reportPath] = profiler
+        return dataComparator
+
+    def makeChunkSizer(self, n, prefetch=0, shards=1):
+        '''
+        Creates the ChunkSizer of a table when adaptive chunk sizing is enabled.
+        :param n: the initial chunk size.
+        :param prefetch: number of chunks read ahead from each database.
+        :param shards: number of primary key ranges of the table read at the same time.
+        :return: a ChunkSizer, or None when chunks keep a fixed size.
+        '''
+        if (not self.chunkMemory):
+            return None
+        # per database: the prefetch queue, the chunk being compared and the one being fetched.
+        chunksInFlight = 2 * (prefetch + 2) * max(1, shards) * max(1, self.concurrentTables)
+        return ChunkSizer(n, self.chunkMemory, chunksInFlight)
+
+    def makeCheckpoint(self, tablename):
+        '''
+        Creates the Checkpoint of a table when checkpointing is enabled.
+        :param tablename: the table being compared.
+        :return: a Checkpoint, or None.
+        '''
+        if (not self.checkpointDir):
+            return None
+        return Checkpoint(os.path.join(self.checkpointDir, tablename + ".checkpoint"), self.checkpointInterval)
 
     def closeAll(self):
         '''
-        Closes all the connections made via psycopg2 and deletes the docker processes.
+        Closes all the connections made via psycopg2 and deletes the docker processes it started.
         :return:
         '''
         for psycoconnection in self.connections:
             psycoconnection.close()
-        for container in self.containers:
-            container.kill()
+        closePools()
+        self.containerManager.stopAll()
 
     def testData(self):
         '''
@@ -128,42 +310,787 @@ class MigrationReport:
                 if (len(out) > 0):
                     response = True
 
-    def compareData(self, n, dataComparator):
+    def compareData(self, n, dataComparator, prefetch=0, shards=1):
         '''
-        We limit this application to 2 databases at a time, but make it easy to configure to many in series.
+        Compares the first two databases. To check one source against several targets in a single pass over the
+        source, see compareTargets().
 
 
         :param n: size of data chunk from databases.
         :param dataComparator: a DataComparator() object that produces a running report of all errors encountered
                                 between database information chunks.
+        :param prefetch: number of chunks to read ahead from each database on background threads. With 0 the
+                            databases are read one after the other on the calling thread.
+        :param shards: number of primary key ranges compared in parallel worker processes.
         :return:
         '''
-        response = True
         self.dataComparator = dataComparator
+        dataComparator.bindConnections(self.connections[0], self.connections[1])
+        if (shards > 1):
+            self.compareShards(self.connections, n, dataComparator, shards)
+        else:
+            self.streamTable(self.connections, n, dataComparator, prefetch)
 
-        adata = self.connections[0].query("select * from %s order by id asc", n)
-        bData = self.connections[1].query("select * from %s order by id asc", n)
-        while (response):
-            response = False
+    def streamTable(self, connections, n, dataComparator, prefetch=0):
+        '''
+        Streams the table the two connections point at through the data comparator.
+        :param connections: the pre and post migration PsycoConnections, with their table name set.
+        :param n: size of data chunk from databases.
+        :param dataComparator: a DataComparator() object that records the errors.
+        :param prefetch: number of chunks to read ahead from each database on background threads.
+        :return:
+        '''
+        checkpoint = self.makeCheckpoint(connections[0].tablename)
+        lastKeys = (None, None)
+        if (checkpoint and self.resume):
+            checkpoint.restore(dataComparator)
+            if (checkpoint.finished):
+                print("Table %s was already compared, using its checkpoint." % connections[0].tablename)
+                return
+            lastKeys = (checkpoint.lastKeyA, checkpoint.lastKeyB)
+
+        # a resumed comparison carries on after the last row it read from each database.
+        self.startScans(connections[:2], n, lastKeys)
+        chunkSizer = self.makeChunkSizer(n, prefetch)
+        dataComparator.chunkSizer = chunkSizer
+        if (not prefetch):
+            if (chunkSizer):
+                dataComparator.compareStreams(partial(chunkSizer.fetch, connections[0].fetchNext),
+                                              partial(chunkSizer.fetch, connections[1].fetchNext), checkpoint)
+            else:
+                dataComparator.compareStreams(connections[0].fetchNext, connections[1].fetchNext, checkpoint)
+        else:
+            prefetchers = [ChunkPrefetcher(connections[0], prefetch, chunkSizer),
+                           ChunkPrefetcher(connections[1], prefetch, chunkSizer)]
+            try:
+                dataComparator.compareStreams(prefetchers[0].fetchNext, prefetchers[1].fetchNext, checkpoint)
+            finally:
+                for prefetcher in prefetchers:
+                    prefetcher.close()
+
+        if (checkpoint):
+            checkpoint.save(dataComparator, finished=True)
+
+    def discoverPrimaryKey(self, connections):
+        '''
+        Discovers the primary key of the table the connections point at from the catalog of the first database,
+        and sets it on every connection. When a column configuration applies to the table, the key reads the
+        configured columns only.
+        :param connections: PsycoConnections with their table name set, the first one is the source.
+        :return: the PrimaryKey.
+        '''
+        primaryKey = connections[0].discoverPrimaryKey()
+        for connection in connections[1:]:
+            if (connection.discoverPrimaryKey() != primaryKey):
+                print("Table %s has primary key %s in %s but %s in the source, comparing by the source's." %
+                      (connection.tablename, connection.primaryKey, connection.psqldb.dbname, primaryKey))
+        if (self.projection):
+            projection = self.projection.expressions(connections[0].tablename, connections[0].tableColumns(),
+                                                     primaryKey.columns)
+            if (projection is not None):
+                primaryKey = primaryKey.project(projection)
+        for connection in connections:
+            connection.primaryKey = primaryKey
+        return primaryKey
+
+    def startScans(self, connections, n, lastKeys=None):
+        '''
+        Starts reading the same table from several databases in the order of its primary key, which is discovered
+        from the catalog of the first database. Every row read has its primary key in row[0].
+        :param connections: PsycoConnections with their table name set, the first one is the source.
+        :param n: size of data chunk from databases.
+        :param lastKeys: for each connection, primary key of the last row already read or None.
+        :return: the PrimaryKey.
+        '''
+        primaryKey = self.discoverPrimaryKey(connections)
+        if (self.copy and primaryKey.composite):
+            raise ValueError("COPY extraction needs a single column primary key, %s has %s" %
+                             (connections[0].tablename, primaryKey))
+        if (self.keyset and any(primaryKey.collated)):
+            # each page would sort the rest of the table in the "C" collation, the key's index cannot serve it.
+            raise ValueError("Keyset pagination needs primary key columns in the C collation or of a type without "
+                             "one, %s has %s" % (connections[0].tablename, primaryKey))
+
+        for connection, lastKey in zip(connections, lastKeys if lastKeys else [None] * len(connections)):
+            if (self.keyset):
+                connection.keysetScan(n, lastKey)
+            elif (self.copy):
+                psqlQuery, params = primaryKey.selectQuery(lastKey)
+                connection.copyQuery(psqlQuery, n, params)
+            else:
+                connection.scanTable(n, lastKey)
+        return primaryKey
+
+    def openConnections(self, tablename, metrics=None):
+        '''
+        Opens a fresh pair of connections to the pre and post migration databases for a single table, so that
+        tables can be compared on separate threads.
+        :param tablename: the table the connections will read.
+        :param metrics: Metrics object the connect and query times of the connections are recorded in.
+        :return: list of the two PsycoConnections.
+        '''
+        connections = []
+        for psycoconnection in self.connections[:2]:
+            connection = PsycoConnection(psycoconnection.psqldb, self.streaming, self.itersize, metrics,
+                                         psycoconnection.pool)
+            connection.tablename = tablename
+            connections.append(connection)
+        return connections
+
+    def compareTable(self, tablename, n, dataComparator, prefetch=0, mode="full", leafSize=1000, shards=1):
+        '''
+        Compares one table on its own pair of connections.
+        :param tablename: the table to compare.
+        :param n: size of data chunk from databases.
+        :param dataComparator: a DataComparator() object that records the errors of this table.
+        :param prefetch: number of chunks to read ahead from each database on background threads.
+        :param mode: "full" to stream every row, "checksum" to only fetch the ranges that differ, "index" to check
+                        the post-migration table against the fingerprint index of the pre-migration table, "sample" to
+                        estimate the error rates from a sample, "digest" to compare row digests before fetching the
+                        rows that differ.
+        :param leafSize: checksum mode, largest differing range that is fetched instead of split further.
+        :param shards: full mode, number of primary key ranges compared in parallel worker processes.
+        :return: the data comparator, a new one if a sample comparison was escalated to a full scan.
+        '''
+        connections = self.openConnections(tablename, dataComparator.metrics)
+        dataComparator.bindConnections(connections[0], connections[1])
+        try:
+            if (mode == "full" and shards > 1):
+                self.compareShards(connections, n, dataComparator, shards)
+            elif (mode == "checksum"):
+                self.discoverPrimaryKey(connections)
+                RangeChecksum(connections[0], connections[1], leafSize).compare(dataComparator)
+            elif (mode == "index"):
+                self.compareIndex(connections, n, dataComparator)
+            elif (mode == "sample"):
+                dataComparator = self.compareSample(connections, n, dataComparator, prefetch, tablename)
+            elif (mode == "digest"):
+                self.compareDigest(connections, n, dataComparator)
+            else:
+                self.streamTable(connections, n, dataComparator, prefetch)
+        finally:
+            for connection in connections:
+                connection.close()
+        return dataComparator
+
+    def compareShards(self, connections, n, dataComparator, shards):
+        '''
+        Splits the table the connections point at into primary key ranges and compares each range in its own worker
+        process, with its own connections and data comparator. The results are merged into dataComparator in
+        primary key order.
+
+        Every worker reading a server sees the snapshot exported by the given connection to that server, so all
+        ranges reflect the same instant even while the databases are being written to. The ranges are cut on the
+        primary key discovered from the catalog of the first database, see TableSharder, and read with the column
+        projection of the table.
+        :param connections: the pre and post migration PsycoConnections, with their table name set. They hold the
+                            exported snapshots until the comparison is done.
+        :param n: size of data chunk from databases.
+        :param dataComparator: a DataComparator() object the results of every range are merged into.
+        :param shards: the number of primary key ranges.
+        :return:
+        '''
+        primaryKey = self.discoverPrimaryKey(connections)
+        ranges = TableSharder(connections[0], connections[1]).shardRanges(shards)
+        snapshots = [connection.exportSnapshot() for connection in connections]
+
+        sinkFactory = dataComparator.sinkFactory
+        chunkSizer = self.makeChunkSizer(n, 0, len(ranges))
+        # workers are spawned rather than forked: a fork copies the locks held by the threads comparing other
+        # tables (connection pools, metrics, prefetchers) and a worker could wait on them forever.
+        with ProcessPoolExecutor(max_workers=min(len(ranges), os.cpu_count() or 1),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = []
+            for shard, (lo, hi) in enumerate(ranges):
+                # streamed errors are written to a file per shard and appended to the table's files afterwards.
+                shardSinkFactory = sinkFactory.forShard(shard) if hasattr(sinkFactory, 'forShard') else sinkFactory
+                futures.append(pool.submit(compareShard, connections[0].psqldb, connections[1].psqldb,
+                                           connections[0].tablename, lo, hi, n, type(dataComparator),
+                                           shardSinkFactory, snapshots, self.streaming, self.itersize, self.copy,
+                                           chunkSizer, primaryKey, self.poolSize, self.retryPolicy))
+            for future in futures:
+                dataComparator.merge(future.result())
+
+    def compareTables(self, n, comparatorClass=DataComparator, workers=4, prefetch=0, mode="full", leafSize=1000,
+                      shards=1):
+        '''
+        Compares every table the two databases share, running up to `workers` tables at the same time.
+        Each table gets its own data comparator and its own section in the final report.
+        :param n: size of data chunk from databases.
+        :param comparatorClass: the DataComparator class to instantiate for every table.
+        :param workers: the maximum number of tables compared concurrently.
+        :param prefetch: number of chunks to read ahead from each database on background threads.
+        :param mode: "full" to stream every row, "checksum" to only fetch the ranges that differ, "index" to check
+                        the post-migration table against the fingerprint index of the pre-migration table.
+        :param leafSize: checksum mode, largest differing range that is fetched instead of split further.
+        :param shards: full mode, number of primary key ranges each table is split into.
+        :return:
+        '''
+        self.tableComparators = {}
+        self.tableFailures = {}
+        self.concurrentTables = min(max(1, workers), max(1, len(self.tableNames)))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {}
+            for tablename in self.tableNames:
+                futures[tablename] = pool.submit(self.compareTable, tablename, n,
+                                                 self.makeComparator(comparatorClass, tablename), prefetch, mode,
+                                                 leafSize, shards)
+
+            for tablename in self.tableNames:
+                try:
+                    self.tableComparators[tablename] = futures[tablename].result()
+                except Exception as e:
+                    # one broken table should not throw away the results of the others.
+                    print("Comparison of table %s failed: %s" % (tablename, e))
+                    self.tableFailures[tablename] = e
+
+    def compareTablesAsync(self, n, comparatorClass=DataComparator, workers=16):
+        '''
+        Compares every table the two databases share from a single thread, with asynchronous connections on one
+        event loop instead of a thread per table. See AsyncComparisonDriver.
+
+        The primary key of every table, and its column projection, is discovered first on regular connections. The
+        tables are then read as in full mode, without checkpoints, COPY, keyset pagination or prefetch threads, and
+        the compact engine cannot be used since it re-fetches rows on a blocking connection.
+        :param n: size of data chunk from databases.
+        :param comparatorClass: the DataComparator class to instantiate for every table.
+        :param workers: the maximum number of tables compared concurrently.
+        :return:
+        '''
+        if (issubclass(comparatorClass, CompactDataComparator)):
+            raise ValueError("the compact engine re-fetches rows on a blocking connection, it cannot be used with "
+                             "asynchronous comparisons")
+        self.tableComparators = {}
+        self.tableFailures = {}
+        psqldbA = self.connections[0].psqldb
+        psqldbB = self.connections[1].psqldb
+        jobs = []
+        tableNames = []
+        for tablename in self.tableNames:
+            dataComparator = self.makeComparator(comparatorClass, tablename)
+            connections = self.openConnections(tablename, dataComparator.metrics)
+            try:
+                primaryKey = self.discoverPrimaryKey(connections)
+            except Exception as e:
+                print("Comparison of table %s failed: %s" % (tablename, e))
+                self.tableFailures[tablename] = e
+                continue
+            finally:
+                for connection in connections:
+                    connection.close()
+            jobs.append((psqldbA, psqldbB, tablename, dataComparator, primaryKey))
+            tableNames.append(tablename)
+
+        results = AsyncComparisonDriver(workers).run(jobs, n)
+        for tablename, result in zip(tableNames, results):
+            if (isinstance(result, Exception)):
+                print("Comparison of table %s failed: %s" % (tablename, result))
+                self.tableFailures[tablename] = result
+            else:
+                self.tableComparators[tablename] = result
+
+    def targetName(self, connection):
+        '''
+        :param connection: PsycoConnection to a target database.
+        :return: the name of the target in N-way reports, unique because every server has its own port.
+        '''
+        return "%s-%d" % (connection.psqldb.dbname, connection.psqldb.port)
+
+    def compareTargets(self, n, comparatorClass=DataComparator, workers=4, prefetch=2):
+        '''
+        N-way comparison: compares every table of the first database of the initialization file against the same
+        table in each of the other databases. Each table of the source is read once and every chunk is fanned out to
+        one data comparator per target, while all targets are read at the same time. See MultiTargetComparator.
+        :param n: size of data chunk from databases.
+        :param comparatorClass: the DataComparator class to instantiate for every target and table.
+        :param workers: the maximum number of tables compared concurrently.
+        :param prefetch: number of chunks read ahead from every database on background threads, at least 1 so the
+                            targets are read in parallel.
+        :return:
+        '''
+        targets = self.connections[1:]
+        names = [self.targetName(connection) for connection in targets]
+        self.targetComparators = dict((name, {}) for name in names)
+        self.targetFailures = dict((name, {}) for name in names)
+        sourceTables = self.serverTables[0]
+        self.targetMissingTables = dict((name, sorted(sourceTables - tables))
+                                        for name, tables in zip(names, self.serverTables[1:]))
+
+        tableNames = sorted(sourceTables & set().union(*self.serverTables[1:]))
+        self.concurrentTables = min(max(1, workers), max(1, len(tableNames)))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {}
+            for tablename in tableNames:
+                # targets without the table are left out of its comparison.
+                tableTargets = [i for i, tables in enumerate(self.serverTables[1:]) if tablename in tables]
+                comparators = [self.makeComparator(comparatorClass, tablename, names[i]) for i in tableTargets]
+                futures[tablename] = (tableTargets, pool.submit(self.compareTableTargets, tablename,
+                                                                [targets[i] for i in tableTargets], n,
+                                                                comparators, prefetch))
+
+            for tablename in tableNames:
+                tableTargets, future = futures[tablename]
+                try:
+                    for i, dataComparator in zip(tableTargets, future.result()):
+                        self.targetComparators[names[i]][tablename] = dataComparator
+                except Exception as e:
+                    print("N-way comparison of table %s failed: %s" % (tablename, e))
+                    for i in tableTargets:
+                        self.targetFailures[names[i]][tablename] = e
+
+    def compareTableTargets(self, tablename, targets, n, comparators, prefetch=2):
+        '''
+        Compares one table of the source against the same table in several targets, on fresh connections.
+        :param tablename: the table to compare.
+        :param targets: PsycoConnections of the target databases that have the table.
+        :param n: size of data chunk from databases.
+        :param comparators: one data comparator per target.
+        :param prefetch: number of chunks read ahead from every database.
+        :return: the data comparators.
+        '''
+        connections = []
+        prefetchers = []
+        try:
+            for psycoconnection, dataComparator in zip([self.connections[0]] + targets,
+                                                       comparators[:1] + comparators):
+                connection = PsycoConnection(psycoconnection.psqldb, self.streaming, self.itersize,
+                                             dataComparator.metrics, psycoconnection.pool)
+                connection.tablename = tablename
+                connections.append(connection)
+            for connection, dataComparator in zip(connections[1:], comparators):
+                dataComparator.bindConnections(connections[0], connection)
+
+            # the chunk memory budget is shared by the source and every target.
+            chunkSizer = self.makeChunkSizer(n, max(1, prefetch), (len(connections) + 1) // 2)
+            self.startScans(connections, n)
+            for connection in connections:
+                prefetchers.append(ChunkPrefetcher(connection, max(1, prefetch), chunkSizer))
+            for dataComparator in comparators:
+                dataComparator.chunkSizer = chunkSizer
+
+            MultiTargetComparator(comparators).compareStreams(prefetchers[0].fetchNext,
+                                                              [prefetcher.fetchNext for prefetcher in prefetchers[1:]])
+        finally:
+            for prefetcher in prefetchers:
+                prefetcher.close()
+            for connection in connections:
+                connection.close()
+        return comparators
+
+    def compareSample(self, connections, n, dataComparator, prefetch=0, tablename=None):
+        '''
+        Estimates the error rates of the table the connections point at from a sample, see TableSampler. With
+        escalation enabled, a table whose sample holds any error is then compared in full by a new data comparator,
+        whose report also shows the sample's estimates.
+        :param connections: the pre and post migration PsycoConnections, with their table name set.
+        :param n: number of sampled rows handled at a time, and size of data chunk of a full scan.
+        :param dataComparator: a DataComparator() object that records the errors of the sampled rows.
+        :param prefetch: number of chunks to read ahead from each database during a full scan.
+        :param tablename: the table in a multi-table comparison, None for a single table comparison.
+        :return: the data comparator holding the final results.
+        '''
+        self.discoverPrimaryKey(connections)
+        sampler = TableSampler(connections[0], connections[1], self.sampleMethod, self.samplePercent,
+                               self.sampleSeed, self.sampleRanges, self.sampleRangeSize, self.confidence)
+        sampler.compare(dataComparator, n)
+        dataComparator.sampler = sampler
+        if (not self.escalate or not sampler.errorsFound()):
+            return dataComparator
+
+        print("Sample of table %s holds %d errors, comparing it in full." %
+              (connections[0].tablename, sampler.numCorruptionErrors + sampler.numCopyOmissionErrors +
+               sampler.numCreationErrors))
+        # streamed sample errors are superseded by the full scan, which rewrites the same report files.
+        for sink in dataComparator.errorSinks():
+            if (hasattr(sink, 'close')):
+                sink.close()
+        fullComparator = self.makeComparator(type(dataComparator), tablename)
+        fullComparator.bindConnections(connections[0], connections[1])
+        fullComparator.sampler = sampler
+        self.streamTable(connections, n, fullComparator, prefetch)
+        return fullComparator
+
+    def compareSampled(self, dataComparator, n, prefetch=0):
+        '''
+        Single table sample comparison. See compareSample().
+        :param dataComparator: a DataComparator() object that records the errors of the sampled rows.
+        :param n: number of sampled rows handled at a time, and size of data chunk of a full scan.
+        :param prefetch: number of chunks to read ahead from each database during a full scan.
+        :return:
+        '''
+        dataComparator.bindConnections(self.connections[0], self.connections[1])
+        self.dataComparator = self.compareSample(self.connections, n, dataComparator, prefetch)
 
-            a = self.connections[0].fetchNext()
-            b = self.connections[1].fetchNext()
-            dataComparator.prepareDataChunks(a, b)
+    def compareDigest(self, connections, n, dataComparator):
+        '''
+        Compares the table the connections point at by primary key and row digest first, and fetches the full rows
+        of the keys whose digests differ only. See DigestPrePass.
+        :param connections: the pre and post migration PsycoConnections, with their table name set.
+        :param n: number of digests fetched at a time.
+        :param dataComparator: a DataComparator() object that records the errors.
+        :return:
+        '''
+        self.discoverPrimaryKey(connections)
+        prePass = DigestPrePass(connections[0], connections[1])
+        prePass.compare(dataComparator, n)
+        print("Digest comparison of %s digested %d rows and fetched %d rows." %
+              (connections[0].tablename, prePass.rowsDigested, prePass.fetchedA + prePass.fetchedB))
 
-            if (len(a) > 0 or len(b) > 0):
-                response = True
-        dataComparator.finish()
+    def compareDigests(self, dataComparator, n):
+        '''
+        Single table digest comparison. See compareDigest().
+        :param dataComparator: a DataComparator() object that records the errors.
+        :param n: number of digests fetched at a time.
+        :return:
+        '''
+        self.dataComparator = dataComparator
+        dataComparator.bindConnections(self.connections[0], self.connections[1])
+        self.compareDigest(self.connections, n, dataComparator)
 
-    def generateReport(self):
-        self.dataComparator.produceReports()
+    def compareChecksums(self, dataComparator, leafSize=1000, fanout=16):
+        '''
+        Compares the two databases by checksumming primary key ranges on each server and only transferring
+        the rows of ranges whose checksums disagree. See RangeChecksum.
+        :param dataComparator: a DataComparator() object that produces a running report of all errors encountered
+                                within the differing ranges.
+        :param leafSize: largest differing range, in rows, that is fetched instead of split further.
+        :param fanout: number of sub-ranges a differing range is split into.
+        :return:
+        '''
+        self.dataComparator = dataComparator
+        dataComparator.bindConnections(self.connections[0], self.connections[1])
+        self.discoverPrimaryKey(self.connections)
+        checksum = RangeChecksum(self.connections[0], self.connections[1], leafSize, fanout)
+        checksum.compare(dataComparator)
+        print("Checksum comparison used %d aggregate queries and fetched %d rows." %
+              (checksum.aggregateQueries, checksum.rowsFetched))
+
+    def openFingerprintIndex(self, connection, n):
+        '''
+        Opens the fingerprint index of the table a pre-migration connection points at, building it first if it does
+        not exist yet, a rebuild was asked for, or the index was built from another source (see sourceIdentity).
+        Indexes are kept per source database, in <indexDir>/<database>-<port>/<table>.fpidx.
+        :param connection: PsycoConnection to the pre-migration database, with its table name and primary key set.
+        :param n: number of digests fetched at a time while building.
+        :return: the FingerprintIndex.
+        '''
+        path = os.path.join(self.indexDir, "%s-%s" % (connection.psqldb.dbname, connection.psqldb.port),
+                            connection.tablename + ".fpidx")
+        identity = sourceIdentity(connection)
+        if (not self.rebuildIndex and os.path.exists(path)):
+            try:
+                return FingerprintIndex(path, identity)
+            except ValueError as e:
+                print("Rebuilding fingerprint index: %s" % e)
+        print("Building fingerprint index %s" % path)
+        return buildFingerprintIndex(connection, path, n, identity)
+
+    def compareIndex(self, connections, n, dataComparator):
+        '''
+        Checks the post-migration table against the fingerprint index of the pre-migration table. The pre-migration
+        database is only read to build a missing index and to fetch the rows that differ. See FingerprintIndex.
+        :param connections: the pre and post migration PsycoConnections, with their table name set.
+        :param n: number of digests fetched at a time.
+        :param dataComparator: a DataComparator() object that records the errors.
+        :return:
+        '''
+        self.discoverPrimaryKey(connections)
+        index = self.openFingerprintIndex(connections[0], n)
+        try:
+            index.compare(connections[0], connections[1], dataComparator, n)
+        finally:
+            index.close()
+        print("Index comparison of %s matched %d rows and fetched %d rows." %
+              (connections[0].tablename, index.rowsMatched, index.rowsFetched))
+
+    def compareIndexed(self, dataComparator, n):
+        '''
+        Single table comparison against the fingerprint index of the pre-migration table. See compareIndex().
+        :param dataComparator: a DataComparator() object that records the errors.
+        :param n: number of digests fetched at a time.
+        :return:
+        '''
+        self.dataComparator = dataComparator
+        dataComparator.bindConnections(self.connections[0], self.connections[1])
+        self.compareIndex(self.connections, n, dataComparator)
+
+    def generateReport(self, reportDir=None):
+        '''
+        Writes the reports of the last comparison. A multi-table comparison writes a combined summary with one
+        section per table, and the error files of each table into a sub-directory named after it.
+        :param reportDir: directory the reports are written into, defaults to the one given on construction.
+        :return:
+        '''
+        reportDir = reportDir if reportDir else self.reportDir
+        if (self.targetComparators):
+            self.generateTargetReport(reportDir)
+            return
+        if (not self.tableComparators and not self.tableFailures):
+            self.dataComparator.produceReports(reportDir)
+            self.writeMetrics(reportDir)
+            return
+
+        os.makedirs(reportDir, exist_ok=True)
+        with open(os.path.join(reportDir, "migration-report.txt"), 'w') as f:
+            f.write('*' * 80 + '\n')
+            f.write("Migration Report\n")
+            f.write('*' * 80 + '\n\n')
+
+            f.write("Tables Compared:\t%d\n" % len(self.tableComparators))
+            f.write("Tables Failed:\t\t%d\n" % len(self.tableFailures))
+            f.write("Tables Missing From Post-migration:\t%d\n" % len(self.missingTables))
+            for tablename in self.missingTables:
+                f.write("\t%s\n" % tablename)
+            f.write("Tables Created in Post-migration:\t%d\n" % len(self.extraTables))
+            for tablename in self.extraTables:
+                f.write("\t%s\n" % tablename)
+
+            for tablename in self.tableNames:
+                f.write('\n' + '-' * 80 + '\n')
+                f.write("Table: %s\n" % tablename)
+                f.write('-' * 80 + '\n\n')
+                if (tablename in self.tableFailures):
+                    f.write("Comparison failed: %s\n" % self.tableFailures[tablename])
+                else:
+                    self.tableComparators[tablename].writeSummary(f)
+
+        for tablename, dataComparator in self.tableComparators.items():
+            dataComparator.produceReports(os.path.join(reportDir, tablename))
+        with open(os.path.join(reportDir, "summary.json"), 'w') as f:
+            json.dump({'tables': dict((tablename, dataComparator.summary())
+                                      for tablename, dataComparator in self.tableComparators.items()),
+                       'failedTables': dict((tablename, str(failure))
+                                            for tablename, failure in self.tableFailures.items()),
+                       'missingTables': self.missingTables,
+                       'extraTables': self.extraTables}, f, indent=2)
+        self.writeMetrics(reportDir)
+
+    def generateTargetReport(self, reportDir):
+        '''
+        Writes the reports of an N-way comparison: a combined summary with one section per target, holding a
+        section per table, and the error files of each target and table into reportDir/<target>/<table>/.
+        :param reportDir: directory the reports are written into.
+        :return:
+        '''
+        os.makedirs(reportDir, exist_ok=True)
+        with open(os.path.join(reportDir, "migration-report.txt"), 'w') as f:
+            f.write('*' * 80 + '\n')
+            f.write("Migration Report\n")
+            f.write('*' * 80 + '\n\n')
+            f.write("Source:\t\t%s\n" % self.targetName(self.connections[0]))
+            f.write("Targets:\t%d\n" % len(self.targetComparators))
+
+            for target, comparators in self.targetComparators.items():
+                failures = self.targetFailures[target]
+                f.write('\n' + '=' * 80 + '\n')
+                f.write("Target: %s\n" % target)
+                f.write('=' * 80 + '\n\n')
+                f.write("Tables Compared:\t%d\n" % len(comparators))
+                f.write("Tables Failed:\t\t%d\n" % len(failures))
+                f.write("Tables Missing From Target:\t%d\n" % len(self.targetMissingTables[target]))
+                for tablename in self.targetMissingTables[target]:
+                    f.write("\t%s\n" % tablename)
+
+                for tablename in sorted(set(comparators) | set(failures)):
+                    f.write('\n' + '-' * 80 + '\n')
+                    f.write("Table: %s\n" % tablename)
+                    f.write('-' * 80 + '\n\n')
+                    if (tablename in failures):
+                        f.write("Comparison failed: %s\n" % failures[tablename])
+                    else:
+                        comparators[tablename].writeSummary(f)
+
+        for target, comparators in self.targetComparators.items():
+            for tablename, dataComparator in comparators.items():
+                dataComparator.produceReports(os.path.join(reportDir, target, tablename))
+        targets = {}
+        for target, comparators in self.targetComparators.items():
+            targets[target] = {'tables': dict((tablename, dataComparator.summary())
+                                              for tablename, dataComparator in comparators.items()),
+                               'failedTables': dict((tablename, str(failure))
+                                                    for tablename, failure in self.targetFailures[target].items()),
+                               'missingTables': self.targetMissingTables[target]}
+        with open(os.path.join(reportDir, "summary.json"), 'w') as f:
+            json.dump({'source': self.targetName(self.connections[0]), 'targets': targets}, f, indent=2)
+        self.writeMetrics(reportDir)
+
+    def reportedComparators(self):
+        '''
+        :return: dictionary of report sub-directory to the data comparator whose reports are written there.
+        '''
+        if (self.targetComparators):
+            return dict((os.path.join(target, tablename), dataComparator)
+                        for target, comparators in self.targetComparators.items()
+                        for tablename, dataComparator in comparators.items())
+        if (self.tableComparators):
+            return dict(self.tableComparators)
+        return {'': self.dataComparator} if self.dataComparator else {}
+
+    def writeMetrics(self, reportDir):
+        '''
+        Writes metrics.json next to the migration report: the timings of the run added up with those of every
+        comparison, and for a multi-table comparison the metrics of each table under "tables". Each table's own
+        metrics.json is written with its report. The cProfile profiles of the comparisons are written as well.
+        :param reportDir: directory the reports are written into.
+        :return:
+        '''
+        self.metrics.stop()
+        comparators = self.reportedComparators()
+        total = Metrics()
+        total.merge(self.metrics)
+        for dataComparator in comparators.values():
+            total.merge(dataComparator.metrics)
+        # the tables ran side by side, rates are over the duration of the whole run.
+        total.elapsed = self.metrics.elapsed
+        extra = None
+        if ('' not in comparators):
+            extra = {'tables': dict((path, dataComparator.metrics.toDict())
+                                    for path, dataComparator in comparators.items())}
+        total.write(os.path.join(reportDir, "metrics.json"), extra)
+
+        for path, profiler in self.profilers.items():
+            if (path in comparators):
+                profiler.dump(os.path.join(reportDir, path, "profile.prof"))
 
 if __name__ == "__main__":
-    mr = MigrationReport("init.txt")
+    parser = argparse.ArgumentParser(description="Verify a postgres migration between docker images.")
+    parser.add_argument("--inifile", default="init.txt", help="csv of <user>,<database>,<password>,<docker_image>")
+    parser.add_argument("--chunk-size", type=int, default=100, help="rows fetched from each database at a time")
+    parser.add_argument("--engine", choices=sorted(COMPARATORS), default="hash",
+                        help="hash buffers unmatched rows in hashmaps, merge walks both ordered tables in step, "
+                             "vector compares whole columns with numpy, compact buffers row digests only")
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="chunks read ahead from each database on background threads (default 2), 0 disables "
+                             "prefetching")
+    parser.add_argument("--workers", type=int, default=4, help="number of tables compared at the same time")
+    parser.add_argument("--single-table", action="store_true",
+                        help="only compare the first table both databases share")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="full mode: primary key ranges each table is split into and compared in worker processes")
+    parser.add_argument("--stream-errors", action="store_true",
+                        help="write errors into the report files as they are found instead of keeping them in memory")
+    parser.add_argument("--gzip", action="store_true", help="gzip the streamed error files, same as --compress gzip")
+    parser.add_argument("--compress", choices=["gzip", "zstd"], default=None,
+                        help="compress the streamed error files, or the codec of parquet and arrow error files")
+    parser.add_argument("--report-format", choices=["csv", "parquet", "arrow"], default="csv",
+                        help="format of the error files, parquet and arrow (Arrow IPC) are always streamed and need "
+                             "pyarrow")
+    parser.add_argument("--corruption-rows", action="store_true",
+                        help="report both full rows of each corruption error instead of the columns that differ")
+    parser.add_argument("--copy", action="store_true",
+                        help="full mode: extract tables with COPY and compare rows as raw text")
+    parser.add_argument("--mode", choices=["full", "checksum", "index", "sample", "digest"], default="full",
+                        help="full transfers every row, checksum only transfers primary key ranges that differ, "
+                             "index checks the post-migration tables against fingerprint indexes of the "
+                             "pre-migration tables, sample estimates the error rates from a sample of the rows, "
+                             "digest transfers primary keys and row digests, and full rows only where they differ")
+    parser.add_argument("--leaf-size", type=int, default=1000,
+                        help="checksum mode: largest differing range, in rows, fetched instead of split further")
+    parser.add_argument("--chunk-memory", type=int, default=0,
+                        help="memory budget in MB for fetched chunks, tunes the chunk size while tables are read "
+                             "(--chunk-size is the starting size), 0 keeps the chunk size fixed")
+    parser.add_argument("--startup-timeout", type=float, default=60.0,
+                        help="seconds each postgres container may take to accept connections")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="directory the progress of each table is periodically saved into")
+    parser.add_argument("--checkpoint-interval", type=float, default=300.0, help="seconds between checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on from the checkpoints in --checkpoint-dir instead of starting over")
+    parser.add_argument("--index-dir", default="../indexes/", help="index mode: directory of the fingerprint indexes")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="index mode: rebuild the fingerprint indexes from the pre-migration database")
+    parser.add_argument("--async", dest="asynchronous", action="store_true",
+                        help="full mode: compare the tables from one thread with asynchronous connections, "
+                             "--workers tables at a time")
+    parser.add_argument("--nway", action="store_true",
+                        help="full mode: compare the first database of the inifile against every other one, reading "
+                             "each source table once")
+    parser.add_argument("--sample-method", choices=list(TableSampler.METHODS), default="bernoulli",
+                        help="sample mode: TABLESAMPLE BERNOULLI or SYSTEM, or random primary key ranges")
+    parser.add_argument("--sample-percent", type=float, default=1.0,
+                        help="sample mode: percentage of the rows sampled by TABLESAMPLE")
+    parser.add_argument("--sample-seed", type=int, default=0, help="sample mode: seed of the sample")
+    parser.add_argument("--sample-ranges", type=int, default=100, help="sample mode: number of random key ranges")
+    parser.add_argument("--sample-range-size", type=int, default=1000,
+                        help="sample mode: rows per random key range")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="sample mode: confidence level of the estimated error rates")
+    parser.add_argument("--escalate", action="store_true",
+                        help="sample mode: compare a table in full when its sample holds any error")
+    parser.add_argument("--columns", default=None,
+                        help="JSON file of the columns compared in each table and their normalization, not with the "
+                             "checksum and index modes")
+    parser.add_argument("--keyset", action="store_true",
+                        help="full mode: read tables page by page in primary key order, each page in its own short "
+                             "transaction, instead of through a cursor held open for the whole table")
+    parser.add_argument("--pool-size", type=int, default=16,
+                        help="connections kept open to each server and reused across tables, at least --workers + 1")
+    parser.add_argument("--retries", type=int, default=5,
+                        help="times a failed connection, or a query whose connection broke, is retried")
+    parser.add_argument("--retry-backoff", type=float, default=0.5,
+                        help="seconds waited before the first retry, doubled for every further one")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="trace memory allocations and report their peak in metrics.json (slow)")
+    parser.add_argument("--profile", default="",
+                        help="comma separated comparator stages (fetch, prepare, process, flush, report) run under "
+                             "cProfile, written as profile.prof next to each report")
+    args = parser.parse_args()
+    if (args.copy and args.engine == "compact"):
+        parser.error("the compact engine re-fetches error rows while tables are read, which COPY does not allow")
+    if (args.report_format == "arrow" and (args.gzip or args.compress == "gzip")):
+        parser.error("arrow error files can only be compressed with zstd")
+    if (args.report_format != "csv" and args.resume):
+        parser.error("parquet and arrow error files cannot be cut back to a checkpoint, resume with csv reports")
+    if (args.columns and args.mode in ("checksum", "index")):
+        parser.error("the %s mode hashes whole rows on the server, it cannot be combined with --columns" % args.mode)
+    if (args.keyset and args.copy):
+        parser.error("--keyset reads pages with queries, it cannot be combined with --copy")
+    if (args.nway and (args.mode != "full" or args.single_table or args.shards > 1 or args.asynchronous)):
+        parser.error("--nway compares whole tables on threads, without --mode, --single-table, --shards or --async")
+    if (args.asynchronous and (args.mode != "full" or args.single_table or args.shards > 1 or args.copy or
+                               args.keyset or args.checkpoint_dir or args.prefetch is not None or
+                               args.chunk_memory)):
+        parser.error("--async reads whole tables in full mode one chunk pair ahead, without --mode, --single-table, "
+                     "--shards, --copy, --keyset, --checkpoint-dir, --prefetch or --chunk-memory")
+    if (args.asynchronous and args.engine == "compact"):
+        parser.error("the compact engine re-fetches error rows on a blocking connection, which --async does not allow")
+    prefetch = 2 if args.prefetch is None else args.prefetch
+
+    mr = MigrationReport(args.inifile, streaming=True, streamErrors=args.stream_errors,
+                         compressErrors=args.compress or args.gzip,
+                         copy=args.copy, chunkMemory=args.chunk_memory << 20,
+                         startupTimeout=args.startup_timeout, checkpointDir=args.checkpoint_dir,
+                         checkpointInterval=args.checkpoint_interval, resume=args.resume, indexDir=args.index_dir,
+                         rebuildIndex=args.rebuild_index, traceMemory=args.trace_memory,
+                         profileStages=[stage for stage in args.profile.split(',') if stage], keyset=args.keyset,
+                         sampleMethod=args.sample_method, samplePercent=args.sample_percent,
+                         sampleSeed=args.sample_seed, sampleRanges=args.sample_ranges,
+                         sampleRangeSize=args.sample_range_size, confidence=args.confidence, escalate=args.escalate,
+                         columnConfig=args.columns, poolSize=args.pool_size, retries=args.retries,
+                         retryBackoff=args.retry_backoff, reportFormat=args.report_format,
+                         corruptionDiffs=not args.corruption_rows)
 
-    # The migration report generator takes in a datacomparator object.
-    dc = DataComparator()
-    N = 100 # datachunk size
-    mr.compareData(N, dc)
+    N = args.chunk_size # datachunk size
+    if (args.single_table):
+        # The migration report generator takes in a datacomparator object.
+        dc = mr.makeComparator(COMPARATORS[args.engine])
+        if (args.mode == "checksum"):
+            mr.compareChecksums(dc, args.leaf_size)
+        elif (args.mode == "index"):
+            mr.compareIndexed(dc, N)
+        elif (args.mode == "sample"):
+            mr.compareSampled(dc, N, prefetch)
+        elif (args.mode == "digest"):
+            mr.compareDigests(dc, N)
+        else:
+            mr.compareData(N, dc, prefetch, args.shards)
+    elif (args.nway):
+        mr.compareTargets(N, COMPARATORS[args.engine], args.workers, prefetch)
+    elif (args.asynchronous):
+        mr.compareTablesAsync(N, COMPARATORS[args.engine], args.workers)
+    else:
+        mr.compareTables(N, COMPARATORS[args.engine], args.workers, prefetch, args.mode, args.leaf_size,
+                         args.shards)
     mr.generateReport()
     mr.closeAll()
 
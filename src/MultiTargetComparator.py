@@ -0,0 +1,55 @@
+import time
+
+
+class MultiTargetComparator:
+    '''
+    Compares one source table against the same table in several target databases from a single scan of the source.
+
+    Every target has a data comparator of its own, holding the leftover rows, counters and error sinks of that
+    pair. Each chunk read from the source is handed to every comparator together with the next chunk of its
+    target, so the source is read once however many targets there are. Any DataComparator subclass works, since
+    chunks are pushed through prepareDataChunks() exactly as in a pairwise comparison.
+
+    The source chunks are shared between the comparators and must not be modified by them.
+    '''
+
+    def __init__(self, comparators):
+        '''
+        :param comparators: one DataComparator per target, in the order of the target fetchers.
+        '''
+        self.comparators = list(comparators)
+
+    def compareStreams(self, fetchSource, fetchTargets):
+        '''
+        Drives the comparison of a source table against every target table. Chunks are pulled until the source and
+        every target are exhausted, then each comparator flushes its remaining mismatches.
+        :param fetchSource: callable returning the next chunk of rows of the source, or an empty list when done.
+        :param fetchTargets: one callable per comparator returning the next chunk of its target.
+        :return:
+        '''
+        if (len(fetchTargets) != len(self.comparators)):
+            raise ValueError("expected %d target fetchers, got %d" % (len(self.comparators), len(fetchTargets)))
+        sourceDone = False
+        targetsDone = [False] * len(fetchTargets)
+        while (not sourceDone or not all(targetsDone)):
+            a = []
+            if (not sourceDone):
+                start = time.perf_counter()
+                a = fetchSource()
+                seconds = time.perf_counter() - start
+                sourceDone = len(a) == 0
+                # every comparison waited for the source chunk and reads its rows.
+                for dataComparator in self.comparators:
+                    dataComparator.metrics.time('fetch', seconds)
+                    dataComparator.recordChunk(a, 'A')
+
+            for i, dataComparator in enumerate(self.comparators):
+                b = []
+                if (not targetsDone[i]):
+                    b = dataComparator.fetchChunk(fetchTargets[i], 'B')
+                    targetsDone[i] = len(b) == 0
+                if (len(a) > 0 or len(b) > 0):
+                    dataComparator.prepareDataChunks(a, b)
+
+        for dataComparator in self.comparators:
+            dataComparator.finish()
@@ -4,9 +4,12 @@ class PSQLServer:
     '''
     Plain python class that holds information for a Postgres Server running on docker.
     '''
-    def __init__(self, user, dbname, password, port):
+    def __init__(self, user, dbname, password, port, image=None, containerId=None):
         self.user = user
         self.dbname = dbname
         self.password = password
         self.port = port
+        # docker image the server runs from, and the id of the container running it once started.
+        self.image = image
+        self.containerId = containerId
 
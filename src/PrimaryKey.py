@@ -0,0 +1,188 @@
+class PrimaryKey:
+    '''
+    Primary key of a table, discovered from the catalog (pg_index / pg_attribute), and the queries that read the
+    table in primary key order.
+
+    The data comparators expect the primary key of every row in row[0]. A key made of the table's first column
+    already is, so such tables are read with a plain `select *`. Any other key is selected in front of the row:
+    a single column as (key, *row), several columns as ((key1, key2, ...), *row) once keyRow() has packed them
+    into a tuple. Composite keys therefore compare like python tuples, which is how postgres compares rows.
+
+    Keys of a collatable type (text, varchar...) are ordered with the "C" collation unless the column already uses
+    it, so that postgres orders them the way python compares strings. Such an order cannot use an index built
+    with another collation.
+
+    A projection (see ColumnProjection) replaces the rest of the row with a list of column expressions, the key
+    columns are then followed by those expressions only.
+
+    The key also records which of its columns are of an integer type, for readers that get keys as text (COPY).
+    '''
+
+    # key columns of a table in key order, whether they need an explicit "C" collation, their position and whether
+    # they are of an integer type.
+    DISCOVERY_QUERY = (
+        "select a.attname, a.attcollation <> 0 and coalesce(c.collname, '') not in ('C', 'POSIX'), a.attnum, "
+        "a.atttypid in ('int2'::regtype, 'int4'::regtype, 'int8'::regtype) "
+        "from pg_index i join pg_attribute a on a.attrelid = i.indrelid and a.attnum = any(i.indkey) "
+        "left join pg_collation c on c.oid = a.attcollation "
+        "where i.indrelid = %s::regclass and i.indisprimary "
+        "order by array_position(i.indkey::int2[], a.attnum)")
+
+    def __init__(self, columns, collated=None, leading=False, projection=None, integer=None):
+        '''
+        :param columns: names of the key columns, in key order.
+        :param collated: for each column, True when it must be ordered with the "C" collation.
+        :param leading: True when the key is the single, first column of the table.
+        :param projection: SQL expressions selected after the key columns instead of the whole row, or None.
+        :param integer: for each column, True when it is of an integer type.
+        '''
+        self.columns = list(columns)
+        self.collated = list(collated) if collated else [False] * len(self.columns)
+        self.leading = leading and len(self.columns) == 1
+        self.projection = list(projection) if projection is not None else None
+        self.integer = list(integer) if integer else [False] * len(self.columns)
+
+    def project(self, projection):
+        '''
+        :param projection: SQL expressions selected after the key columns instead of the whole row.
+        :return: a copy of this primary key that reads the projection.
+        '''
+        return PrimaryKey(self.columns, self.collated, self.leading, projection, self.integer)
+
+    @property
+    def composite(self):
+        return len(self.columns) > 1
+
+    def __eq__(self, other):
+        # only the key columns, two databases agree on a key whatever is selected with it.
+        return isinstance(other, PrimaryKey) and self.columns == other.columns
+
+    def __repr__(self):
+        return "PrimaryKey(%s)" % ', '.join(self.columns)
+
+    def expressions(self):
+        '''
+        :return: the SQL expression each key column is ordered and compared by.
+        '''
+        return [quoteIdentifier(column) + (' COLLATE "C"' if collated else '')
+                for column, collated in zip(self.columns, self.collated)]
+
+    def selectList(self):
+        '''
+        :return: the select list that puts the key in front of the row.
+        '''
+        keys = [quoteIdentifier(column) for column in self.columns]
+        if (self.projection is not None):
+            return ", ".join(keys + self.projection)
+        if (self.leading):
+            return "*"
+        return ", ".join(keys + ["t.*"])
+
+    def orderBy(self):
+        return ", ".join(self.expressions())
+
+    def after(self):
+        '''
+        :return: keyset predicate selecting the rows after a key, with one bound parameter per key column.
+        '''
+        return "(%s) > (%s)" % (", ".join(self.expressions()), ", ".join(["%%s"] * len(self.columns)))
+
+    def keyParams(self, key):
+        '''
+        :param key: a primary key as found in row[0].
+        :return: list of the bound parameters of the key.
+        '''
+        return list(key) if self.composite else [key]
+
+    def selectQuery(self, lastKey=None, lo=None, hi=None):
+        '''
+        Query that reads the whole table in key order, or the rows after lastKey, optionally within a key range.
+        :param lastKey: primary key of the last row already read, or None.
+        :param lo: smallest key of the range read, None for unbounded. Single column keys only.
+        :param hi: key the range read stops before, None for unbounded. Single column keys only.
+        :return: (query, params) for PsycoConnection.query, %s stands for the table name.
+        '''
+        conditions = []
+        params = []
+        if (lastKey is not None):
+            conditions.append(self.after())
+            params.extend(self.keyParams(lastKey))
+        if (lo is not None):
+            conditions.append("%s >= %%%%s" % self.expressions()[0])
+            params.append(lo)
+        if (hi is not None):
+            conditions.append("%s < %%%%s" % self.expressions()[0])
+            params.append(hi)
+        if (not conditions):
+            return "select %s from %%s t order by %s" % (self.selectList(), self.orderBy()), None
+        return ("select %s from %%s t where %s order by %s" % (self.selectList(), " and ".join(conditions),
+                                                               self.orderBy()), params)
+
+    def pageQuery(self, lastKey=None):
+        '''
+        Keyset pagination query returning the next page of rows after lastKey.
+        :param lastKey: primary key of the last row already read, or None for the first page.
+        :return: (query, params) whose last parameter is the page size, %s stands for the table name.
+        '''
+        query, params = self.selectQuery(lastKey)
+        return query + " limit %%s", params if params else []
+
+    def byKeysQuery(self, keys):
+        '''
+        Query that fetches the rows of the given keys.
+        :param keys: sequence of primary keys as found in row[0].
+        :return: (query, params), %s stands for the table name.
+        '''
+        if (self.composite):
+            predicate = "(%s) in %%%%s" % ", ".join(quoteIdentifier(column) for column in self.columns)
+            params = (tuple(tuple(key) for key in keys),)
+        else:
+            predicate = "%s = any(%%%%s)" % quoteIdentifier(self.columns[0])
+            params = (list(keys),)
+        return "select %s from %%s t where %s order by %s" % (self.selectList(), predicate, self.orderBy()), params
+
+    def keyRow(self, row):
+        '''
+        :param row: a row read with one of the queries above.
+        :return: the row with its primary key in row[0].
+        '''
+        if (self.composite):
+            n = len(self.columns)
+            return (tuple(row[:n]),) + tuple(row[n:])
+        return row
+
+    def keyRows(self, rows):
+        '''
+        :param rows: a chunk of rows read with one of the queries above.
+        :return: the chunk with the primary key of every row in row[0].
+        '''
+        if (self.composite):
+            return [self.keyRow(row) for row in rows]
+        return rows
+
+
+# the key assumed for tables without a primary key, an integer id.
+DEFAULT_PRIMARY_KEY = PrimaryKey(["id"], leading=True, integer=[True])
+
+
+def discoverPrimaryKey(cursor, tablename):
+    '''
+    Reads the primary key of a table from the catalog.
+    :param cursor: a psycopg2 cursor.
+    :param tablename: the table.
+    :return: its PrimaryKey, or None when the table has none.
+    '''
+    cursor.execute(PrimaryKey.DISCOVERY_QUERY, (tablename,))
+    rows = cursor.fetchall()
+    if (not rows):
+        return None
+    return PrimaryKey([row[0] for row in rows], [row[1] for row in rows], len(rows) == 1 and rows[0][2] == 1,
+                      integer=[row[3] for row in rows])
+
+
+def quoteIdentifier(name):
+    '''
+    :param name: a column name.
+    :return: the name quoted as a postgres identifier.
+    '''
+    return '"%s"' % name.replace('"', '""')
@@ -1,68 +1,415 @@
-import psycopg2
+from functools import partial
+
+from ConnectionPool import CONNECTION_ERRORS, connectionPool, connectionLost
+from CopyStream import CopyStream
+from Metrics import Metrics
+from PrimaryKey import DEFAULT_PRIMARY_KEY, discoverPrimaryKey
 
 
 class PsycoConnection:
     '''
     Custom wrapper for Psycopg2 connection with a postgres database. Facilitates making connections and
     maintaining cursors for ease of use.
+
+    The connection is checked out of the ConnectionPool of its server and given back by close(). When it breaks
+    (see connectionLost, other errors are raised at once), it is replaced with a new one and the operation retried
+    with backoff, as long as nothing read so far is lost:
+    scans in primary key order (scanTable, keysetScan) carry on after the last row handed out, and lookups such as
+    fetchByKeys() or execute() are simply run again. A plain query() or COPY being streamed cannot be resumed, so
+    then the error is raised. A resumed scan reads in a new transaction, or in the imported snapshot again.
     '''
 
-    def __init__(self, PSQLdb):
+    def __init__(self, PSQLdb, streaming=False, itersize=2000, metrics=None, pool=None):
+        '''
+        :param PSQLdb: the PSQLServer to connect to.
+        :param streaming: if true, queries run on named server-side cursors so that only the rows requested by
+                            fetchNext() are transferred to the client at any one time.
+        :param itersize: number of rows a server-side cursor transfers per network round trip when it is iterated.
+        :param metrics: Metrics object the connect and query times are recorded in, one of its own by default.
+        :param pool: the ConnectionPool the connection is checked out of, the process wide pool of the server
+                            by default.
+        '''
         self.psqldb = PSQLdb
         self.conn = None
-        self.establishConnections()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pool = pool if pool is not None else connectionPool(PSQLdb)
         self.cursor = None
         self.data = None
         self.tablename = ''
         self.n = 0
 
-        if (self.conn):
-            self.cursor = self.conn.cursor()
+        self.streaming = streaming
+        self.itersize = itersize
+        self.streamCursor = None
+        self.streamCount = 0
+        self.copyStream = None
+
+        # primary key of the table, see discoverPrimaryKey(). scanTable() and keysetScan() read in its order.
+        self.primaryKey = None
+        # set while the current query was started by scanTable(), whose rows need their key packed into row[0].
+        self.keyedScan = False
+        # keyset pagination state of keysetScan(): the key of the last row read, or None before the first page.
+        self.keyset = False
+        self.lastKey = None
+        # key range (lo, hi) of the scan started by scanTable(), kept when it is resumed.
+        self.scanRange = (None, None)
+        # set while a plain query() is open, whose rows cannot be found again after a reconnect.
+        self.plainQuery = False
+        # set when the connection was replaced during a scan, the next fetchNext() restarts it after lastKey.
+        self.resumeScan = False
+        # snapshot imported with useSnapshot(), imported again by a new connection.
+        self.snapshotId = None
 
-    def establishConnections(self):
+        self.establishConnections()
+
+    def establishConnections(self, retry=True):
         '''
-        Creates a connection to a postgres database via psycopg2.
+        Checks a connection to the postgres database out of the pool of its server.
+        :param retry: let the pool retry with backoff while the server cannot be reached.
         :return:
+        :raises psycopg2.OperationalError: if no connection could be made.
         '''
-        try:
-            print("Database: %s running on port %d" % (self.psqldb.dbname, self.psqldb.port))
-
-            conn = psycopg2.connect(
-                host="localhost",
-                database=self.psqldb.dbname,
-                user=self.psqldb.user,
-                password=self.psqldb.password,
-                port=self.psqldb.port
-            )
-            print("Psycopg2 connection established...")
-            self.conn = conn
-        except Exception as e:
-            print(e)
-
-    def query(self, psqlQuery:str, n=None):
+        with self.metrics.timer('connect'):
+            self.conn = self.pool.getconn(retry)
+        self.cursor = self.conn.cursor()
+
+    def reconnect(self, attempt, error):
+        '''
+        Replaces a connection that broke with a new one from the pool, see withRetry().
+        :param attempt: number of the retry.
+        :param error: the error the connection failed with.
+        :return:
+        '''
+        print("Connection to database %s on port %d lost (%s), reconnecting, retry %d of %d." %
+              (self.psqldb.dbname, self.psqldb.port, str(error).strip(), attempt, self.pool.retryPolicy.retries))
+        self.metrics.count('reconnects')
+        if (self.conn is not None):
+            self.pool.putconn(self.conn, broken=True)
+            self.conn = None
+        self.streamCursor = None
+        self.copyStream = None
+        self.resumeScan = self.resumeScan or self.keyedScan
+        # withRetry() is already retrying, a failed connection attempt counts as one of its attempts.
+        self.establishConnections(retry=False)
+        if (self.snapshotId):
+            self.importSnapshot()
+
+    def resumable(self):
+        '''
+        :return: True when the connection can be replaced without losing rows of the query being read.
+        '''
+        return not self.plainQuery and not self.copyStream
+
+    def withRetry(self, operation, resumable=True):
+        '''
+        Runs an operation, and when the connection breaks while it runs, replaces the connection and runs it again.
+        :param operation: callable without arguments.
+        :param resumable: False to raise the error of a broken connection at once.
+        :return: the result of the operation.
+        '''
+        if (not resumable):
+            return operation()
+        return self.pool.retryPolicy.call(operation, CONNECTION_ERRORS, self.reconnect, self.connectionLost)
+
+    def connectionLost(self, error):
+        '''
+        :param error: the error an operation failed with.
+        :return: True when the connection broke and is worth replacing, see ConnectionPool.connectionLost.
+        '''
+        return connectionLost(error) or (self.conn is not None and bool(self.conn.closed))
+
+    def query(self, psqlQuery:str, n=None, params=None):
         '''
         Queries a database with the given query string. Psycopg2 keeps track of the response in memory.
         :param psqlQuery: a string that contains postgres commands.
         :param n: size of the data chunk to increment.
+        :param params: optional sequence of bound parameters, marked with %%s in the query.
+        :return:
+        '''
+        if (self.streaming):
+            self.closeStream()
+        self.n = n
+        self.keyedScan = False
+        self.keyset = False
+        self.resumeScan = False
+        self.plainQuery = True
+        # nothing has been read yet, so a query whose connection broke is simply sent again.
+        self.withRetry(partial(self.startQuery, psqlQuery, n, params))
+
+    def startQuery(self, psqlQuery, n, params):
+        '''
+        Helper function that sends a query, see query().
+        :param psqlQuery: a string that contains postgres commands.
+        :param n: size of the data chunk to increment.
+        :param params: optional sequence of bound parameters.
+        :return:
+        '''
+        if (not self.streaming):
+            with self.metrics.timer('query'):
+                self.cursor.execute(psqlQuery % self.tablename, params)
+            return
+
+        # a client side cursor buffers the entire result set before returning anything, so in streaming mode
+        # we declare a named cursor and let postgres hold the result until we ask for it.
+        self.streamCount += 1
+        self.streamCursor = self.conn.cursor(name="migration_report_%d" % self.streamCount)
+        self.streamCursor.itersize = max(self.itersize, n or 0)
+        try:
+            with self.metrics.timer('query'):
+                self.streamCursor.execute(psqlQuery % self.tablename, params)
+        except Exception:
+            self.streamCursor = None
+            self.conn.rollback()
+            raise
+
+    def discoverPrimaryKey(self):
+        '''
+        Reads the primary key of the table from the catalog and keeps it in self.primaryKey. Tables without one are
+        assumed to be keyed by their `id` column.
+        :return: the PrimaryKey.
+        '''
+        primaryKey = self.withRetry(self.readPrimaryKey, self.resumable())
+        if (primaryKey is None):
+            print("Table %s has no primary key, assuming it is keyed by id." % self.tablename)
+            primaryKey = DEFAULT_PRIMARY_KEY
+        self.primaryKey = primaryKey
+        return primaryKey
+
+    def readPrimaryKey(self):
+        '''
+        Helper function of discoverPrimaryKey() that reads the key from the catalog.
+        '''
+        primaryKey = discoverPrimaryKey(self.cursor, self.tablename)
+        # the catalog query opened a transaction, which would otherwise hold its snapshot for the whole comparison.
+        self.conn.rollback()
+        return primaryKey
+
+    def tableColumns(self):
+        '''
+        :return: names of the columns of the table, in table order.
+        '''
+        return self.withRetry(self.readTableColumns, self.resumable())
+
+    def readTableColumns(self):
+        '''
+        Helper function of tableColumns() that reads the columns from the catalog.
+        '''
+        self.cursor.execute("select attname from pg_attribute where attrelid = %s::regclass and attnum > 0 "
+                            "and not attisdropped order by attnum", (self.tablename,))
+        columns = [row[0] for row in self.cursor.fetchall()]
+        self.conn.rollback()
+        return columns
+
+    def scanTable(self, n=None, lastKey=None, lo=None, hi=None):
+        '''
+        Starts reading the whole table in primary key order, or the rows after lastKey, with query(). Every row
+        returned by fetchNext() has its primary key in row[0].
+        :param n: size of the data chunk to increment.
+        :param lastKey: primary key of the last row already read, or None to start from the beginning.
+        :param lo: smallest key read, None for unbounded. Single column keys only.
+        :param hi: key the scan stops before, None for unbounded. Single column keys only.
+        :return:
+        '''
+        if (not self.primaryKey):
+            self.primaryKey = DEFAULT_PRIMARY_KEY
+        self.query(*self.primaryKey.selectQuery(lastKey, lo, hi), n=n)
+        self.scanRange = (lo, hi)
+        self.keyedScan = True
+        self.plainQuery = False
+        self.lastKey = lastKey
+
+    def keysetScan(self, n=None, lastKey=None):
+        '''
+        Starts reading the table in primary key order with keyset pagination: every fetchNext() runs its own short
+        query (where key > last key read order by key limit n) and commits, so no transaction or snapshot stays
+        open while the table is compared. Each page is read from the primary key index only when the key is ordered
+        in its own collation, a text key of another collation is sorted again for every page (see PrimaryKey), which
+        MigrationReport refuses. Rows written while the table is read may be seen on one side and not the other.
+        :param n: size of the data chunk to increment.
+        :param lastKey: primary key of the last row already read, or None to start from the beginning.
+        :return:
+        '''
+        self.closeStream()
+        if (not self.primaryKey):
+            self.primaryKey = DEFAULT_PRIMARY_KEY
+        self.n = n
+        self.keyset = True
+        self.lastKey = lastKey
+
+    def fetchPage(self, n):
+        '''
+        Helper function that reads the next page of a keyset scan in its own transaction.
+        :param n: number of rows wanted.
+        :return: list of rows, empty once the table is exhausted.
+        '''
+        psqlQuery, params = self.primaryKey.pageQuery(self.lastKey)
+        try:
+            with self.metrics.timer('query'):
+                self.cursor.execute(psqlQuery % self.tablename, params + [n])
+                rows = self.primaryKey.keyRows(self.cursor.fetchall())
+        finally:
+            self.conn.rollback()
+        if (rows):
+            self.lastKey = rows[-1][0]
+        return rows
+
+    def copyQuery(self, psqlQuery:str, n=None, params=None):
+        '''
+        Streams the result of a query with COPY instead of a cursor. fetchNext() then returns rows as
+        (primary key, raw bytes of the other columns) pairs, see CopyStream.
+        :param psqlQuery: a select statement, %s is replaced with the table name.
+        :param n: size of the data chunk to increment.
+        :param params: optional sequence of bound parameters, marked with %%s in the query.
         :return:
         '''
-        print(psqlQuery)
-        print(self.tablename)
-        self.cursor.execute(psqlQuery % self.tablename)
+        self.closeStream()
         self.n = n
+        boundQuery = self.cursor.mogrify(psqlQuery % self.tablename, params).decode('utf-8')
+        # keys arrive as text, only the catalog knows whether they are integers.
+        primaryKey = self.primaryKey if self.primaryKey else DEFAULT_PRIMARY_KEY
+        self.copyStream = CopyStream(self.conn.cursor(), boundQuery, integerKey=primaryKey.integer[0])
+
+    def execute(self, psqlQuery:str, params=None):
+        '''
+        Runs a query with bound parameters on the regular cursor and returns every resulting row. Meant for
+        small results such as aggregates or a bounded range of rows, and it discards any unread rows of a
+        previous non-streaming query.
+        :param psqlQuery: a string that contains postgres commands, %s is replaced with the table name and
+                            %%s marks a bound parameter.
+        :param params: sequence of parameters for the query.
+        :return: list of result rows.
+        '''
+        return self.withRetry(partial(self.executeQuery, psqlQuery, params), self.resumable())
+
+    def executeQuery(self, psqlQuery, params):
+        '''
+        Helper function of execute() that runs the query.
+        '''
+        self.cursor.execute(psqlQuery % self.tablename, params)
+        return self.cursor.fetchall()
+
+    def fetchByKeys(self, keys):
+        '''
+        Fetches the full rows of the given primary keys on a cursor of its own, so a query being streamed on the
+        same connection is left untouched.
+        :param keys: sequence of primary keys.
+        :return: list of the rows found, in primary key order.
+        '''
+        return self.withRetry(partial(self.readByKeys, keys), self.resumable())
+
+    def readByKeys(self, keys):
+        '''
+        Helper function of fetchByKeys() that runs the query.
+        '''
+        primaryKey = self.primaryKey if self.primaryKey else DEFAULT_PRIMARY_KEY
+        psqlQuery, params = primaryKey.byKeysQuery(keys)
+        with self.conn.cursor() as cursor:
+            cursor.execute(psqlQuery % self.tablename, params)
+            return primaryKey.keyRows(cursor.fetchall())
+
+    def exportSnapshot(self):
+        '''
+        Starts a repeatable read transaction and exports its snapshot, so other connections to the same server
+        can read exactly the same data. The transaction, and with it the snapshot, stays open until the
+        connection commits, rolls back or closes.
+        :return: the snapshot identifier.
+        '''
+        self.conn.rollback()
+        self.conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        self.cursor.execute("select pg_export_snapshot()")
+        return self.cursor.fetchone()[0]
+
+    def useSnapshot(self, snapshotId):
+        '''
+        Starts a repeatable read transaction that sees the snapshot exported by another connection. Queries made
+        afterwards read from that snapshot until the transaction ends.
+        :param snapshotId: identifier returned by exportSnapshot() on a connection to the same server.
+        :return:
+        '''
+        self.snapshotId = snapshotId
+        self.importSnapshot()
+
+    def importSnapshot(self):
+        '''
+        Helper function that starts a transaction in the snapshot given to useSnapshot().
+        '''
+        self.conn.rollback()
+        self.conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        self.cursor.execute("set transaction snapshot %s", (self.snapshotId,))
 
-    def fetchNext(self):
+    def fetchNext(self, n=None):
         '''
         Fetches the next chunk of data from the last query that was made.
+        :param n: number of rows wanted, defaults to the chunk size given to the query.
+        :return:
+        '''
+        n = n if n else self.n
+        # scans in key order carry on after the last row read on a new connection, other queries cannot.
+        return self.withRetry(partial(self.fetchChunk, n), self.keyset or self.keyedScan or self.resumeScan)
+
+    def fetchChunk(self, n):
+        '''
+        Helper function that fetches the next chunk of the last query, see fetchNext().
+        :param n: number of rows wanted.
         :return:
         '''
-        self.data = self.cursor.fetchmany(size=self.n)
+        if (self.resumeScan):
+            # the connection was replaced since the scan started, so it starts again after the last row read.
+            psqlQuery, params = self.primaryKey.selectQuery(self.lastKey, *self.scanRange)
+            self.startQuery(psqlQuery, self.n, params)
+            self.resumeScan = False
+        if (self.keyset):
+            self.data = self.fetchPage(n)
+            return self.data
+        if (self.copyStream):
+            self.data = self.copyStream.fetchNext(n)
+            return self.data
+        cursor = self.streamCursor if self.streamCursor else self.cursor
+        self.data = cursor.fetchmany(size=n)
+        if (self.keyedScan):
+            self.data = self.primaryKey.keyRows(self.data)
+            if (self.data):
+                self.lastKey = self.data[-1][0]
         return self.data
 
+    def closeStream(self):
+        '''
+        Closes the server-side cursor or copy of the last streaming query, if there is one, and ends the
+        transaction that was holding it open.
+        :return:
+        '''
+        self.keyedScan = False
+        self.keyset = False
+        self.resumeScan = False
+        self.plainQuery = False
+        if (self.copyStream):
+            finished = self.copyStream.finished
+            self.copyStream.close()
+            self.copyStream = None
+            if (finished):
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        if (self.streamCursor):
+            try:
+                self.streamCursor.close()
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+            self.streamCursor = None
+
     def close(self):
         '''
-        Closes the connection to the docker psql server.
+        Gives the connection back to the pool of its server, which keeps it open for the next table.
         :return:
         '''
-        self.cursor.close()
-        self.conn.close()
+        if (self.conn is None):
+            return
+        broken = False
+        try:
+            self.closeStream()
+            self.cursor.close()
+        except CONNECTION_ERRORS:
+            broken = True
+        self.pool.putconn(self.conn, broken)
+        self.conn = None
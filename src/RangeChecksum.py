@@ -0,0 +1,140 @@
+from PsycoConnection import PsycoConnection
+from PrimaryKey import DEFAULT_PRIMARY_KEY
+
+
+class RangeChecksum:
+    '''
+    Finds the rows that differ between two databases by comparing checksums of primary key ranges that each
+    database computes for itself, so that only the ranges that disagree are ever transferred.
+
+    A range is summarised by its row count and the sum of a 64 bit hash of every row's text representation.
+    When the summaries of a range differ it is split into `fanout` sub-ranges, which are summarised with one
+    grouped query per database, and the search recurses into the sub-ranges that still differ. Once a
+    differing range holds at most `leafSize` rows, its full rows are fetched from both databases and handed to
+    a DataComparator, which classifies them exactly as it would during a full scan.
+
+    Ranges are cut on the single column integer primary key of the table, the one set on connection A (see
+    PsycoConnection.discoverPrimaryKey), or `id` when none is set. Tables with any other key are refused before
+    the first query.
+
+    Note: this relies on both servers producing the same text for equal rows (same column order and types), which
+    holds for an in-place migration between postgres versions.
+    '''
+
+    # sum of the first 64 bits of the md5 of each row. A sum is used rather than md5(string_agg(...)) so that
+    # the aggregate needs constant memory on the server and is never limited by the maximum text length.
+    ROW_HASH = "('x' || substr(md5(t::text), 1, 16))::bit(64)::bigint"
+
+    def __init__(self, connectionA:PsycoConnection, connectionB:PsycoConnection, leafSize=1000, fanout=16):
+        '''
+        :param connectionA: connection to the pre-migration database, with its table name set.
+        :param connectionB: connection to the post-migration database, with its table name set.
+        :param leafSize: largest number of rows in a differing range that will be fetched instead of split.
+        :param fanout: number of sub-ranges a differing range is split into.
+        '''
+        self.connectionA = connectionA
+        self.connectionB = connectionB
+        self.primaryKey = connectionA.primaryKey if connectionA.primaryKey else DEFAULT_PRIMARY_KEY
+        if (self.primaryKey.composite or not self.primaryKey.integer[0]):
+            raise ValueError("checksum mode needs a single column integer primary key, %s has %s" %
+                             (connectionA.tablename, self.primaryKey))
+        # the key column as an SQL expression.
+        self.key = self.primaryKey.expressions()[0]
+        self.leafSize = leafSize
+        self.fanout = max(2, fanout)
+
+        self.aggregateQueries = 0
+        self.rowsFetched = 0
+
+    def compare(self, dataComparator):
+        '''
+        Compares the whole table and records every difference in the data comparator.
+        :param dataComparator: a DataComparator() object that collects the errors of the differing ranges.
+        :return:
+        '''
+        boundsQuery = "select min(%s), max(%s) from %%s" % (self.key, self.key)
+        boundsA = self.connectionA.execute(boundsQuery)[0]
+        boundsB = self.connectionB.execute(boundsQuery)[0]
+        lows = [bound for bound in (boundsA[0], boundsB[0]) if bound is not None]
+        highs = [bound for bound in (boundsA[1], boundsB[1]) if bound is not None]
+
+        if (lows):
+            summaryA = self.connectionA.execute(
+                "select count(*), sum(%s) from %%s t" % self.ROW_HASH)[0]
+            summaryB = self.connectionB.execute(
+                "select count(*), sum(%s) from %%s t" % self.ROW_HASH)[0]
+            self.aggregateQueries += 2
+            self.compareRange(min(lows), max(highs), summaryA, summaryB, dataComparator)
+
+        dataComparator.finish()
+
+    def compareRange(self, lo, hi, summaryA, summaryB, dataComparator):
+        '''
+        Recursively narrows down the differences within an inclusive primary key range. Sub-ranges are visited
+        in ascending order so the data comparator receives rows in primary key order.
+        :param lo: smallest primary key of the range.
+        :param hi: largest primary key of the range.
+        :param summaryA: (row count, hash sum) of the range in database A.
+        :param summaryB: (row count, hash sum) of the range in database B.
+        :param dataComparator: a DataComparator() object that collects the errors of the differing ranges.
+        :return:
+        '''
+        if (summaryA[0] == summaryB[0] and summaryA[1] == summaryB[1]):
+            # identical ranges are only counted, none of their rows need to leave the server.
+            dataComparator.totalTableSizeA += summaryA[0]
+            dataComparator.totalTableSizeB += summaryB[0]
+            return
+
+        if (max(summaryA[0], summaryB[0]) <= self.leafSize or lo == hi):
+            self.compareRows(lo, hi, dataComparator)
+            return
+
+        starts = self.splitRange(lo, hi)
+        bucketsA = self.summariseBuckets(self.connectionA, lo, hi, starts)
+        bucketsB = self.summariseBuckets(self.connectionB, lo, hi, starts)
+        for i in range(len(starts)):
+            end = starts[i + 1] - 1 if i + 1 < len(starts) else hi
+            self.compareRange(starts[i], end, bucketsA.get(i + 1, (0, None)), bucketsB.get(i + 1, (0, None)),
+                              dataComparator)
+
+    def splitRange(self, lo, hi):
+        '''
+        Helper function that splits an inclusive range into at most `fanout` contiguous sub-ranges.
+        :param lo: smallest primary key of the range.
+        :param hi: largest primary key of the range.
+        :return: the ascending list of sub-range start keys, the first of which is lo.
+        '''
+        span = hi - lo + 1
+        parts = min(self.fanout, span)
+        return [lo + (span * i) // parts for i in range(parts)]
+
+    def summariseBuckets(self, connection, lo, hi, starts):
+        '''
+        Computes the row count and hash sum of every sub-range with a single grouped query.
+        :param connection: the database to summarise.
+        :param lo: smallest primary key of the range.
+        :param hi: largest primary key of the range.
+        :param starts: ascending sub-range start keys.
+        :return: dictionary of 1-based bucket number to (row count, hash sum), empty buckets are left out.
+        '''
+        rows = connection.execute(
+            "select width_bucket(%s, %%%%s::bigint[]) as bucket, count(*), sum(%s) from %%s t "
+            "where %s between %%%%s and %%%%s group by bucket" % (self.key, self.ROW_HASH, self.key),
+            (starts, lo, hi))
+        self.aggregateQueries += 1
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def compareRows(self, lo, hi, dataComparator):
+        '''
+        Fetches the full rows of a differing leaf range from both databases and compares them.
+        :param lo: smallest primary key of the range.
+        :param hi: largest primary key of the range.
+        :param dataComparator: a DataComparator() object that collects the errors.
+        :return:
+        '''
+        query = "select %s from %%s t where %s between %%%%s and %%%%s order by %s" % (
+            self.primaryKey.selectList(), self.key, self.primaryKey.orderBy())
+        alist = self.connectionA.execute(query, (lo, hi))
+        blist = self.connectionB.execute(query, (lo, hi))
+        self.rowsFetched += len(alist) + len(blist)
+        dataComparator.prepareDataChunks(alist, blist)
@@ -0,0 +1,58 @@
+import random
+import time
+
+
+class RetryPolicy:
+    '''
+    Retries an operation that failed with a transient error, waiting longer after every failure.
+
+    The n-th retry waits backoff * 2^(n-1) seconds, capped at maxBackoff, and with jitter a random share of up to
+    half of it less, so connections that failed together do not all come back at the same instant.
+    '''
+
+    def __init__(self, retries=5, backoff=0.5, maxBackoff=30.0, jitter=True, sleep=time.sleep):
+        '''
+        :param retries: number of times an operation is tried again before its error is raised, 0 never retries.
+        :param backoff: seconds waited before the first retry.
+        :param maxBackoff: longest wait between two tries.
+        :param jitter: shorten every wait by a random amount of up to half of it.
+        :param sleep: callable used to wait, time.sleep by default.
+        '''
+        self.retries = retries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.jitter = jitter
+        self.sleep = sleep
+
+    def delay(self, attempt):
+        '''
+        :param attempt: number of the retry, starting at 1.
+        :return: seconds to wait before it.
+        '''
+        delay = min(self.maxBackoff, self.backoff * 2 ** (attempt - 1))
+        if (self.jitter):
+            delay *= random.uniform(0.5, 1.0)
+        return delay
+
+    def call(self, operation, retryable, onRetry=None, retryIf=None):
+        '''
+        Runs an operation, trying it again while it fails with a retryable error.
+        :param operation: callable without arguments.
+        :param retryable: exception class, or tuple of classes, worth retrying. Other errors are raised at once.
+        :param onRetry: optional callable taking (attempt, error), called after the wait and before the retry, e.g.
+                        to replace a broken connection. Retryable errors it raises count as a failed attempt.
+        :param retryIf: optional predicate on a retryable error, the errors it rejects are raised at once.
+        :return: the result of the operation.
+        '''
+        attempt = 0
+        while (True):
+            try:
+                if (attempt > 0 and onRetry):
+                    onRetry(attempt, error)
+                return operation()
+            except retryable as e:
+                attempt += 1
+                if (attempt > self.retries or (retryIf and not retryIf(e))):
+                    raise
+                error = e
+                self.sleep(self.delay(attempt))
@@ -0,0 +1,237 @@
+import random
+from statistics import NormalDist
+
+from PrimaryKey import DEFAULT_PRIMARY_KEY
+
+
+class TableSampler:
+    '''
+    Estimates the migration error rates of a table from a sample of its rows instead of a full scan, for a quick
+    go/no-go check before a cutover.
+
+    Two sampling methods are supported:
+    1. TABLESAMPLE (method "bernoulli" or "system") - a repeatable, seeded sample of `percent` percent of the rows of
+                    each database. The rows sampled from A are looked up by primary key in B and run through the data
+                    comparator, which finds the Corruption and Copy Omission Errors among them. The rows sampled from
+                    B are looked up in A, and those missing from it are Creation Errors.
+    2. Random key ranges (method "ranges") - `ranges` runs of `rangeSize` consecutive rows of A starting at random
+                    primary keys, compared in full against the same key interval of B, which finds every kind of
+                    error inside the intervals. Needs an integer primary key.
+
+    Each error rate comes with a Wilson score confidence interval and an estimated number of errors in the whole
+    table, from the planner's row estimate. SYSTEM sampling and key ranges pick rows in clusters, so their intervals
+    are optimistic when errors are clustered too.
+    '''
+
+    METHODS = ('bernoulli', 'system', 'ranges')
+
+    def __init__(self, connectionA, connectionB, method="bernoulli", percent=1.0, seed=0, ranges=100,
+                 rangeSize=1000, confidence=0.95):
+        '''
+        :param connectionA: connection to the pre-migration database, with its table name and primary key set.
+        :param connectionB: connection to the post-migration database, with its table name and primary key set.
+        :param method: "bernoulli", "system" or "ranges".
+        :param percent: TABLESAMPLE methods, percentage of the rows sampled.
+        :param seed: seed of the sample, the same seed samples the same rows of an unchanged table.
+        :param ranges: ranges method, number of random key ranges.
+        :param rangeSize: ranges method, number of rows of A in each range.
+        :param confidence: confidence level of the intervals.
+        '''
+        if (method not in self.METHODS):
+            raise ValueError("unknown sampling method %s, expected one of %s" % (method, ', '.join(self.METHODS)))
+        self.connectionA = connectionA
+        self.connectionB = connectionB
+        self.method = method
+        self.percent = percent
+        self.seed = seed
+        self.ranges = ranges
+        self.rangeSize = rangeSize
+        self.confidence = confidence
+
+        self.sampledA = 0
+        self.sampledB = 0
+        self.numCorruptionErrors = 0
+        self.numCopyOmissionErrors = 0
+        self.numCreationErrors = 0
+        # planner estimates of the table sizes, None when the table has not been analyzed.
+        self.tableSizeA = None
+        self.tableSizeB = None
+
+    def primaryKey(self):
+        return self.connectionA.primaryKey if self.connectionA.primaryKey else DEFAULT_PRIMARY_KEY
+
+    def compare(self, dataComparator, n=1000):
+        '''
+        Compares the sample and records the errors found in the data comparator.
+        :param dataComparator: a DataComparator() object that collects the errors of the sampled rows.
+        :param n: number of sampled rows handled at a time.
+        :return:
+        '''
+        self.tableSizeA = self.estimateTableSize(self.connectionA)
+        self.tableSizeB = self.estimateTableSize(self.connectionB)
+        before = (dataComparator.numCorruptionErrors, dataComparator.numCopyOmissionErrors,
+                  dataComparator.numCreationErrors)
+        if (self.method == "ranges"):
+            self.compareRanges(dataComparator)
+        else:
+            self.compareTableSample(dataComparator, n)
+        dataComparator.finish()
+        self.numCorruptionErrors = dataComparator.numCorruptionErrors - before[0]
+        self.numCopyOmissionErrors = dataComparator.numCopyOmissionErrors - before[1]
+        self.numCreationErrors = dataComparator.numCreationErrors - before[2]
+
+    def estimateTableSize(self, connection):
+        '''
+        :param connection: a PsycoConnection with its table name set.
+        :return: the planner's estimate of the number of rows of the table, or None if it has none.
+        '''
+        rows = connection.execute("select reltuples::bigint from pg_class where oid = '%s'::regclass")
+        return rows[0][0] if rows and rows[0][0] is not None and rows[0][0] > 0 else None
+
+    def sampleQuery(self):
+        '''
+        :return: (query, params) reading the TABLESAMPLE sample of a table in primary key order.
+        '''
+        primaryKey = self.primaryKey()
+        return ("select %s from %%s t tablesample %s (%%%%s) repeatable (%%%%s) order by %s" %
+                (primaryKey.selectList(), self.method, primaryKey.orderBy()), [self.percent, self.seed])
+
+    def compareTableSample(self, dataComparator, n):
+        '''
+        Compares the TABLESAMPLE samples of both databases.
+        :param dataComparator: the data comparator.
+        :param n: number of sampled rows handled at a time.
+        :return:
+        '''
+        psqlQuery, params = self.sampleQuery()
+
+        # rows sampled from A and their counterparts in B: corruptions and omissions.
+        self.connectionA.query(psqlQuery, n, params)
+        try:
+            chunk = self.primaryKey().keyRows(self.connectionA.fetchNext(n))
+            while (len(chunk) > 0):
+                self.sampledA += len(chunk)
+                dataComparator.prepareDataChunks(chunk, self.connectionB.fetchByKeys([row[0] for row in chunk]))
+                chunk = self.primaryKey().keyRows(self.connectionA.fetchNext(n))
+        finally:
+            self.connectionA.closeStream()
+        dataComparator.flushA()
+        dataComparator.flushB()
+
+        # rows sampled from B that are missing from A: creations.
+        self.connectionB.query(psqlQuery, n, params)
+        try:
+            chunk = self.primaryKey().keyRows(self.connectionB.fetchNext(n))
+            while (len(chunk) > 0):
+                self.sampledB += len(chunk)
+                found = set(row[0] for row in self.connectionA.fetchByKeys([row[0] for row in chunk]))
+                for row in chunk:
+                    if (row[0] not in found):
+                        dataComparator.addCreationError(row)
+                chunk = self.primaryKey().keyRows(self.connectionB.fetchNext(n))
+        finally:
+            self.connectionB.closeStream()
+
+    def compareRanges(self, dataComparator):
+        '''
+        Compares random primary key ranges of both databases in full.
+        :param dataComparator: the data comparator.
+        :return:
+        '''
+        primaryKey = self.primaryKey()
+        if (primaryKey.composite):
+            raise ValueError("random key ranges need a single column integer primary key, %s has %s" %
+                             (self.connectionA.tablename, primaryKey))
+        key = primaryKey.expressions()[0]
+        bounds = self.connectionA.execute("select min(%s), max(%s) from %%s" % (key, key))[0]
+        if (bounds[0] is None):
+            return
+        if (not isinstance(bounds[0], int)):
+            raise ValueError("random key ranges need an integer primary key, %s has %s" %
+                             (self.connectionA.tablename, primaryKey))
+
+        generator = random.Random(self.seed)
+        starts = sorted(generator.randint(bounds[0], bounds[1]) for i in range(self.ranges))
+        sourceQuery = ("select %s from %%s t where %s >= %%%%s order by %s limit %%%%s" %
+                       (primaryKey.selectList(), key, key))
+        targetQuery = ("select %s from %%s t where %s between %%%%s and %%%%s order by %s" %
+                       (primaryKey.selectList(), key, key))
+        tailQuery = "select %s from %%s t where %s >= %%%%s order by %s" % (primaryKey.selectList(), key, key)
+        end = None
+        for start in starts:
+            if (end is not None and start <= end):
+                # the range would overlap the previous one, whose rows were already compared.
+                continue
+            rowsA = self.connectionA.execute(sourceQuery, [start, self.rangeSize])
+            last = len(rowsA) < self.rangeSize
+            if (last):
+                # the range reaches the end of A, so rows created past the last key of A belong to it as well.
+                rowsB = self.connectionB.execute(tailQuery, [start])
+            else:
+                end = rowsA[-1][0]
+                rowsB = self.connectionB.execute(targetQuery, [start, end])
+            self.sampledA += len(rowsA)
+            self.sampledB += len(rowsB)
+            dataComparator.prepareDataChunks(rowsA, rowsB)
+            # nothing after this range can match the rows left over from it.
+            dataComparator.flushA()
+            dataComparator.flushB()
+            if (last):
+                break
+
+    def interval(self, errors, sampled):
+        '''
+        Wilson score interval of an error rate.
+        :param errors: number of errors found in the sample.
+        :param sampled: number of rows sampled.
+        :return: (rate, lower bound, upper bound), all None for an empty sample.
+        '''
+        if (sampled == 0):
+            return None, None, None
+        z = NormalDist().inv_cdf(0.5 + self.confidence / 2)
+        rate = errors / sampled
+        denominator = 1 + z * z / sampled
+        centre = (rate + z * z / (2 * sampled)) / denominator
+        margin = z * ((rate * (1 - rate) / sampled + z * z / (4 * sampled * sampled)) ** 0.5) / denominator
+        return rate, max(0.0, centre - margin), min(1.0, centre + margin)
+
+    def estimates(self):
+        '''
+        :return: dictionary of error kind to (errors in sample, rows sampled, rate, lower bound, upper bound,
+                    estimated errors in the whole table or None).
+        '''
+        result = {}
+        for kind, errors, sampled, tableSize in (
+                ('corruption', self.numCorruptionErrors, self.sampledA, self.tableSizeA),
+                ('omission', self.numCopyOmissionErrors, self.sampledA, self.tableSizeA),
+                ('creation', self.numCreationErrors, self.sampledB, self.tableSizeB)):
+            rate, lower, upper = self.interval(errors, sampled)
+            estimate = int(round(rate * tableSize)) if rate is not None and tableSize else None
+            result[kind] = (errors, sampled, rate, lower, upper, estimate)
+        return result
+
+    def errorsFound(self):
+        return self.numCorruptionErrors + self.numCopyOmissionErrors + self.numCreationErrors > 0
+
+    def writeSummary(self, f):
+        '''
+        Writes the estimated error rates to an open text report.
+        :param f: a writable text file.
+        :return:
+        '''
+        if (self.method == "ranges"):
+            f.write("\nSampled %d random key ranges of %d rows" % (self.ranges, self.rangeSize))
+        else:
+            f.write("\nSampled %s%% of the rows (TABLESAMPLE %s, seed %d)" % (self.percent, self.method.upper(),
+                                                                            self.seed))
+        f.write(", %d%% confidence intervals:\n" % round(self.confidence * 100))
+        names = {'corruption': "Corruption", 'omission': "Copy Omission", 'creation': "Creation"}
+        for kind, (errors, sampled, rate, lower, upper, estimate) in self.estimates().items():
+            if (rate is None):
+                f.write("\t%s Rate: \t\tn/a (nothing sampled)\n" % names[kind])
+                continue
+            f.write("\t%s Rate: \t\t%2.4f%% [%2.4f%%, %2.4f%%]\t(%d of %d sampled rows" %
+                    (names[kind], rate * 100, lower * 100, upper * 100, errors, sampled))
+            if (estimate is not None):
+                f.write(", ~%d in the table" % estimate)
+            f.write(")\n")
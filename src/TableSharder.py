@@ -0,0 +1,151 @@
+from functools import partial
+
+from PsycoConnection import PsycoConnection
+from ConnectionPool import connectionPool
+from CopyStream import decodeCopyRow
+from PrimaryKey import DEFAULT_PRIMARY_KEY
+
+
+class TableSharder:
+    '''
+    Splits a table into contiguous primary key ranges that can be compared independently of each other, so a
+    single large table can be spread over several worker processes.
+
+    Ranges are cut on the single column integer primary key of the table, the one set on connection A (see
+    PsycoConnection.discoverPrimaryKey), or `id` when none is set. Cut points are taken from the postgres planner
+    statistics (the pg_stats histogram of the key column of the table, in the schema the table name resolves to)
+    when they are available, which gives ranges of roughly equal row counts even when keys are skewed. Otherwise
+    the span between the smallest and largest key of both databases is split evenly. The first and last ranges are
+    open ended, so every row of either database falls into exactly one range. A key of any other type leaves the
+    table in a single range.
+    '''
+
+    def __init__(self, connectionA:PsycoConnection, connectionB:PsycoConnection):
+        '''
+        :param connectionA: connection to the pre-migration database, with its table name set.
+        :param connectionB: connection to the post-migration database, with its table name set.
+        '''
+        self.connectionA = connectionA
+        self.connectionB = connectionB
+        self.primaryKey = connectionA.primaryKey if connectionA.primaryKey else DEFAULT_PRIMARY_KEY
+        if (self.primaryKey.composite):
+            raise ValueError("sharding needs a single column integer primary key, %s has %s" %
+                             (connectionA.tablename, self.primaryKey))
+
+    def shardRanges(self, shards):
+        '''
+        Computes the primary key ranges of the table.
+        :param shards: the number of ranges wanted.
+        :return: list of (lo, hi) tuples covering lo <= key < hi, where None means unbounded.
+        '''
+        cuts = []
+        if (shards > 1):
+            cuts = self.histogramCuts(shards) or self.minMaxCuts(shards)
+
+        bounds = [None] + cuts + [None]
+        return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+    def histogramCuts(self, shards):
+        '''
+        Picks evenly spaced entries of the pg_stats histogram of the key column of database A as cut points.
+        :param shards: the number of ranges wanted.
+        :return: ascending list of at most shards - 1 distinct cut keys, empty if there are no statistics.
+        '''
+        # pg_stats names tables without their schema, the statistics are those of the table the name resolves to.
+        rows = self.connectionA.execute(
+            "select s.histogram_bounds::text from pg_stats s join pg_namespace n on n.nspname = s.schemaname "
+            "join pg_class c on c.relnamespace = n.oid and c.relname = s.tablename "
+            "where c.oid = '%s'::regclass and s.attname = %%s", [self.primaryKey.columns[0]])
+        if (not rows or not rows[0][0]):
+            return []
+        try:
+            histogram = [int(bound) for bound in rows[0][0].strip('{}').split(',')]
+        except ValueError:
+            # only integer keys can be range partitioned.
+            return []
+
+        cuts = []
+        for i in range(1, shards):
+            cut = histogram[(len(histogram) * i) // shards]
+            if (not cuts or cut > cuts[-1]):
+                cuts.append(cut)
+        return cuts
+
+    def minMaxCuts(self, shards):
+        '''
+        Splits the key span shared by both databases into equally wide ranges.
+        :param shards: the number of ranges wanted.
+        :return: ascending list of at most shards - 1 distinct cut keys, empty if both tables are empty.
+        '''
+        key = self.primaryKey.expressions()[0]
+        boundsA = self.connectionA.execute("select min(%s), max(%s) from %%s" % (key, key))[0]
+        boundsB = self.connectionB.execute("select min(%s), max(%s) from %%s" % (key, key))[0]
+        lows = [bound for bound in (boundsA[0], boundsB[0]) if bound is not None]
+        highs = [bound for bound in (boundsA[1], boundsB[1]) if bound is not None]
+        if (not lows or not isinstance(lows[0], int)):
+            # only integer keys can be split into equally wide ranges.
+            return []
+
+        lo = min(lows)
+        span = max(highs) - lo + 1
+        cuts = []
+        for i in range(1, shards):
+            cut = lo + (span * i) // shards
+            if (cut > lo and (not cuts or cut > cuts[-1])):
+                cuts.append(cut)
+        return cuts
+
+
+def compareShard(psqldbA, psqldbB, tablename, lo, hi, n, comparatorClass, sinkFactory, snapshots, streaming=True,
+                 itersize=2000, copy=False, chunkSizer=None, primaryKey=None, poolSize=16, retryPolicy=None):
+    '''
+    Worker entry point that compares a single primary key range of a table on its own pair of connections.
+    It is a module level function so that it can be sent to a process pool. The range is read as a keyed scan
+    bounded by lo and hi (PsycoConnection.scanTable), so a dropped connection resumes it after the last key read;
+    COPY extraction cannot be resumed.
+    :param psqldbA: PSQLServer of the pre-migration database.
+    :param psqldbB: PSQLServer of the post-migration database.
+    :param tablename: the table to compare.
+    :param lo: smallest primary key of the range, None for unbounded.
+    :param hi: primary key the range stops before, None for unbounded.
+    :param n: size of data chunk from databases.
+    :param comparatorClass: the DataComparator class used for the range.
+    :param sinkFactory: error sink factory of the range's data comparator.
+    :param snapshots: exported snapshot identifiers for database A and B, or None to read the latest data.
+    :param streaming: read through server-side cursors.
+    :param itersize: rows per round trip for server-side cursors.
+    :param copy: extract the range with COPY and compare rows as raw text.
+    :param chunkSizer: optional ChunkSizer that tunes the chunk size while the range is read, the worker gets its
+                        own copy of it.
+    :param primaryKey: the single column PrimaryKey the ranges were cut on, `id` by default.
+    :param poolSize: maximum connections of the worker's pool to each database.
+    :param retryPolicy: RetryPolicy of the worker's pools, None to fail on the first dropped connection.
+    :return: the finished data comparator of the range.
+    '''
+    primaryKey = primaryKey if primaryKey else DEFAULT_PRIMARY_KEY
+    dataComparator = comparatorClass(sinkFactory, decodeCopyRow if copy else None)
+    connections = []
+    try:
+        for i, psqldb in enumerate((psqldbA, psqldbB)):
+            pool = connectionPool(psqldb, poolSize, retryPolicy)
+            connection = PsycoConnection(psqldb, streaming, itersize, dataComparator.metrics, pool)
+            connections.append(connection)
+            connection.tablename = tablename
+            connection.primaryKey = primaryKey
+            if (snapshots and snapshots[i]):
+                connection.useSnapshot(snapshots[i])
+            if (copy):
+                connection.copyQuery(*primaryKey.selectQuery(None, lo, hi), n=n)
+            else:
+                connection.scanTable(n, lo=lo, hi=hi)
+        dataComparator.bindConnections(connections[0], connections[1])
+        if (chunkSizer):
+            dataComparator.chunkSizer = chunkSizer
+            dataComparator.compareStreams(partial(chunkSizer.fetch, connections[0].fetchNext),
+                                          partial(chunkSizer.fetch, connections[1].fetchNext))
+        else:
+            dataComparator.compareStreams(connections[0].fetchNext, connections[1].fetchNext)
+    finally:
+        for connection in connections:
+            connection.close()
+    return dataComparator
@@ -0,0 +1,58 @@
+from ArrowErrorSink import ArrowErrorSinkFactory, pa
+from DataComparator import DataComparator
+import unittest
+import tempfile
+import pickle
+import os
+
+
+@unittest.skipIf(pa is None, "pyarrow is not installed.")
+class TestArrowErrorSink(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.reportDir = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def readTable(self, path):
+        if (path.endswith('.parquet')):
+            import pyarrow.parquet as pq
+            return pq.read_table(path).to_pylist()
+        with pa.ipc.open_file(path) as reader:
+            return reader.read_all().to_pylist()
+
+    def testParquetReports(self):
+        dataComparator = DataComparator(ArrowErrorSinkFactory(self.reportDir, "parquet", batchSize=2))
+        dataComparator.prepareDataChunks([(1, 'a', 1.5), (2, 'b', None), (3, 'c', 3.5)],
+                                         [(1, 'a', 2.5), (3, 'c', 3.5), (4, 'd', None)])
+        dataComparator.finish()
+        dataComparator.produceReports(self.reportDir)
+        self.assertEqual([{'key': '1', 'column': 2, 'pre_migration': '1.5', 'post_migration': '2.5'}],
+                         self.readTable(os.path.join(self.reportDir, "corruption-errors.parquet")))
+        self.assertEqual([{'key': '2', 'column_1': 'b', 'column_2': None}],
+                         self.readTable(os.path.join(self.reportDir, "omission-errors.parquet")))
+        self.assertEqual([{'key': '4', 'column_1': 'd', 'column_2': None}],
+                         self.readTable(os.path.join(self.reportDir, "creation-errors.parquet")))
+
+    def testArrowShardMerge(self):
+        factory = ArrowErrorSinkFactory(self.reportDir, "arrow", batchSize=2)
+        sink = factory("omission-errors.csv")
+        shard = factory.forShard(0)("omission-errors.csv")
+        empty = factory.forShard(1)("omission-errors.csv")
+        for i in range(3):
+            sink.add((i, 'a'))
+            shard.add((i + 10, 'b'))
+        # shards come back from worker processes pickled.
+        sink.merge(pickle.loads(pickle.dumps(shard)))
+        sink.merge(pickle.loads(pickle.dumps(empty)))
+        sink.close()
+        rows = self.readTable(os.path.join(self.reportDir, "omission-errors.arrow"))
+        self.assertEqual(['0', '1', '2', '10', '11', '12'], [row['key'] for row in rows])
+        self.assertEqual(6, len(sink))
+        self.assertFalse(os.path.exists(os.path.join(self.reportDir, "shard-0")))
+
+
+if __name__ == "__main__":
+    unittest.main()
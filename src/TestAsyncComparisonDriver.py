@@ -0,0 +1,139 @@
+from AsyncComparisonDriver import AsyncComparisonDriver
+from AsyncPsycoConnection import AsyncPsycoConnection
+from DataComparator import DataComparator
+from PrimaryKey import DEFAULT_PRIMARY_KEY
+import TestHelpers
+import unittest
+from unittest import mock
+import asyncio
+import psycopg2
+
+
+class FakeConn:
+    '''
+    Stands in for the psycopg2 connection of a FakeAsyncConnection.
+    '''
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.cancelled = False
+        self.closed = False
+
+    def isexecuting(self):
+        return self.owner.executing
+
+    def cancel(self):
+        self.cancelled = True
+        self.owner.executing = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def fetchall(self):
+        return self.owner.result
+
+    def close(self):
+        pass
+
+
+class FakeAsyncConnection(AsyncPsycoConnection):
+    '''
+    Asynchronous connection to an in memory table, the rows of the table are passed as the server. Every statement
+    takes a moment on the event loop, and a statement whose wait is cancelled keeps the connection busy until it is
+    cancelled on the server, like a real asynchronous connection. The connections made are kept in opened.
+    '''
+
+    opened = []
+
+    def __init__(self, PSQLdb):
+        super().__init__(PSQLdb)
+        self.rows = PSQLdb
+        self.position = 0
+        self.result = []
+        self.executing = False
+        self.statements = []
+        self.opened.append(self)
+
+    async def connect(self):
+        self.conn = FakeConn(self)
+        self.cursor = FakeCursor(self)
+
+    async def wait(self):
+        while (self.executing):
+            await asyncio.sleep(0)
+
+    async def run(self, statement, params=None):
+        if (self.executing):
+            raise psycopg2.ProgrammingError("execute cannot be used while an asynchronous query is underway")
+        self.statements.append(statement)
+        self.executing = True
+        await asyncio.sleep(0.001)
+        self.executing = False
+        self.result = []
+        if (statement.startswith("FETCH")):
+            n = int(statement.split()[2])
+            self.result = self.rows[self.position:self.position + n]
+            self.position += n
+
+
+class BrokenComparator(DataComparator):
+    '''
+    Data comparator that dies on the first chunk pair, while the next pair is being fetched.
+    '''
+
+    def prepareDataChunks(self, alist, blist):
+        raise TestHelpers.Crash()
+
+
+class TestAsyncComparisonDriver(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('AsyncComparisonDriver.AsyncPsycoConnection', FakeAsyncConnection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FakeAsyncConnection.opened = []
+        self.rowsA = [(i, 'row %d' % i) for i in range(50)]
+        self.rowsB = [row for row in self.rowsA if row[0] != 7] + [(60, 'new')]
+        self.rowsB[20] = (self.rowsB[20][0], 'corrupted')
+
+    def testComparesFetchedChunks(self):
+        jobs = [(self.rowsA, self.rowsB, 'fake', DataComparator(), DEFAULT_PRIMARY_KEY),
+                (self.rowsA, list(self.rowsA), 'other', DataComparator(), DEFAULT_PRIMARY_KEY)]
+        changed, unchanged = AsyncComparisonDriver(maxConcurrent=2).run(jobs, 8)
+        expected = DataComparator()
+        expected.prepareDataChunks(list(self.rowsA), list(self.rowsB))
+        expected.finish()
+        for counter in ('numCorruptionErrors', 'numCopyOmissionErrors', 'numCreationErrors', 'totalTableSizeA',
+                        'totalTableSizeB'):
+            self.assertEqual(getattr(expected, counter), getattr(changed, counter), counter)
+        self.assertEqual(0, unchanged.numCorruptionErrors + unchanged.numCopyOmissionErrors +
+                         unchanged.numCreationErrors)
+        self.assertEqual(4, len(FakeAsyncConnection.opened))
+        for connection in FakeAsyncConnection.opened:
+            statements = [statement.split()[0] for statement in connection.statements]
+            self.assertEqual(['BEGIN', 'DECLARE'], statements[:2])
+            self.assertEqual(['FETCH', 'CLOSE', 'COMMIT'], statements[-3:])
+            self.assertTrue(connection.conn is None)
+
+    def testFailedComparisonCancelsTheFetch(self):
+        jobs = [(self.rowsA, self.rowsB, 'fake', BrokenComparator(), DEFAULT_PRIMARY_KEY)]
+        with mock.patch('builtins.print') as printed:
+            result, = AsyncComparisonDriver().run(jobs, 8)
+        self.assertIsInstance(result, TestHelpers.Crash)
+        # the next chunk pair was being fetched, its FETCH statements are cancelled on the server and their
+        # transactions rolled back before the connections are closed.
+        printed.assert_not_called()
+        for connection in FakeAsyncConnection.opened:
+            self.assertEqual(['FETCH', 'FETCH', 'ROLLBACK'], [statement.split()[0]
+                                                              for statement in connection.statements[2:]])
+            self.assertTrue(connection.conn is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
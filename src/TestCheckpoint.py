@@ -0,0 +1,91 @@
+from Checkpoint import Checkpoint
+from DataComparator import DataComparator
+from MergeComparator import MergeComparator
+from ErrorSink import CsvErrorSinkFactory
+from TestHelpers import Crash, chunkFetcher
+import TestDataComparator
+import unittest
+import tempfile
+import gzip
+import os
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "table.checkpoint")
+        generator = TestDataComparator.TestDataComparator()
+        self.alist = sorted(generator.setupAData(2000), key=lambda row: row[0])
+        self.blist = sorted(generator.setupBData(self.alist, 50, 50, 50), key=lambda row: row[0])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def remaining(self, rows, lastKey):
+        # what a `where id > last` query returns.
+        return rows if lastKey is None else [row for row in rows if row[0] > lastKey]
+
+    def compareWithCrash(self, comparatorClass, sinkFactory=None, resumeFactory=None):
+        interrupted = comparatorClass(sinkFactory)
+        with self.assertRaises(Crash):
+            interrupted.compareStreams(chunkFetcher(self.alist, 100, 7), chunkFetcher(self.blist, 100),
+                                       Checkpoint(self.path, 0))
+
+        resumed = comparatorClass(resumeFactory)
+        checkpoint = Checkpoint(self.path, 0)
+        self.assertTrue(checkpoint.restore(resumed))
+        self.assertFalse(checkpoint.finished)
+        resumed.compareStreams(chunkFetcher(self.remaining(self.alist, checkpoint.lastKeyA), 100),
+                               chunkFetcher(self.remaining(self.blist, checkpoint.lastKeyB), 100), checkpoint)
+        return resumed
+
+    def assertSameResults(self, expected, actual):
+        self.assertEqual(expected.totalTableSizeA, actual.totalTableSizeA)
+        self.assertEqual(expected.totalTableSizeB, actual.totalTableSizeB)
+        self.assertEqual(expected.numCorruptionErrors, actual.numCorruptionErrors)
+        self.assertEqual(expected.numCopyOmissionErrors, actual.numCopyOmissionErrors)
+        self.assertEqual(expected.numCreationErrors, actual.numCreationErrors)
+
+    def testResumeHash(self):
+        expected = DataComparator()
+        expected.compareStreams(chunkFetcher(self.alist, 100), chunkFetcher(self.blist, 100))
+        resumed = self.compareWithCrash(DataComparator)
+        self.assertSameResults(expected, resumed)
+        self.assertEqual(sorted(map(repr, expected.copyOmissionErrors)), sorted(map(repr, resumed.copyOmissionErrors)))
+
+    def testResumeMerge(self):
+        expected = MergeComparator()
+        expected.compareStreams(chunkFetcher(self.alist, 100), chunkFetcher(self.blist, 100))
+        self.assertSameResults(expected, self.compareWithCrash(MergeComparator))
+
+    def testResumeStreamedSinks(self):
+        reportDir = os.path.join(self.tempdir.name, "reports")
+        expected = DataComparator()
+        expected.compareStreams(chunkFetcher(self.alist, 100), chunkFetcher(self.blist, 100))
+
+        resumed = self.compareWithCrash(DataComparator, CsvErrorSinkFactory(reportDir, True),
+                                        CsvErrorSinkFactory(reportDir, True, resume=True))
+        self.assertSameResults(expected, resumed)
+        resumed.produceReports(reportDir)
+        with gzip.open(os.path.join(reportDir, "creation-errors.csv.gz"), 'rt') as f:
+            self.assertEqual(expected.numCreationErrors, len(f.read().splitlines()))
+
+    def testFinishedCheckpoint(self):
+        dataComparator = DataComparator()
+        checkpoint = Checkpoint(self.path, 3600)
+        dataComparator.compareStreams(chunkFetcher(self.alist, 100), chunkFetcher(self.blist, 100), checkpoint)
+        checkpoint.save(dataComparator, finished=True)
+
+        restored = DataComparator()
+        checkpoint = Checkpoint(self.path)
+        self.assertTrue(checkpoint.restore(restored))
+        self.assertTrue(checkpoint.finished)
+        self.assertSameResults(dataComparator, restored)
+
+    def testNoCheckpoint(self):
+        self.assertFalse(Checkpoint(self.path).restore(DataComparator()))
+
+
+if __name__ == '__main__':
+    unittest.main()
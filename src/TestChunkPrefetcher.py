@@ -0,0 +1,55 @@
+from ChunkPrefetcher import ChunkPrefetcher
+import TestHelpers
+import unittest
+import time
+
+
+class FakeConnection:
+    '''
+    Connection whose fetchNext() hands out the chunks of an in memory table, see TestHelpers.chunkFetcher.
+    '''
+
+    def __init__(self, rows, n, crashAfter=None):
+        self.fetchNext = TestHelpers.chunkFetcher(rows, n, crashAfter)
+
+
+class TestChunkPrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [(i, 'row %d' % i) for i in range(25)]
+
+    def testChunksInOrder(self):
+        prefetcher = ChunkPrefetcher(FakeConnection(self.rows, 10), depth=2)
+        self.assertEqual(self.rows[:10], prefetcher.fetchNext())
+        self.assertEqual(self.rows[10:20], prefetcher.fetchNext())
+        self.assertEqual(self.rows[20:], prefetcher.fetchNext())
+        # once the stream is exhausted every further call returns an empty chunk instead of waiting.
+        for i in range(3):
+            self.assertEqual([], prefetcher.fetchNext())
+        prefetcher.close()
+        self.assertFalse(prefetcher.thread.is_alive())
+
+    def testFetchErrorIsRaisedToTheConsumer(self):
+        prefetcher = ChunkPrefetcher(FakeConnection(self.rows, 10, crashAfter=1))
+        self.assertEqual(self.rows[:10], prefetcher.fetchNext())
+        with self.assertRaises(TestHelpers.Crash):
+            prefetcher.fetchNext()
+        # the error is raised once, the stream is over afterwards.
+        self.assertEqual([], prefetcher.fetchNext())
+        prefetcher.close()
+
+    def testCloseWhileTheQueueIsFull(self):
+        connection = FakeConnection(self.rows * 100, 10)
+        prefetcher = ChunkPrefetcher(connection, depth=1)
+        # the first chunk fills the queue, the fetch thread then blocks putting the second one.
+        deadline = time.monotonic() + 5.0
+        while (connection.fetchNext.calls < 2 and time.monotonic() < deadline):
+            time.sleep(0.01)
+        self.assertTrue(prefetcher.chunks.full())
+        prefetcher.close()
+        self.assertFalse(prefetcher.thread.is_alive())
+        self.assertEqual(2, connection.fetchNext.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+from ChunkSizer import ChunkSizer, estimateChunkBytes
+from DataComparator import DataComparator
+import unittest
+import pickle
+import io
+
+
+class TestChunkSizer(unittest.TestCase):
+
+    def feed(self, sizer, fetches, secondsFor, bytesPerRow=100):
+        # simulates fetches of full chunks whose latency depends on the chunk size.
+        for i in range(fetches):
+            size = sizer.size
+            sizer.observe(size, size * bytesPerRow, secondsFor(size))
+
+    def testGrowsWhileRoundTripsDominate(self):
+        sizer = ChunkSizer(100, memoryBudget=1 << 30, minSize=10, maxSize=10000)
+        # a fixed round trip cost plus a small cost per row, larger chunks are always faster.
+        self.feed(sizer, 100, lambda size: 0.01 + size * 1e-6)
+        self.assertEqual(10000, sizer.size)
+        self.assertTrue(sizer.history)
+
+    def testMemoryBudgetCapsSize(self):
+        sizer = ChunkSizer(100, memoryBudget=1000000, chunksInFlight=4, maxSize=100000)
+        self.feed(sizer, 100, lambda size: 0.01 + size * 1e-6, bytesPerRow=1000)
+        self.assertLessEqual(sizer.size, 250)
+        self.assertGreater(sizer.size, 100)
+
+    def testShrinksWhenLargeChunksAreSlow(self):
+        sizer = ChunkSizer(1000, memoryBudget=1 << 30, minSize=10, maxSize=100000)
+        # throughput falls as chunks grow past 200 rows.
+        self.feed(sizer, 200, lambda size: size * 1e-6 * (1 + max(0, size - 200) / 50.0))
+        self.assertLess(sizer.size, 1000)
+
+    def testShortChunkKeepsSize(self):
+        sizer = ChunkSizer(100, window=1)
+        chunk = sizer.fetch(lambda n: [(i, 'x') for i in range(n // 2)])
+        self.assertEqual(50, len(chunk))
+        self.assertEqual(100, sizer.size)
+        self.assertEqual(1, sizer.fetches)
+
+    def testPickleAndReport(self):
+        sizer = ChunkSizer(100, window=1)
+        self.feed(sizer, 5, lambda size: 0.01)
+        copy = pickle.loads(pickle.dumps(sizer))
+        copy.observe(copy.size, 100, 0.01)
+
+        dc = DataComparator()
+        dc.chunkSizer = sizer
+        other = DataComparator()
+        other.chunkSizer = copy
+        dc.merge(other)
+        self.assertEqual(11, dc.chunkSizer.fetches)
+        f = io.StringIO()
+        dc.writeSummary(f)
+        self.assertIn("Chunk Sizes Chosen", f.getvalue())
+
+    def testEstimateChunkBytes(self):
+        self.assertEqual(0, estimateChunkBytes([]))
+        narrow = estimateChunkBytes([(i,) for i in range(1000)])
+        wide = estimateChunkBytes([(i, 'x' * 1000) for i in range(1000)])
+        self.assertGreater(wide, narrow + 1000 * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+from ColumnProjection import ColumnProjection, normalizeExpression
+from PrimaryKey import PrimaryKey, DEFAULT_PRIMARY_KEY
+import unittest
+import tempfile
+import json
+import os
+
+
+class TestColumnProjection(unittest.TestCase):
+
+    COLUMNS = ["id", "total", "placed_at", "details", "attachment", "notes"]
+
+    def testExcludeAndNormalize(self):
+        projection = ColumnProjection({"orders": {"exclude": ["attachment"],
+                                                  "normalize": {"total": "round:3", "placed_at": "utc",
+                                                                "details": "jsonb", "notes": "md5"}}})
+        self.assertEqual(['round("total"::numeric, 3) AS "total"',
+                          '("placed_at" AT TIME ZONE \'UTC\') AS "placed_at"',
+                          '"details"::jsonb::text AS "details"',
+                          'md5("notes"::text) AS "notes"'],
+                         projection.expressions("orders", self.COLUMNS, ["id"]))
+        self.assertIsNone(projection.expressions("customers", self.COLUMNS, ["id"]))
+
+    def testIncludeAndDefault(self):
+        projection = ColumnProjection({"orders": {"include": ["notes", "id", "total"]},
+                                       "*": {"exclude": ["attachment", "not_everywhere"]}})
+        # the key is left out, it is always selected in front of the row.
+        self.assertEqual(['"notes"', '"total"'], projection.expressions("orders", self.COLUMNS, ["id"]))
+        self.assertEqual(['"total"', '"placed_at"', '"details"', '"notes"'],
+                         projection.expressions("invoices", self.COLUMNS, ["id"]))
+
+    def testInvalidConfigurations(self):
+        with self.assertRaises(ValueError):
+            ColumnProjection({"orders": {"include": ["totl"]}}).expressions("orders", self.COLUMNS, ["id"])
+        with self.assertRaises(ValueError):
+            ColumnProjection({"orders": {"columns": ["total"]}})
+        with self.assertRaises(ValueError):
+            normalizeExpression("squash", "total")
+        with self.assertRaises(ValueError):
+            normalizeExpression("to_char({column}, '999%')", "total")
+        self.assertEqual('date_trunc(\'second\', "placed_at")',
+                         normalizeExpression("date_trunc('second', {column})", "placed_at"))
+
+    def testProjectedSelectList(self):
+        primaryKey = DEFAULT_PRIMARY_KEY.project(['"total"', 'md5("notes"::text) AS "notes"'])
+        self.assertEqual('select "id", "total", md5("notes"::text) AS "notes" from %s t order by "id"',
+                         primaryKey.selectQuery()[0])
+        self.assertIsNone(DEFAULT_PRIMARY_KEY.projection)
+        composite = PrimaryKey(["tenant", "seq"]).project(['"total"'])
+        self.assertEqual(('a', 1), composite.keyRow(('a', 1, 5))[0])
+        self.assertEqual(composite, PrimaryKey(["tenant", "seq"]))
+
+    def testFromFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "columns.json")
+            with open(path, 'w') as f:
+                json.dump({"tables": {"orders": {"exclude": ["attachment"]}}}, f)
+            projection = ColumnProjection.fromFile(path)
+        self.assertNotIn('"attachment"', projection.expressions("orders", self.COLUMNS, ["id"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
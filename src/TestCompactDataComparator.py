@@ -0,0 +1,101 @@
+from CompactDataComparator import CompactDataComparator, DigestStore
+from TestHelpers import FakeConnection
+import TestDataComparator
+import unittest
+from decimal import Decimal
+import pickle
+import random
+import sys
+
+
+class TestCompactDataComparator(TestDataComparator.TestDataComparator):
+    '''
+    Runs every DataComparator verification test against the digest based engine, plus tests for the rows it
+    re-fetches and the memory it saves.
+    '''
+    comparatorClass = CompactDataComparator
+
+    def testErrorRowsAreFetched(self):
+        alist = [(1, 'a'), (2, 'b'), (3, 'c')]
+        blist = [(1, 'a'), (2, 'x'), (4, 'd')]
+        connectionA = FakeConnection(alist)
+        connectionB = FakeConnection(blist)
+        self.DataComparator.bindConnections(connectionA, connectionB)
+        self.computeSingleChunk(alist, blist)
+        self.assertErrorCount(1, 1, 1)
+        self.assertEqual([[(2, 'b'), (2, 'x')]], list(self.DataComparator.corruptionErrors))
+        self.assertEqual([(3, 'c')], list(self.DataComparator.copyOmissionErrors))
+        self.assertEqual([(4, 'd')], list(self.DataComparator.creationErrors))
+        # the corrupted row of B was at hand, only A's side of it was fetched.
+        self.assertEqual(2, connectionA.rowsByKey)
+        self.assertEqual(1, connectionB.rowsByKey)
+
+    def testEqualValuesPrintedDifferently(self):
+        # equal values whose repr differ have different digests, the fetched rows show they are not corrupted.
+        alist = [(1, Decimal('1.0'), 0.0), (2, Decimal('2.0'), 'a'), (3, Decimal('3.0'), 'a')]
+        blist = [(1, Decimal('1.00'), -0.0), (2, Decimal('2.0'), 'b'), (3, Decimal('3.00'), 'a')]
+        self.DataComparator.bindConnections(FakeConnection(alist), FakeConnection(blist))
+        self.computeSingleChunk(alist, blist)
+        self.assertErrorCount(1, 0, 0)
+        self.assertEqual([[(2, Decimal('2.0'), 'a'), (2, Decimal('2.0'), 'b')]],
+                         list(self.DataComparator.corruptionErrors))
+
+    def testUnboundReportsKeys(self):
+        self.computeSingleChunk([(1, 'a')], [(2, 'b')])
+        self.assertEqual([(1,)], list(self.DataComparator.copyOmissionErrors))
+        self.assertEqual([(2,)], list(self.DataComparator.creationErrors))
+
+    def testDigestStoreSmallerThanRows(self):
+        rows = [(i,) + tuple('value %d of column %d' % (i, c) for c in range(20)) for i in range(1000)]
+        self.computeChunk(rows, [])
+        leftover = self.DataComparator.leftoverA
+        self.assertEqual(1000, len(leftover))
+        rowBytes = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in rows)
+        # the whole store, the key array and removed flags included, not only the digests.
+        self.assertLess(leftover.nbytes(), rowBytes / 10)
+        self.assertLess(leftover.nbytes(), 1000 * 64)
+
+    def testDigestStoreDropsRemovedDigests(self):
+        store = DigestStore()
+        for primaryKey in range(100):
+            store.put(primaryKey, bytes([primaryKey]) * 16)
+        for primaryKey in range(60):
+            self.assertEqual(bytes([primaryKey]) * 16, store.pop(primaryKey))
+        # once half of the keys were matched their digests were dropped.
+        self.assertLess(len(store.digests), 100 * 16)
+        self.assertEqual(list(range(60, 100)), store.keys())
+        copy = pickle.loads(pickle.dumps(store))
+        self.assertEqual(bytes([99]) * 16, copy.pop(99))
+        self.assertIn(98, copy)
+        self.assertNotIn(1, copy)
+
+    def testDigestStoreMatchesDict(self):
+        store = DigestStore()
+        expected = {}
+        generator = random.Random(7)
+        keys = [generator.randrange(-2 ** 63, 2 ** 63) for i in range(50)] + list(range(0, 4000, 64)) + \
+            ['text', ('composite', 1), 2 ** 70]
+        nextKey = 0
+        for i in range(20000):
+            # mostly ascending keys, as chunks arrive, with keys put again or out of order in between.
+            if (generator.random() < 0.6):
+                nextKey += generator.randint(1, 3)
+                primaryKey = nextKey
+            else:
+                primaryKey = generator.choice(keys + list(expected)[-20:])
+            if (primaryKey in expected and generator.random() < 0.7):
+                self.assertEqual(expected.pop(primaryKey), store.pop(primaryKey))
+            else:
+                expected[primaryKey] = bytes([i % 256]) * 16
+                store.put(primaryKey, expected[primaryKey])
+            self.assertEqual(len(expected), len(store))
+        for primaryKey in keys + list(range(nextKey)):
+            self.assertEqual(primaryKey in expected, primaryKey in store)
+        self.assertEqual(sorted(map(repr, expected)), sorted(map(repr, store.keys())))
+        self.assertIsNone(store.pop(-1, None))
+        with self.assertRaises(KeyError):
+            store.pop(-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+from ConnectionPool import ConnectionPool, connectionLost
+from PsycoConnection import PsycoConnection
+from PSQLServer import PSQLServer
+from RetryPolicy import RetryPolicy
+import psycopg2
+from psycopg2 import errors
+import unittest
+
+
+class FakeConnection:
+    '''
+    Stands in for a psycopg2 connection that answers every statement.
+    '''
+
+    def __init__(self):
+        self.closed = 0
+
+    def cursor(self, name=None):
+        return FakeCursor()
+
+    def rollback(self):
+        pass
+
+
+class FakeCursor:
+
+    def execute(self, statement, params=None):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeThreadedPool:
+    '''
+    Stands in for psycopg2's ThreadedConnectionPool, opening a connection fails with the given errors first.
+    '''
+
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.opened = 0
+
+    def getconn(self):
+        self.opened += 1
+        if (self.failures):
+            raise self.failures.pop(0)
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = RetryPolicy(retries=3, jitter=False, sleep=lambda delay: None)
+        self.pool = ConnectionPool(PSQLServer("user", "db", "password", 5432), 2, self.policy)
+
+    def testConnectionLost(self):
+        self.assertTrue(connectionLost(psycopg2.OperationalError("server closed the connection unexpectedly")))
+        self.assertTrue(connectionLost(psycopg2.InterfaceError("connection already closed")))
+        self.assertTrue(connectionLost(errors.AdminShutdown()))
+        self.assertTrue(connectionLost(errors.lookup('08006')()))
+        # errors of a healthy connection, which another connection would not fix.
+        for error in (errors.QueryCanceled(), errors.DeadlockDetected(), errors.SerializationFailure(),
+                      errors.DiskFull(), errors.OutOfMemory(), errors.LockNotAvailable(), ValueError()):
+            self.assertFalse(connectionLost(error), type(error).__name__)
+
+    def testGetconnRetriesLostConnections(self):
+        self.pool.pool = FakeThreadedPool([psycopg2.OperationalError("could not connect")] * 2)
+        self.assertIsInstance(self.pool.getconn(), FakeConnection)
+        self.assertEqual(3, self.pool.pool.opened)
+
+    def testGetconnRaisesOtherErrors(self):
+        self.pool.pool = FakeThreadedPool([errors.TooManyConnections()])
+        with self.assertRaises(errors.TooManyConnections):
+            self.pool.getconn()
+        self.assertEqual(1, self.pool.pool.opened)
+
+    def testReconnectDoesNotRetryAgain(self):
+        self.pool.pool = FakeThreadedPool([])
+        connection = PsycoConnection(self.pool.psqldb, pool=self.pool)
+        calls = []
+
+        def lost():
+            calls.append(len(calls))
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+        # every reconnect fails once the server is gone, each failure is one attempt of withRetry only.
+        self.pool.pool.failures = [psycopg2.OperationalError("could not connect")] * 10
+        with self.assertRaises(psycopg2.OperationalError):
+            connection.withRetry(lost)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1 + self.policy.retries, self.pool.pool.opened)
+        self.assertEqual(self.policy.retries, connection.metrics.counters['reconnects'])
+
+    def testHealthyConnectionErrorsAreNotRetried(self):
+        self.pool.pool = FakeThreadedPool([])
+        connection = PsycoConnection(self.pool.psqldb, pool=self.pool)
+        calls = []
+
+        def canceled():
+            calls.append(len(calls))
+            raise errors.QueryCanceled("canceling statement due to statement timeout")
+
+        with self.assertRaises(errors.QueryCanceled):
+            connection.withRetry(canceled)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, self.pool.pool.opened)
+
+
+if __name__ == '__main__':
+    unittest.main()
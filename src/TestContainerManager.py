@@ -0,0 +1,126 @@
+from ContainerManager import ContainerManager, serverLabel
+from PSQLServer import PSQLServer
+import unittest
+
+
+class FakeContainer:
+    '''
+    A container of the fake docker daemon, publishing the postgres port on the given host port.
+    '''
+
+    def __init__(self, cid, image, port, labels=None):
+        self.id = cid
+        self.short_id = cid[:10]
+        self.image = image
+        self.labels = labels or {}
+        self.status = 'running'
+        self.attrs = {'NetworkSettings': {'Ports': {ContainerManager.CONTAINER_PORT: [{'HostPort': str(port)}]}}}
+
+    def reload(self):
+        pass
+
+    def logs(self, tail=None):
+        return b'fatal: could not start'
+
+    def kill(self):
+        self.status = 'exited'
+
+
+class FakeContainers:
+    '''
+    The containers collection of the fake docker client. list() understands the label and status filters.
+    '''
+
+    def __init__(self, running):
+        self.running = list(running)
+        self.launched = []
+
+    def list(self, filters=None):
+        filters = filters or {}
+        key, _, value = filters.get('label', '').partition('=')
+        return [container for container in self.running if container.status == filters.get('status', 'running') and
+                (not key or container.labels.get(key) == value)]
+
+    def run(self, image, detach=False, ports=None, labels=None):
+        container = FakeContainer('launched%04d' % len(self.launched), image, ports[ContainerManager.CONTAINER_PORT],
+                                  labels)
+        self.launched.append(container)
+        self.running.append(container)
+        return container
+
+
+class FakeClient:
+
+    def __init__(self, running=()):
+        self.containers = FakeContainers(running)
+
+
+class FakeManager(ContainerManager):
+    '''
+    Container manager whose servers accept connections at once, except the images listed in broken, whose
+    containers exit instead.
+    '''
+
+    def __init__(self, client, broken=()):
+        super().__init__(client, timeout=1.0)
+        self.broken = broken
+
+    def isReady(self, server):
+        if (server.image in self.broken):
+            for container in self.client.containers.running:
+                if (container.id == server.containerId):
+                    container.status = 'exited'
+            return False
+        return True
+
+
+class TestContainerManager(unittest.TestCase):
+
+    def servers(self, images=('pre', 'post')):
+        return [PSQLServer('user', 'db', 'pw', 5432 + i, image) for i, image in enumerate(images)]
+
+    def testLaunchesLabelledContainers(self):
+        client = FakeClient()
+        servers = self.servers()
+        containers = FakeManager(client).start(servers)
+        self.assertEqual(client.containers.launched, containers)
+        self.assertEqual([5432, 5433], [server.port for server in servers])
+        self.assertEqual([container.id for container in containers], [server.containerId for server in servers])
+        self.assertEqual({ContainerManager.LABEL: 'pre/user/db'}, containers[0].labels)
+
+    def testOnlyLabelledContainersAreReused(self):
+        servers = self.servers()
+        # an unlabelled container of the same image, started by something else, is never adopted.
+        stranger = FakeContainer('stranger00', 'pre', 6000)
+        ours = FakeContainer('ours000000', 'post', 5432, {ContainerManager.LABEL: serverLabel(servers[1])})
+        client = FakeClient([stranger, ours])
+        manager = FakeManager(client)
+        containers = manager.start(servers)
+        self.assertIs(ours, containers[1])
+        self.assertEqual(5432, servers[1].port)
+        # the launched server skips the port the reused container holds.
+        self.assertEqual([containers[0]], client.containers.launched)
+        self.assertEqual(5433, servers[0].port)
+        self.assertEqual('running', stranger.status)
+        manager.stopAll()
+        self.assertEqual('exited', containers[0].status)
+        self.assertEqual('running', ours.status)
+
+    def testOtherServersAreNotReused(self):
+        servers = self.servers()
+        other = FakeContainer('other00000', 'pre', 5432, {ContainerManager.LABEL: 'pre/admin/otherdb'})
+        client = FakeClient([other])
+        FakeManager(client).start(servers)
+        self.assertEqual(2, len(client.containers.launched))
+
+    def testFailedStart(self):
+        client = FakeClient()
+        manager = FakeManager(client, broken=('post',))
+        with self.assertRaises(RuntimeError):
+            manager.start(self.servers())
+        # the server that did start is still known, so it can be stopped.
+        self.assertEqual(2, len(manager.started))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+from CopyStream import CopyStream, splitCopyLine, decodeCopyRow
+from DataComparator import DataComparator
+import unittest
+
+
+class FakeCopyCursor:
+    '''
+    Stands in for a psycopg2 cursor, copy_expert() writes the given COPY output in buffers of awkward sizes.
+    '''
+
+    def __init__(self, output, bufferSize=13):
+        self.output = output
+        self.bufferSize = bufferSize
+        self.copyQuery = None
+
+    def copy_expert(self, copyQuery, f, size=8192):
+        self.copyQuery = copyQuery
+        for i in range(0, len(self.output), self.bufferSize):
+            f.write(self.output[i:i + self.bufferSize])
+
+
+class TestCopyStream(unittest.TestCase):
+
+    def copyOutput(self, rows):
+        return b''.join(b'%d\t%d\ttext %d\n' % (pk, value, value) for pk, value in rows)
+
+    def readAll(self, stream, n):
+        rows = []
+        chunk = stream.fetchNext(n)
+        while (len(chunk) > 0):
+            self.assertLessEqual(len(chunk), n)
+            rows.extend(chunk)
+            chunk = stream.fetchNext(n)
+        stream.close()
+        return rows
+
+    def testSplitLine(self):
+        self.assertEqual((12, b'a\tb'), splitCopyLine(b'12\ta\tb', True))
+        self.assertEqual((12,), splitCopyLine(b'12', True))
+        self.assertEqual(('key\t1', b'x'), splitCopyLine(b'key\\t1\tx'))
+        # text keys that look like numbers stay text.
+        self.assertEqual(('007', b'x'), splitCopyLine(b'007\tx'))
+
+    def testDecodeRow(self):
+        row = splitCopyLine(b'7\tline\\nbreak\t\\N\t\\\\\t\\x41\\102\t', True)
+        self.assertEqual((7, 'line\nbreak', None, '\\', 'AB', ''), decodeCopyRow(row))
+        # rows that did not come out of a copy are left alone.
+        self.assertEqual((7, 1, 2), decodeCopyRow((7, 1, 2)))
+
+    def testStreamChunks(self):
+        cursor = FakeCopyCursor(self.copyOutput((i, i) for i in range(1000)))
+        rows = self.readAll(CopyStream(cursor, "select * from t order by id asc", integerKey=True), 64)
+        self.assertEqual("COPY (select * from t order by id asc) TO STDOUT", cursor.copyQuery)
+        self.assertEqual(list(range(1000)), [row[0] for row in rows])
+        self.assertEqual((999, b'999\ttext 999'), rows[-1])
+
+    def testCompareRawRows(self):
+        streamA = CopyStream(FakeCopyCursor(self.copyOutput((i, i) for i in range(100))), "a", integerKey=True)
+        streamB = CopyStream(FakeCopyCursor(self.copyOutput((i, i + (i == 50)) for i in range(1, 101))), "b",
+                             integerKey=True)
+        dataComparator = DataComparator(rowDecoder=decodeCopyRow)
+        dataComparator.compareStreams(lambda: streamA.fetchNext(10), lambda: streamB.fetchNext(10))
+        self.assertEqual(1, dataComparator.numCorruptionErrors)
+        self.assertEqual(1, dataComparator.numCopyOmissionErrors)
+        self.assertEqual(1, dataComparator.numCreationErrors)
+        self.assertEqual([(50, '50', 'text 50'), (50, '51', 'text 51')], dataComparator.corruptionErrors[0])
+
+    def testCompareTextKeys(self):
+        # a text key is never parsed, '007' and '7' are different rows and mixed keys still order as text.
+        streamA = CopyStream(FakeCopyCursor(b'007\ta\n7\tb\nabc\tc\n'), "a")
+        streamB = CopyStream(FakeCopyCursor(b'7\ta\nabc\tc\n'), "b")
+        dataComparator = DataComparator(rowDecoder=decodeCopyRow)
+        dataComparator.compareStreams(lambda: streamA.fetchNext(1), lambda: streamB.fetchNext(1))
+        self.assertEqual(1, dataComparator.numCorruptionErrors)
+        self.assertEqual(1, dataComparator.numCopyOmissionErrors)
+        self.assertEqual(0, dataComparator.numCreationErrors)
+        self.assertEqual([('007', 'a')], dataComparator.copyOmissionErrors)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,10 +5,11 @@ import copy
 import random
 
 class TestDataComparator(unittest.TestCase):
-
+    # comparator engine under test, subclasses of this test case swap in other engines.
+    comparatorClass = DataComparator
 
     def setUp(self):
-        self.DataComparator = DataComparator()
+        self.DataComparator = self.comparatorClass()
 
     def computeSingleChunk(self, alist, blist):
         self.DataComparator.prepareDataChunks(alist, blist)
@@ -169,21 +170,21 @@ class TestDataComparator(unittest.TestCase):
 
     def testIndividualHeavy(self):
         for i in range(100):
-            self.DataComparator = DataComparator()
+            self.DataComparator = self.comparatorClass()
             alist = self.setupAData()
             blist = self.setupBData(alist, len(alist) - 1, 0, 0)
             self.computeSingleChunk(alist, blist)
             self.assertErrorCount(len(alist) - 1, 0, 0)
 
         for i in range(100):
-            self.DataComparator = DataComparator()
+            self.DataComparator = self.comparatorClass()
             alist = self.setupAData()
             blist = self.setupBData(alist, 0, len(alist) - 1, 0)
             self.computeSingleChunk(alist, blist)
             self.assertErrorCount(0, len(alist) - 1, 0)
 
         for i in range(100):
-            self.DataComparator = DataComparator()
+            self.DataComparator = self.comparatorClass()
             alist = self.setupAData()
             blist = self.setupBData(alist, 0, 0, len(alist) - 1)
             self.assertEqual(2 * len(alist) - 1, len(blist))
@@ -271,6 +272,28 @@ class TestDataComparator(unittest.TestCase):
         self.DataComparator.finish()
         self.assertErrorCount(2, 0, 0)
 
+    def testInterleavedMatchesMulti(self):
+        alist = [(1, 1), (3, 3)]
+        blist = [(2, 2), (3, 4)]
+        self.computeChunk(alist, blist)
+        alist = [(2, 2), (4, 4)]
+        blist = [(1, 1), (4, 4)]
+        self.computeChunk(alist, blist)
+        self.DataComparator.finish()
+        self.assertErrorCount(1, 0, 0)
+        self.assertEqual(0, len(self.DataComparator.leftoverA))
+        self.assertEqual(0, len(self.DataComparator.leftoverB))
+
+    def testGappyKeysMulti(self):
+        # B lags behind A, so every chunk leaves rows waiting in the leftover hashmaps.
+        alist = self.setupAData(1000)
+        blist = self.setupBData(alist, 10, 10, 0)
+        for i in range(0, 1000, 100):
+            self.computeChunk(alist[i:i + 100], blist[max(0, i - 300):max(0, i - 200)])
+        self.computeChunk([], blist[700:])
+        self.DataComparator.finish()
+        self.assertErrorCount(10, 10, 0)
+
 
     def setupAData(self, n=None):
         '''
@@ -0,0 +1,60 @@
+from DigestPrePass import DigestPrePass
+from DataComparator import DataComparator
+from MergeComparator import MergeComparator
+from PrimaryKey import PrimaryKey
+from TestHelpers import FakeConnection
+import TestDataComparator
+import unittest
+
+
+class TestDigestPrePass(unittest.TestCase):
+
+    def setUp(self):
+        generator = TestDataComparator.TestDataComparator()
+        self.alist = sorted(generator.setupAData(3000), key=lambda row: row[0])
+        self.blist = sorted(generator.setupBData(self.alist, 40, 30, 20), key=lambda row: row[0])
+
+    def assertMatchesFullScan(self, comparatorClass):
+        expected = comparatorClass()
+        expected.prepareDataChunks(self.alist, self.blist)
+        expected.finish()
+
+        source = FakeConnection(self.alist)
+        target = FakeConnection(self.blist)
+        prePass = DigestPrePass(source, target, 25)
+        dataComparator = comparatorClass()
+        prePass.compare(dataComparator, 128)
+
+        self.assertEqual(expected.numCorruptionErrors, dataComparator.numCorruptionErrors)
+        self.assertEqual(30, dataComparator.numCopyOmissionErrors)
+        self.assertEqual(20, dataComparator.numCreationErrors)
+        self.assertEqual(sorted(expected.corruptionErrors), sorted(dataComparator.corruptionErrors))
+        self.assertEqual(len(self.alist), dataComparator.totalTableSizeA)
+        self.assertEqual(len(self.blist), dataComparator.totalTableSizeB)
+        self.assertEqual(len(self.alist) + len(self.blist), prePass.rowsDigested)
+        # only the rows that differ are fetched in full.
+        self.assertEqual(expected.numCorruptionErrors + 30, source.rowsByKey)
+        self.assertEqual(expected.numCorruptionErrors + 20, target.rowsByKey)
+
+    def testHashComparatorMatchesFullScan(self):
+        self.assertMatchesFullScan(DataComparator)
+
+    def testMergeComparatorMatchesFullScan(self):
+        self.assertMatchesFullScan(MergeComparator)
+
+    def testDigestQueries(self):
+        source = FakeConnection([])
+        source.primaryKey = PrimaryKey(["tenant", "seq"], [True, False])
+        digestKey, query = DigestPrePass(source, None).digestKey()
+        self.assertEqual('select "tenant", "seq", decode(md5(t::text), \'hex\') from %s t '
+                         'order by "tenant" COLLATE "C", "seq"', query)
+        self.assertEqual((('a', 1), b'digest'), digestKey.keyRow(('a', 1, b'digest')))
+
+        source.primaryKey = PrimaryKey(["id"], leading=True).project(['"total"', 'md5("notes"::text) AS "notes"'])
+        digestKey, query = DigestPrePass(source, None).digestKey()
+        self.assertEqual('select "id", decode(md5(p::text), \'hex\') from (select "id", "total", '
+                         'md5("notes"::text) AS "notes" from %s t) p order by "id"', query)
+
+
+if __name__ == '__main__':
+    unittest.main()
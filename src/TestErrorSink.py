@@ -0,0 +1,126 @@
+from DataComparator import DataComparator
+from ErrorSink import ListErrorSink, CsvErrorSink, CsvErrorSinkFactory, columnDiffs, zstandard
+import unittest
+import tempfile
+import pickle
+import json
+import gzip
+import csv
+import io
+import os
+
+
+class TestErrorSink(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.reportDir = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def readCsv(self, path):
+        if (path.endswith('.zst')):
+            with open(path, 'rb') as f:
+                reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+                return list(csv.reader(io.TextIOWrapper(reader, encoding='utf-8', newline='')))
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', newline='') as f:
+            return list(csv.reader(f))
+
+    def testListSinkWritesPairs(self):
+        sink = ListErrorSink("corruption-errors.csv")
+        sink.add((1, 1), (1, 2))
+        sink.add((2, 2), (2, 3))
+        sink.finish(self.reportDir)
+        rows = self.readCsv(os.path.join(self.reportDir, "corruption-errors.csv"))
+        self.assertEqual([['1', '1'], ['1', '2'], ['2', '2'], ['2', '3']], rows)
+        self.assertEqual([[(1, 1), (1, 2)], [(2, 2), (2, 3)]], sink)
+
+    def testCsvSinkStreams(self):
+        path = os.path.join(self.reportDir, "creation-errors.csv")
+        sink = CsvErrorSink(path)
+        for i in range(1000):
+            sink.add((i, i * 2))
+        sink.flush()
+        # flushed errors are on disk before the sink is closed.
+        self.assertEqual(1000, len(self.readCsv(path)))
+        sink.close()
+        self.assertEqual(1000, len(sink))
+
+    def testGzipSinkMerge(self):
+        factory = CsvErrorSinkFactory(self.reportDir, compress=True)
+        sink = factory("omission-errors.csv")
+        shard = factory.forShard(0)("omission-errors.csv")
+        sink.add((1, 'a'))
+        shard.add((2, 'b'))
+        shard.add((3, 'c'))
+        # shards come back from worker processes pickled.
+        shard = pickle.loads(pickle.dumps(shard))
+        sink.merge(shard)
+        sink.add((4, 'd'))
+        sink.close()
+        rows = self.readCsv(os.path.join(self.reportDir, "omission-errors.csv.gz"))
+        self.assertEqual([['1', 'a'], ['2', 'b'], ['3', 'c'], ['4', 'd']], rows)
+        self.assertEqual(4, len(sink))
+        self.assertFalse(os.path.exists(os.path.join(self.reportDir, "shard-0")))
+
+    def testComparatorStreamsErrors(self):
+        dataComparator = DataComparator(CsvErrorSinkFactory(self.reportDir))
+        dataComparator.prepareDataChunks([(1, 1), (2, 2), (3, 3)], [(1, 2), (3, 3), (4, 4)])
+        dataComparator.finish()
+        dataComparator.produceReports(self.reportDir)
+        self.assertEqual([['1', '1'], ['1', '2']], self.readCsv(os.path.join(self.reportDir, "corruption-errors.csv")))
+        self.assertEqual([['2', '2']], self.readCsv(os.path.join(self.reportDir, "omission-errors.csv")))
+        self.assertEqual([['4', '4']], self.readCsv(os.path.join(self.reportDir, "creation-errors.csv")))
+
+    def testColumnDiffs(self):
+        self.assertEqual([[7, 2, 'b', 'B'], [7, 4, None, 'extra']],
+                         columnDiffs((7, 'a', 'b', 1.5), (7, 'a', 'B', 1.5, 'extra')))
+        self.assertEqual([], columnDiffs((7, 'a'), (7, 'a')))
+
+    def testSinksWriteDiffs(self):
+        sink = ListErrorSink("corruption-errors.csv", diffs=True)
+        sink.add((1, 'a', 'x'), (1, 'a', 'y'))
+        sink.add((2, 'b', 'x'), (2, 'c', 'z'))
+        sink.finish(self.reportDir)
+        expected = [['1', '2', 'x', 'y'], ['2', '1', 'b', 'c'], ['2', '2', 'x', 'z']]
+        self.assertEqual(expected, self.readCsv(os.path.join(self.reportDir, "corruption-errors.csv")))
+        # the recorded errors keep both rows.
+        self.assertEqual([(1, 'a', 'x'), (1, 'a', 'y')], sink[0])
+
+        streamed = CsvErrorSinkFactory(os.path.join(self.reportDir, "streamed"), diffs=True)("corruption-errors.csv")
+        for record in sink:
+            streamed.add(*record)
+        streamed.close()
+        self.assertEqual(expected, self.readCsv(streamed.path))
+        self.assertEqual(2, len(streamed))
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed.")
+    def testZstdSinkMerge(self):
+        factory = CsvErrorSinkFactory(self.reportDir, compress="zstd")
+        sink = factory("creation-errors.csv")
+        shard = factory.forShard(1)("creation-errors.csv")
+        sink.add((1, 'a'))
+        state = sink.checkpoint()
+        sink.add((5, 'e'))
+        sink.restore(state)
+        shard.add((2, 'b'))
+        sink.merge(pickle.loads(pickle.dumps(shard)))
+        sink.close()
+        self.assertEqual([['1', 'a'], ['2', 'b']], self.readCsv(os.path.join(self.reportDir, "creation-errors.csv.zst")))
+
+    def testJsonSummaryOfAnEmptySource(self):
+        dataComparator = DataComparator()
+        dataComparator.prepareDataChunks([], [(1, 1)])
+        dataComparator.finish()
+        dataComparator.produceReports(self.reportDir)
+        with open(os.path.join(self.reportDir, "summary.json")) as f:
+            summary = json.load(f)
+        self.assertEqual(0, summary['rowsPreMigration'])
+        self.assertEqual(1, summary['creationErrors'])
+        self.assertIsNone(summary['errorRate'])
+
+
+if __name__ == "__main__":
+    unittest.main()
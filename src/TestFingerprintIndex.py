@@ -0,0 +1,101 @@
+from FingerprintIndex import FingerprintIndex, buildFingerprintIndex, sourceIdentity
+from DataComparator import DataComparator
+from PrimaryKey import PrimaryKey
+from PSQLServer import PSQLServer
+from TestHelpers import FakeConnection
+import TestDataComparator
+import unittest
+import tempfile
+import hashlib
+import os
+
+
+class TestFingerprintIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "indexes", "fake.fpidx")
+        self.generator = TestDataComparator.TestDataComparator()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testBuildAndFind(self):
+        alist = self.generator.setupAData(500)
+        index = buildFingerprintIndex(FakeConnection(alist), self.path, 64)
+        self.assertEqual(500, len(index))
+        self.assertEqual(hashlib.md5(repr(alist[10]).encode()).digest(), index.find(alist[10][0]))
+        self.assertIsNone(index.find(-1))
+        self.assertEqual([row[0] for row in alist], [key for key, digest in index.records(100)])
+        index.close()
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def testCompareMatchesFullScan(self):
+        alist = self.generator.setupAData(3000)
+        blist = sorted(self.generator.setupBData(alist, 40, 30, 20), key=lambda row: row[0])
+        expected = DataComparator()
+        expected.prepareDataChunks(sorted(alist, key=lambda row: row[0]), blist)
+        expected.finish()
+
+        buildFingerprintIndex(FakeConnection(alist), self.path).close()
+        source = FakeConnection(alist)
+        target = FakeConnection(blist)
+        index = FingerprintIndex(self.path)
+        dataComparator = DataComparator()
+        index.compare(source, target, dataComparator, 128, 50)
+        index.close()
+
+        self.assertEqual(expected.numCorruptionErrors, dataComparator.numCorruptionErrors)
+        self.assertEqual(30, dataComparator.numCopyOmissionErrors)
+        self.assertEqual(20, dataComparator.numCreationErrors)
+        self.assertEqual(len(alist), dataComparator.totalTableSizeA)
+        self.assertEqual(len(blist), dataComparator.totalTableSizeB)
+        # only the rows of the keys that differ were fetched.
+        self.assertEqual(expected.numCorruptionErrors + 30, source.rowsByKey)
+        self.assertEqual(expected.numCorruptionErrors + 20, target.rowsByKey)
+
+    def testRejectsTruncatedFile(self):
+        buildFingerprintIndex(FakeConnection(self.generator.setupAData(100)), self.path).close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaises(ValueError):
+            FingerprintIndex(self.path)
+
+    def testIdentityIsChecked(self):
+        identity = {'host': 'localhost', 'port': 5432, 'dbname': 'source', 'table': 'fake', 'key': ['id'],
+                    'oid': 16384, 'relfilenode': 16384}
+        buildFingerprintIndex(FakeConnection(self.generator.setupAData(100)), self.path, identity=identity).close()
+        index = FingerprintIndex(self.path, dict(identity))
+        self.assertEqual(identity, index.identity)
+        self.assertEqual(100, len(index))
+        index.close()
+        # the same table name in another database, or the table recreated, is not the indexed source.
+        for change in ({'dbname': 'other'}, {'port': 5433}, {'relfilenode': 16390}):
+            with self.assertRaises(ValueError):
+                FingerprintIndex(self.path, dict(identity, **change))
+
+    def testSourceIdentity(self):
+        class Source(FakeConnection):
+            def answer(self, psqlQuery, params):
+                return [(16384, 16401)]
+
+        source = Source([], PrimaryKey(["order_no"], integer=[True]))
+        source.psqldb = PSQLServer("user", "orders", "password", 5433)
+        self.assertEqual({'host': 'localhost', 'port': 5433, 'dbname': 'orders', 'table': 'fake', 'key': ['order_no'],
+                          'oid': 16384, 'relfilenode': 16401}, sourceIdentity(source))
+        self.assertIn("'fake'::regclass", source.queries[0])
+
+    def testDiscoveredKey(self):
+        source = FakeConnection(self.generator.setupAData(10), PrimaryKey(["order_no"], integer=[True]))
+        buildFingerprintIndex(source, self.path).close()
+        self.assertEqual('select "order_no", decode(md5(t::text), \'hex\') from fake t order by "order_no"',
+                         source.queries[0])
+        for primaryKey in (PrimaryKey(["code"], [True]), PrimaryKey(["a", "b"], integer=[True, True])):
+            source = FakeConnection(self.generator.setupAData(10), primaryKey)
+            with self.assertRaises(ValueError):
+                buildFingerprintIndex(source, self.path)
+            self.assertEqual([], source.queries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import hashlib
+
+
+class FakeConnection:
+    '''
+    Imitates the parts of PsycoConnection the comparison modes use, over an in memory table sorted by primary key.
+    The table name is put into every query the way PsycoConnection does, and the queries are kept. A streamed query
+    returns (primary key, md5) pairs, hashing the repr of each row where postgres would hash its text; tests of
+    other queries override streamRows() and answer().
+    '''
+
+    def __init__(self, rows, primaryKey=None):
+        self.rows = sorted(rows, key=lambda row: row[0])
+        self.tablename = 'fake'
+        self.primaryKey = primaryKey
+        self.stream = None
+        self.n = 0
+        self.queries = []
+        self.rowsByKey = 0
+
+    def execute(self, psqlQuery, params=None):
+        psqlQuery = psqlQuery % self.tablename
+        self.queries.append(psqlQuery)
+        return self.answer(psqlQuery, params)
+
+    def answer(self, psqlQuery, params):
+        '''
+        :param psqlQuery: a query run through execute(), with the table name in it.
+        :param params: its parameters.
+        :return: its rows.
+        '''
+        return []
+
+    def query(self, psqlQuery, n=None, params=None):
+        self.queries.append(psqlQuery % self.tablename)
+        self.stream = self.streamRows()
+        self.n = n
+
+    def streamRows(self):
+        '''
+        :return: the rows of a streamed query.
+        '''
+        return [(row[0], hashlib.md5(repr(row).encode()).digest()) for row in self.rows]
+
+    def fetchNext(self, n=None):
+        n = n if n else self.n
+        chunk = self.stream[:n]
+        del self.stream[:n]
+        return chunk
+
+    def closeStream(self):
+        self.stream = None
+
+    def fetchByKeys(self, keys):
+        keys = set(keys)
+        self.rowsByKey += len(keys)
+        return [row for row in self.rows if row[0] in keys]
+
+
+class Crash(Exception):
+    '''
+    Stands in for the comparison dying mid-table.
+    '''
+
+
+def chunkFetcher(rows, n, crashAfter=None):
+    '''
+    Imitates PsycoConnection.fetchNext over an in memory table.
+    :param rows: the full ordered table.
+    :param n: size of each chunk.
+    :param crashAfter: number of chunks handed out before every further call raises Crash, None to never crash.
+    :return: a callable that returns the next chunk each time it is called, with the number of calls in its calls
+    attribute.
+    '''
+    position = [0]
+
+    def fetchNext():
+        if (crashAfter is not None and fetchNext.calls >= crashAfter):
+            raise Crash()
+        fetchNext.calls += 1
+        chunk = rows[position[0]:position[0] + n]
+        position[0] += n
+        return chunk
+    fetchNext.calls = 0
+    return fetchNext
@@ -0,0 +1,119 @@
+from Metrics import Metrics, CProfileHook
+from DataComparator import DataComparator
+from MergeComparator import MergeComparator
+import TestDataComparator
+import unittest
+import tempfile
+import threading
+import pickle
+import json
+import sys
+import os
+
+
+class TestMetrics(unittest.TestCase):
+
+    def testTimersCountersAndGauges(self):
+        metrics = Metrics()
+        for seconds in (0.5, 1.5):
+            metrics.time('process', seconds)
+        with metrics.timer('fetch'):
+            pass
+        metrics.count('rowsA', 100)
+        metrics.count('rowsA', 50)
+        metrics.gauge('leftoverA', 10)
+        metrics.gauge('leftoverA', 3)
+        metrics.stop()
+        metrics.elapsed = 10.0
+
+        result = metrics.toDict()
+        self.assertEqual(2, result['timers']['process']['count'])
+        self.assertEqual(2.0, result['timers']['process']['totalSeconds'])
+        self.assertEqual(1.5, result['timers']['process']['maxSeconds'])
+        self.assertEqual(1.0, result['timers']['process']['meanSeconds'])
+        self.assertEqual(1, result['timers']['fetch']['count'])
+        self.assertEqual(150, result['counters']['rowsA']['total'])
+        self.assertEqual(15.0, result['counters']['rowsA']['perSecond'])
+        self.assertEqual({'last': 3, 'max': 10}, result['gauges']['leftoverA'])
+
+    def testMerge(self):
+        first = Metrics()
+        first.time('process', 1.0)
+        first.count('rowsA', 10)
+        first.gauge('leftoverA', 5)
+        second = Metrics()
+        second.time('process', 3.0)
+        second.count('rowsA', 20)
+        second.gauge('leftoverA', 8)
+        first.merge(second)
+        self.assertEqual([2, 4.0, 3.0], first.timers['process'])
+        self.assertEqual(30, first.counters['rowsA'])
+        self.assertEqual(8, first.gauges['leftoverA'][1])
+
+    def testHooks(self):
+        events = []
+        metrics = Metrics()
+        metrics.addHook(lambda event, name, value: events.append((event, name)))
+        profiler = CProfileHook(['process'])
+        metrics.addHook(profiler)
+        with metrics.timer('process'):
+            sum(range(1000))
+        metrics.count('rowsA')
+        self.assertEqual([('begin', 'process'), ('end', 'process'), ('count', 'rowsA')], events)
+        self.assertEqual(0, profiler.depth)
+        # hooks stay in the process that registered them.
+        self.assertEqual([], pickle.loads(pickle.dumps(metrics)).hooks)
+
+    def testThreadsRecordTogether(self):
+        metrics = Metrics()
+
+        def record():
+            for i in range(20000):
+                metrics.count('rowsA')
+                metrics.time('fetch', 0.001)
+                metrics.gauge('leftoverA', i)
+
+        # a tiny switch interval makes the threads interleave within the updates.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=record) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(80000, metrics.counters['rowsA'])
+        self.assertEqual(80000, metrics.timers['fetch'][0])
+        self.assertEqual(19999, metrics.gauges['leftoverA'][1])
+        copy = pickle.loads(pickle.dumps(metrics))
+        copy.count('rowsA')
+        self.assertEqual(80001, copy.counters['rowsA'])
+
+    def testComparatorWritesMetrics(self):
+        generator = TestDataComparator.TestDataComparator()
+        alist = generator.setupAData(1000)
+        blist = sorted(generator.setupBData(alist, 10, 10, 10), key=lambda row: row[0])
+        for comparatorClass in (DataComparator, MergeComparator):
+            dataComparator = comparatorClass()
+            chunksA = [alist[i:i + 100] for i in range(0, len(alist), 100)] + [[]]
+            chunksB = [blist[i:i + 100] for i in range(0, len(blist), 100)] + [[]]
+            dataComparator.compareStreams(lambda: chunksA.pop(0) if chunksA else [],
+                                          lambda: chunksB.pop(0) if chunksB else [])
+            with tempfile.TemporaryDirectory() as reportDir:
+                dataComparator.produceReports(reportDir)
+                with open(os.path.join(reportDir, "metrics.json")) as f:
+                    result = json.load(f)
+            self.assertEqual(len(alist), result['counters']['rowsA']['total'])
+            self.assertEqual(len(blist), result['counters']['rowsB']['total'])
+            self.assertGreater(result['counters']['bytesA']['total'], 0)
+            self.assertIn('fetch', result['timers'])
+            self.assertIn('report', result['timers'])
+            if (comparatorClass is DataComparator):
+                self.assertIn('process', result['timers'])
+                self.assertIn('leftoverA', result['gauges'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+from MigrationReport import MigrationReport
+from Metrics import Metrics
+from PrimaryKey import PrimaryKey, DEFAULT_PRIMARY_KEY
+from TestContainerManager import FakeClient, FakeManager
+import unittest
+from unittest import mock
+import tempfile
+import json
+import os
+
+
+def bareReport(**attributes):
+    '''
+    :param attributes: attributes set on the report.
+    :return: a MigrationReport that has not started containers or connected to anything.
+    '''
+    migrationReport = MigrationReport.__new__(MigrationReport)
+    migrationReport.metrics = Metrics()
+    migrationReport.servers = []
+    migrationReport.containers = []
+    for name, value in attributes.items():
+        setattr(migrationReport, name, value)
+    return migrationReport
+
+
+class ScanConnection:
+    '''
+    Connection whose table has the given primary key, the scans started on it are kept.
+    '''
+
+    def __init__(self, primaryKey):
+        self.tablename = 'fake'
+        self.primaryKey = primaryKey
+        self.scans = []
+
+    def discoverPrimaryKey(self):
+        return self.primaryKey
+
+    def keysetScan(self, n=None, lastKey=None):
+        self.scans.append(('keyset', n, lastKey))
+
+    def scanTable(self, n=None, lastKey=None):
+        self.scans.append(('scan', n, lastKey))
+
+
+class TableServer:
+    '''
+    Database server holding tables in memory, as a dictionary of table name to its rows in primary key order. A
+    table whose rows are an exception raises it when it is read.
+    '''
+
+    def __init__(self, dbname, tables):
+        self.dbname = dbname
+        self.port = 5432
+        self.tables = tables
+
+
+class TableCursor:
+
+    def __init__(self, psqldb):
+        self.psqldb = psqldb
+
+    def execute(self, statement, params=None):
+        pass
+
+    def fetchall(self):
+        return [(tablename,) for tablename in self.psqldb.tables]
+
+
+class TableConnection:
+    '''
+    Stands in for PsycoConnection over a TableServer, every table is keyed by id.
+    '''
+
+    def __init__(self, psqldb, streaming=False, itersize=2000, metrics=None, pool=None):
+        self.psqldb = psqldb
+        self.pool = pool
+        self.cursor = TableCursor(psqldb)
+        self.tablename = ''
+        self.primaryKey = None
+        self.stream = []
+        self.n = 0
+
+    def discoverPrimaryKey(self):
+        self.primaryKey = DEFAULT_PRIMARY_KEY
+        return self.primaryKey
+
+    def scanTable(self, n=None, lastKey=None):
+        rows = self.psqldb.tables[self.tablename]
+        if (isinstance(rows, Exception)):
+            raise rows
+        self.stream = list(rows)
+        self.n = n
+
+    def fetchNext(self, n=None):
+        n = n if n else self.n
+        chunk = self.stream[:n]
+        del self.stream[:n]
+        return chunk
+
+    def close(self):
+        pass
+
+
+class TestMigrationReport(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def testFailedStartupStopsTheContainers(self):
+        inifile = os.path.join(self.tempdir.name, "init.ini")
+        with open(inifile, 'w') as f:
+            f.write("user,db,pw,pre\nuser,db,pw,post\n")
+        client = FakeClient()
+        migrationReport = bareReport(containerManager=FakeManager(client, broken=('post',)))
+        with self.assertRaises(RuntimeError):
+            migrationReport.initialize(inifile, 5432)
+        self.assertEqual(2, len(client.containers.launched))
+        self.assertEqual(['exited', 'exited'], [container.status for container in client.containers.launched])
+        self.assertEqual([], migrationReport.containerManager.started)
+
+    def testKeysetNeedsAnIndexOrderedKey(self):
+        migrationReport = bareReport(keyset=True, copy=False, projection=None)
+        connections = [ScanConnection(PrimaryKey(["id"], integer=[True])) for i in range(2)]
+        migrationReport.startScans(connections, 10, [None, 5])
+        self.assertEqual([[('keyset', 10, None)], [('keyset', 10, 5)]], [c.scans for c in connections])
+
+        connections = [ScanConnection(PrimaryKey(["tenant", "seq"], [False, False])) for i in range(2)]
+        migrationReport.startScans(connections, 10)
+        self.assertEqual([('keyset', 10, None)], connections[0].scans)
+
+        # a text key of another collation than "C" is refused before anything is read.
+        connections = [ScanConnection(PrimaryKey(["code"], [True])) for i in range(2)]
+        with self.assertRaises(ValueError):
+            migrationReport.startScans(connections, 10)
+        self.assertEqual([[], []], [c.scans for c in connections])
+        migrationReport.keyset = False
+        migrationReport.startScans(connections, 10)
+        self.assertEqual([('scan', 10, None)], connections[0].scans)
+
+    def multiTableReport(self):
+        rows = [(i, 'row %d' % i) for i in range(30)]
+        changed = [row for row in rows if row[0] != 3] + [(40, 'new')]
+        changed[10] = (changed[10][0], 'corrupted')
+        serverA = TableServer('pre', {'orders': rows, 'users': rows, 'broken': RuntimeError('relation is locked'),
+                                      'legacy': rows})
+        serverB = TableServer('post', {'orders': changed, 'users': rows, 'broken': rows, 'audit': rows})
+        return bareReport(connections=[TableConnection(serverA), TableConnection(serverB)],
+                          reportDir=self.tempdir.name, streaming=False, itersize=2000, streamErrors=False,
+                          compressErrors=False, copy=False, reportFormat='csv', corruptionDiffs=False,
+                          profileStages=None, profilers={}, checkpointDir=None, resume=False, keyset=False,
+                          projection=None, chunkMemory=None, tableComparators={}, tableFailures={},
+                          targetComparators={}, dataComparator=None)
+
+    def testTableLists(self):
+        migrationReport = self.multiTableReport()
+        migrationReport.verifyConnections()
+        self.assertEqual(['broken', 'orders', 'users'], migrationReport.tableNames)
+        self.assertEqual(['legacy'], migrationReport.missingTables)
+        self.assertEqual(['audit'], migrationReport.extraTables)
+        # single table comparisons read the first shared table.
+        self.assertEqual(['broken', 'broken'], [connection.tablename for connection in migrationReport.connections])
+
+    def testFailedTableIsIsolated(self):
+        migrationReport = self.multiTableReport()
+        migrationReport.verifyConnections()
+        with mock.patch('MigrationReport.PsycoConnection', TableConnection):
+            migrationReport.compareTables(7, workers=2)
+        self.assertEqual(['broken'], list(migrationReport.tableFailures))
+        self.assertIsInstance(migrationReport.tableFailures['broken'], RuntimeError)
+        orders = migrationReport.tableComparators['orders']
+        self.assertEqual((1, 1, 1), (orders.numCorruptionErrors, orders.numCopyOmissionErrors,
+                                     orders.numCreationErrors))
+        users = migrationReport.tableComparators['users']
+        self.assertEqual((30, 0), (users.totalTableSizeA, users.numCorruptionErrors + users.numCopyOmissionErrors +
+                                   users.numCreationErrors))
+
+        migrationReport.generateReport()
+        with open(os.path.join(self.tempdir.name, "migration-report.txt")) as f:
+            report = f.read()
+        self.assertIn("Tables Compared:\t2\n", report)
+        self.assertIn("Tables Failed:\t\t1\n", report)
+        self.assertIn("Tables Missing From Post-migration:\t1\n\tlegacy\n", report)
+        self.assertIn("Tables Created in Post-migration:\t1\n\taudit\n", report)
+        # a section per table, in table order, the failed one holding its error.
+        sections = report.split('-' * 80 + '\nTable: ')[1:]
+        self.assertEqual(['broken', 'orders', 'users'], [section.split('\n')[0] for section in sections])
+        self.assertIn("Comparison failed: relation is locked", sections[0])
+        with open(os.path.join(self.tempdir.name, "summary.json")) as f:
+            summary = json.load(f)
+        self.assertEqual({'broken': 'relation is locked'}, summary['failedTables'])
+        self.assertEqual(['orders', 'users'], sorted(summary['tables']))
+        self.assertEqual(['legacy'], summary['missingTables'])
+        self.assertEqual(['audit'], summary['extraTables'])
+        for tablename in ('orders', 'users'):
+            self.assertTrue(os.path.exists(os.path.join(self.tempdir.name, tablename, "migration-report.txt")))
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir.name, 'broken')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+from MultiTargetComparator import MultiTargetComparator
+from DataComparator import DataComparator
+from MergeComparator import MergeComparator
+from CompactDataComparator import CompactDataComparator
+from TestHelpers import chunkFetcher
+import TestDataComparator
+import unittest
+
+
+class TestMultiTargetComparator(unittest.TestCase):
+
+    def setUp(self):
+        generator = TestDataComparator.TestDataComparator()
+        self.alist = sorted(generator.setupAData(2000), key=lambda row: row[0])
+        # targets with different numbers of errors, and so of rows.
+        self.targets = [sorted(generator.setupBData(self.alist, corrupt, omit, create), key=lambda row: row[0])
+                        for corrupt, omit, create in ((0, 0, 0), (30, 20, 10), (5, 150, 40))]
+
+    def compareAll(self, comparatorClass, n):
+        comparators = [comparatorClass() for target in self.targets]
+        source = chunkFetcher(self.alist, n)
+        MultiTargetComparator(comparators).compareStreams(source, [chunkFetcher(target, n)
+                                                                   for target in self.targets])
+        return comparators, source
+
+    def testMatchesPairwiseComparisons(self):
+        for comparatorClass in (DataComparator, MergeComparator, CompactDataComparator):
+            comparators, source = self.compareAll(comparatorClass, 100)
+            for dataComparator, target in zip(comparators, self.targets):
+                expected = comparatorClass()
+                expected.compareStreams(chunkFetcher(self.alist, 100), chunkFetcher(target, 100))
+                self.assertEqual(expected.numCorruptionErrors, dataComparator.numCorruptionErrors)
+                self.assertEqual(expected.numCopyOmissionErrors, dataComparator.numCopyOmissionErrors)
+                self.assertEqual(expected.numCreationErrors, dataComparator.numCreationErrors)
+                self.assertEqual(len(self.alist), dataComparator.totalTableSizeA)
+                self.assertEqual(len(target), dataComparator.totalTableSizeB)
+
+    def testReadsSourceOnce(self):
+        comparators, source = self.compareAll(DataComparator, 100)
+        # one call per chunk plus the one returning the empty chunk.
+        self.assertEqual(len(self.alist) // 100 + 1, source.calls)
+        for dataComparator in comparators:
+            self.assertEqual(len(self.alist), dataComparator.metrics.counters['rowsA'])
+        self.assertEqual(0, comparators[0].numCorruptionErrors + comparators[0].numCopyOmissionErrors +
+                         comparators[0].numCreationErrors)
+        self.assertEqual(30, comparators[1].numCorruptionErrors)
+        self.assertEqual(150, comparators[2].numCopyOmissionErrors)
+        self.assertEqual(40, comparators[2].numCreationErrors)
+
+    def testRejectsMissingFetchers(self):
+        with self.assertRaises(ValueError):
+            MultiTargetComparator([DataComparator(), DataComparator()]).compareStreams(
+                chunkFetcher(self.alist, 100), [chunkFetcher(self.alist, 100)])
+
+
+if __name__ == '__main__':
+    unittest.main()
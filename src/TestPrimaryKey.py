@@ -0,0 +1,100 @@
+from PrimaryKey import PrimaryKey, discoverPrimaryKey, DEFAULT_PRIMARY_KEY
+from DataComparator import DataComparator
+from MergeComparator import MergeComparator
+import unittest
+
+
+class FakeCursor:
+    '''
+    Returns canned catalog rows and remembers the last statement.
+    '''
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statement = None
+        self.params = None
+
+    def execute(self, statement, params=None):
+        self.statement = statement
+        self.params = params
+
+    def fetchall(self):
+        return self.rows
+
+
+class TestPrimaryKey(unittest.TestCase):
+
+    def testDiscovery(self):
+        cursor = FakeCursor([("id", False, 1, True)])
+        primaryKey = discoverPrimaryKey(cursor, "users")
+        self.assertEqual(("users",), cursor.params)
+        self.assertEqual(["id"], primaryKey.columns)
+        self.assertTrue(primaryKey.leading)
+        self.assertFalse(primaryKey.composite)
+        self.assertEqual([True], primaryKey.integer)
+
+        primaryKey = discoverPrimaryKey(FakeCursor([("tenant", True, 2, False), ("seq", False, 3, True)]), "orders")
+        self.assertEqual(["tenant", "seq"], primaryKey.columns)
+        self.assertEqual([False, True], primaryKey.project(['"total"']).integer)
+        self.assertTrue(primaryKey.composite)
+        self.assertFalse(primaryKey.leading)
+        self.assertIsNone(discoverPrimaryKey(FakeCursor([]), "logs"))
+
+    def testLeadingKeyKeepsRows(self):
+        query, params = DEFAULT_PRIMARY_KEY.selectQuery()
+        self.assertEqual('select * from %s t order by "id"', query)
+        self.assertIsNone(params)
+        query, params = DEFAULT_PRIMARY_KEY.pageQuery(41)
+        self.assertEqual('select * from %s t where ("id") > (%%s) order by "id" limit %%s', query)
+        self.assertEqual([41], params)
+        self.assertEqual((1, 'a'), DEFAULT_PRIMARY_KEY.keyRow((1, 'a')))
+
+    def testKeyRange(self):
+        primaryKey = PrimaryKey(["order_no"], integer=[True])
+        query, params = primaryKey.selectQuery(None, 10, 20)
+        self.assertEqual('select "order_no", t.* from %s t where "order_no" >= %%s and "order_no" < %%s '
+                         'order by "order_no"', query)
+        self.assertEqual([10, 20], params)
+        # a resumed scan keeps its range.
+        query, params = primaryKey.selectQuery(14, None, 20)
+        self.assertEqual('select "order_no", t.* from %s t where ("order_no") > (%%s) and "order_no" < %%s '
+                         'order by "order_no"', query)
+        self.assertEqual([14, 20], params)
+
+    def testCompositeKey(self):
+        primaryKey = PrimaryKey(["tenant", "seq"], [True, False])
+        query, params = primaryKey.selectQuery(('acme', 7))
+        self.assertEqual('select "tenant", "seq", t.* from %s t where ("tenant" COLLATE "C", "seq") > (%%s, %%s) '
+                         'order by "tenant" COLLATE "C", "seq"', query)
+        self.assertEqual(['acme', 7], params)
+        self.assertEqual((('acme', 7), 'acme', 7, 'x'), primaryKey.keyRow(('acme', 7, 'acme', 7, 'x')))
+
+        query, params = primaryKey.byKeysQuery([('acme', 7), ('zeta', 1)])
+        self.assertIn('where ("tenant", "seq") in %%s', query)
+        self.assertEqual(((('acme', 7), ('zeta', 1)),), params)
+
+        query, params = PrimaryKey(["code"]).byKeysQuery([3, 4])
+        self.assertIn('where "code" = any(%%s)', query)
+        self.assertEqual(([3, 4],), params)
+
+    def testComparatorsWithCompositeKeys(self):
+        primaryKey = PrimaryKey(["tenant", "seq"])
+        rowsA = [(tenant, seq, tenant, seq, 'value %d' % seq) for tenant in ('a', 'b', 'c') for seq in range(50)]
+        rowsB = [row for row in rowsA if row[1] != 10]
+        rowsB[5] = rowsB[5][:4] + ('corrupted',)
+        rowsB.append(('d', 0, 'd', 0, 'created'))
+        alist = primaryKey.keyRows(rowsA)
+        blist = primaryKey.keyRows(rowsB)
+        for comparatorClass in (DataComparator, MergeComparator):
+            chunksA = [alist[i:i + 40] for i in range(0, len(alist), 40)]
+            chunksB = [blist[i:i + 40] for i in range(0, len(blist), 40)]
+            dataComparator = comparatorClass()
+            dataComparator.compareStreams(lambda: chunksA.pop(0) if chunksA else [],
+                                          lambda: chunksB.pop(0) if chunksB else [])
+            self.assertEqual(1, dataComparator.numCorruptionErrors)
+            self.assertEqual(3, dataComparator.numCopyOmissionErrors)
+            self.assertEqual(1, dataComparator.numCreationErrors)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+from RangeChecksum import RangeChecksum
+from DataComparator import DataComparator
+from PrimaryKey import PrimaryKey
+import TestHelpers
+import unittest
+import bisect
+
+
+class FakeConnection(TestHelpers.FakeConnection):
+    '''
+    Answers the checksum queries over an in memory table with an integer key in row[0]. A row hashes to the hash of
+    its repr, and width_bucket() maps a key to the number of bucket starts at or below it, as postgres does. The
+    key bounds of the range queries are kept.
+    '''
+
+    def __init__(self, rows, primaryKey=None):
+        super().__init__(rows, primaryKey)
+        self.ranges = []
+
+    def inRange(self, lo, hi):
+        return [row for row in self.rows if lo <= row[0] <= hi]
+
+    def answer(self, psqlQuery, params):
+        if ('min(' in psqlQuery):
+            return [(self.rows[0][0], self.rows[-1][0])] if self.rows else [(None, None)]
+        if ('width_bucket' in psqlQuery):
+            starts, lo, hi = params
+            buckets = {}
+            for row in self.inRange(lo, hi):
+                bucket = bisect.bisect_right(starts, row[0])
+                count, total = buckets.get(bucket, (0, 0))
+                buckets[bucket] = (count + 1, total + hash(repr(row)))
+            return [(bucket, count, total) for bucket, (count, total) in buckets.items()]
+        if ('count(*)' in psqlQuery):
+            return [(len(self.rows), sum(hash(repr(row)) for row in self.rows) if self.rows else None)]
+        self.ranges.append(tuple(params))
+        return self.inRange(*params)
+
+
+class TestRangeChecksum(unittest.TestCase):
+
+    def setUp(self):
+        self.alist = [(i, 'row %d' % i) for i in range(100)]
+
+    def compare(self, alist, blist, leafSize=10, fanout=4):
+        source = FakeConnection(alist)
+        target = FakeConnection(blist)
+        checksum = RangeChecksum(source, target, leafSize, fanout)
+        dataComparator = DataComparator()
+        checksum.compare(dataComparator)
+        expected = DataComparator()
+        expected.prepareDataChunks(list(alist), list(blist))
+        expected.finish()
+        for counter in ('numCorruptionErrors', 'numCopyOmissionErrors', 'numCreationErrors', 'totalTableSizeA',
+                        'totalTableSizeB'):
+            self.assertEqual(getattr(expected, counter), getattr(dataComparator, counter), counter)
+        return checksum, source, target
+
+    def testSplitRange(self):
+        checksum = RangeChecksum(FakeConnection([]), FakeConnection([]), fanout=4)
+        self.assertEqual([0, 2, 5, 7], checksum.splitRange(0, 9))
+        self.assertEqual([50, 56, 62, 68], checksum.splitRange(50, 74))
+        # a range narrower than the fanout is split into single keys.
+        self.assertEqual([5, 6, 7], checksum.splitRange(5, 7))
+        self.assertEqual([-3], checksum.splitRange(-3, -3))
+
+    def testBisectsToTheDifferingRange(self):
+        blist = list(self.alist)
+        blist[60] = (60, 'corrupted')
+        checksum, source, target = self.compare(self.alist, blist)
+        # 0-99 splits into buckets starting at 0, 25, 50, 75, key 60 is in the third, 50-74, which splits into
+        # 50, 56, 62, 68, so only the rows of 56-61 are fetched.
+        self.assertEqual([(56, 61)], source.ranges)
+        self.assertEqual([(56, 61)], target.ranges)
+        self.assertEqual(12, checksum.rowsFetched)
+
+    def testIdenticalTablesFetchNothing(self):
+        checksum, source, target = self.compare(self.alist, list(self.alist))
+        self.assertEqual(2, checksum.aggregateQueries)
+        self.assertEqual([], source.ranges)
+        self.assertEqual(0, checksum.rowsFetched)
+
+    def testOneSidedRanges(self):
+        # the target has rows past the end of the source and lost a block of rows, their ranges are empty on the
+        # other side.
+        blist = [row for row in self.alist if not 30 <= row[0] < 40] + [(i, 'new %d' % i) for i in range(200, 210)]
+        checksum, source, target = self.compare(self.alist, blist)
+        self.assertEqual(source.ranges, target.ranges)
+        self.assertLess(checksum.rowsFetched, len(self.alist) + len(blist))
+
+    def testEmptySide(self):
+        self.compare(self.alist, [])
+        self.compare([], self.alist)
+        self.compare([], [])
+
+    def testDiscoveredKey(self):
+        primaryKey = PrimaryKey(["order_no"], integer=[True])
+        blist = list(self.alist)
+        blist[60] = (60, 'corrupted')
+        source = FakeConnection(self.alist, primaryKey)
+        target = FakeConnection(blist, primaryKey)
+        RangeChecksum(source, target, 10, 4).compare(DataComparator())
+        self.assertEqual('select min("order_no"), max("order_no") from fake', source.queries[0])
+        self.assertIn('width_bucket("order_no", %s::bigint[])', source.queries[2])
+        self.assertIn('select "order_no", t.* from fake t where "order_no" between %s and %s order by "order_no"',
+                      source.queries)
+
+    def testOtherKeysAreRefused(self):
+        for primaryKey in (PrimaryKey(["code"], [True]), PrimaryKey(["a", "b"], integer=[True, True])):
+            source = FakeConnection(self.alist, primaryKey)
+            with self.assertRaises(ValueError):
+                RangeChecksum(source, FakeConnection(self.alist, primaryKey))
+            self.assertEqual([], source.queries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from RetryPolicy import RetryPolicy
+import unittest
+
+
+class FlakyOperation:
+    '''
+    Fails with a ConnectionError the given number of times before it succeeds.
+    '''
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if (self.calls <= self.failures):
+            raise ConnectionError("connection lost")
+        return self.calls
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.waits = []
+        self.policy = RetryPolicy(retries=3, backoff=0.5, maxBackoff=1.5, jitter=False, sleep=self.waits.append)
+
+    def testRetriesUntilSuccess(self):
+        retries = []
+        operation = FlakyOperation(2)
+        result = self.policy.call(operation, ConnectionError, lambda attempt, error: retries.append(attempt))
+        self.assertEqual(3, result)
+        self.assertEqual([1, 2], retries)
+        self.assertEqual([0.5, 1.0], self.waits)
+
+    def testGivesUpAfterTheLastRetry(self):
+        operation = FlakyOperation(10)
+        with self.assertRaises(ConnectionError):
+            self.policy.call(operation, ConnectionError)
+        self.assertEqual(4, operation.calls)
+        # the waits double up to the cap.
+        self.assertEqual([0.5, 1.0, 1.5], self.waits)
+
+    def testOtherErrorsAreRaisedAtOnce(self):
+        operation = FlakyOperation(1)
+        with self.assertRaises(ConnectionError):
+            self.policy.call(operation, ValueError)
+        self.assertEqual(1, operation.calls)
+        self.assertEqual([], self.waits)
+
+    def testRetryIfRejectsAnError(self):
+        operation = FlakyOperation(1)
+        with self.assertRaises(ConnectionError):
+            self.policy.call(operation, ConnectionError, retryIf=lambda error: False)
+        self.assertEqual(1, operation.calls)
+        self.assertEqual([], self.waits)
+        self.assertEqual(2, self.policy.call(FlakyOperation(1), ConnectionError, retryIf=lambda error: True))
+
+    def testFailedRecoveryCountsAsAnAttempt(self):
+        recoveries = FlakyOperation(1)
+        result = self.policy.call(FlakyOperation(1), ConnectionError, lambda attempt, error: recoveries())
+        self.assertEqual(2, result)
+        self.assertEqual(2, recoveries.calls)
+
+    def testJitterShortensTheWait(self):
+        policy = RetryPolicy(backoff=2.0, maxBackoff=60.0)
+        for attempt in range(1, 6):
+            delay = policy.delay(attempt)
+            self.assertLessEqual(2.0 * 2 ** (attempt - 1) / 2, delay)
+            self.assertLessEqual(delay, 2.0 * 2 ** (attempt - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
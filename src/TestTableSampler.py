@@ -0,0 +1,113 @@
+from TableSampler import TableSampler
+from DataComparator import DataComparator
+import TestDataComparator
+import TestHelpers
+import unittest
+import random
+import io
+
+
+class FakeConnection(TestHelpers.FakeConnection):
+    '''
+    Answers the sampler's queries over a table with an integer key. The TABLESAMPLE sample is every row whose key
+    is a multiple of 10, and the other queries are recognised by their predicate.
+    '''
+
+    def answer(self, psqlQuery, params):
+        if ('reltuples' in psqlQuery):
+            return [(len(self.rows),)]
+        if ('min(' in psqlQuery):
+            return [(self.rows[0][0], self.rows[-1][0])] if self.rows else [(None, None)]
+        if ('between' in psqlQuery):
+            return [row for row in self.rows if params[0] <= row[0] <= params[1]]
+        if ('limit' in psqlQuery):
+            return [row for row in self.rows if row[0] >= params[0]][:params[1]]
+        return [row for row in self.rows if row[0] >= params[0]]
+
+    def streamRows(self):
+        return [row for row in self.rows if row[0] % 10 == 0]
+
+
+class TestTableSampler(unittest.TestCase):
+
+    def setUp(self):
+        generator = TestDataComparator.TestDataComparator()
+        self.alist = generator.setupAData(5000)
+        self.blist = generator.setupBData(self.alist, 200, 150, 100)
+
+    def testWilsonInterval(self):
+        sampler = TableSampler(None, None)
+        rate, lower, upper = sampler.interval(0, 100)
+        self.assertEqual(0.0, rate)
+        self.assertEqual(0.0, lower)
+        self.assertAlmostEqual(0.0370, upper, places=4)
+        rate, lower, upper = sampler.interval(10, 100)
+        self.assertAlmostEqual(0.0552, lower, places=4)
+        self.assertAlmostEqual(0.1744, upper, places=4)
+        self.assertEqual((None, None, None), sampler.interval(0, 0))
+
+    def testTableSample(self):
+        source = FakeConnection(self.alist)
+        target = FakeConnection(self.blist)
+        sampler = TableSampler(source, target, "bernoulli", 10.0)
+        dataComparator = DataComparator()
+        sampler.compare(dataComparator, 64)
+
+        keysB = dict((row[0], row) for row in self.blist)
+        sampledA = [row for row in self.alist if row[0] % 10 == 0]
+        self.assertEqual(len(sampledA), sampler.sampledA)
+        self.assertEqual(sum(1 for row in sampledA if row[0] not in keysB), sampler.numCopyOmissionErrors)
+        self.assertEqual(sum(1 for row in sampledA if row[0] in keysB and keysB[row[0]] != row),
+                         sampler.numCorruptionErrors)
+        keysA = set(row[0] for row in self.alist)
+        self.assertEqual(sum(1 for key in keysB if key % 10 == 0 and key not in keysA), sampler.numCreationErrors)
+        self.assertEqual(dataComparator.numCreationErrors, sampler.numCreationErrors)
+        # the percentage and seed are left as bound parameters once the table name is in.
+        sampleQuery = 'select * from fake t tablesample bernoulli (%s) repeatable (%s) order by "id"'
+        self.assertIn(sampleQuery, source.queries)
+        self.assertIn(sampleQuery, target.queries)
+
+        estimates = sampler.estimates()
+        errors, sampled, rate, lower, upper, estimate = estimates['omission']
+        self.assertLessEqual(lower, rate)
+        self.assertLessEqual(rate, upper)
+        self.assertEqual(round(rate * len(self.alist)), estimate)
+        f = io.StringIO()
+        sampler.writeSummary(f)
+        self.assertIn("Corruption Rate", f.getvalue())
+
+    def testRangeMatchesAFullScanOfItsKeys(self):
+        # a single range longer than the table covers every key from its random start to the end of both tables.
+        keys = sorted(row[0] for row in self.alist)
+        start = random.Random(3).randint(keys[0], keys[-1])
+        expected = DataComparator()
+        expected.prepareDataChunks(sorted([row for row in self.alist if row[0] >= start], key=lambda row: row[0]),
+                                   sorted([row for row in self.blist if row[0] >= start], key=lambda row: row[0]))
+        expected.finish()
+
+        sampler = TableSampler(FakeConnection(self.alist), FakeConnection(self.blist), "ranges", seed=3, ranges=1,
+                               rangeSize=len(self.alist) + 1)
+        dataComparator = DataComparator()
+        sampler.compare(dataComparator)
+        self.assertEqual(expected.totalTableSizeA, sampler.sampledA)
+        self.assertEqual(expected.totalTableSizeB, sampler.sampledB)
+        self.assertEqual(expected.numCorruptionErrors, sampler.numCorruptionErrors)
+        self.assertEqual(expected.numCopyOmissionErrors, sampler.numCopyOmissionErrors)
+        self.assertEqual(expected.numCreationErrors, sampler.numCreationErrors)
+
+    def testRangesDoNotOverlap(self):
+        sampler = TableSampler(FakeConnection(self.alist), FakeConnection(self.blist), "ranges", ranges=200,
+                               rangeSize=50)
+        dataComparator = DataComparator()
+        sampler.compare(dataComparator)
+        self.assertLessEqual(sampler.sampledA, len(self.alist))
+        self.assertEqual(dataComparator.totalTableSizeA, sampler.sampledA)
+        self.assertEqual(dataComparator.totalTableSizeB, sampler.sampledB)
+
+    def testRejectsUnknownMethod(self):
+        with self.assertRaises(ValueError):
+            TableSampler(None, None, "reservoir")
+
+
+if __name__ == '__main__':
+    unittest.main()
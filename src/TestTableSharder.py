@@ -0,0 +1,115 @@
+from TableSharder import TableSharder, compareShard
+from DataComparator import DataComparator
+from PrimaryKey import PrimaryKey
+from RetryPolicy import RetryPolicy
+import TestHelpers
+import unittest
+from unittest import mock
+
+
+class FakeConnection(TestHelpers.FakeConnection):
+    '''
+    Answers the sharder's queries with the given pg_stats histogram and key bounds, keeping their parameters.
+    '''
+
+    def __init__(self, histogram=None, bounds=(None, None), primaryKey=None):
+        super().__init__([], primaryKey)
+        self.histogram = histogram
+        self.bounds = bounds
+        self.params = []
+
+    def answer(self, psqlQuery, params):
+        self.params.append(params)
+        if ('pg_stats' in psqlQuery):
+            return [(self.histogram,)] if self.histogram else []
+        return [self.bounds]
+
+
+class ShardConnection(TestHelpers.FakeConnection):
+    '''
+    Stands in for the PsycoConnection of a shard worker, the rows of its table are passed as the server. A keyed
+    scan returns the rows of its key range, and the connections made are kept in opened.
+    '''
+
+    opened = []
+
+    def __init__(self, psqldb, streaming=False, itersize=2000, metrics=None, pool=None):
+        super().__init__(psqldb)
+        self.pool = pool
+        self.scans = []
+        self.closed = False
+        self.opened.append(self)
+
+    def scanTable(self, n=None, lastKey=None, lo=None, hi=None):
+        self.scans.append((lastKey, lo, hi))
+        self.stream = [row for row in self.rows if (lo is None or row[0] >= lo) and (hi is None or row[0] < hi)]
+        self.n = n
+
+    def close(self):
+        self.closed = True
+
+
+class TestTableSharder(unittest.TestCase):
+
+    def testHistogramOfTheKeyColumn(self):
+        source = FakeConnection('{0,10,20,30,40,50,60,70}', primaryKey=PrimaryKey(["order_no"]))
+        sharder = TableSharder(source, FakeConnection())
+        self.assertEqual([(None, 20), (20, 40), (40, 60), (60, None)], sharder.shardRanges(4))
+        psqlQuery, params = source.queries[0], source.params[0]
+        # the statistics are those of the key column, in the schema the table name resolves to.
+        self.assertIn("c.oid = 'fake'::regclass", psqlQuery)
+        self.assertIn("n.nspname = s.schemaname", psqlQuery)
+        self.assertEqual(["order_no"], params)
+
+    def testMinMaxOfTheKeyColumn(self):
+        source = FakeConnection(bounds=(1, 50), primaryKey=PrimaryKey(["order_no"]))
+        target = FakeConnection(bounds=(5, 100))
+        self.assertEqual([(None, 51), (51, None)], TableSharder(source, target).shardRanges(2))
+        self.assertEqual('select min("order_no"), max("order_no") from fake', target.queries[0])
+
+    def testOtherKeysAreNotSplit(self):
+        source = FakeConnection('{a,m,z}', bounds=('a', 'z'), primaryKey=PrimaryKey(["code"], [True]))
+        self.assertEqual([(None, None)], TableSharder(source, FakeConnection(bounds=('b', 'y'))).shardRanges(4))
+        with self.assertRaises(ValueError):
+            TableSharder(FakeConnection(primaryKey=PrimaryKey(["a", "b"])), FakeConnection())
+
+    def testShardIsAResumableScanOnThePool(self):
+        rows = [(i, 'row %d' % i) for i in range(100)]
+        retryPolicy = RetryPolicy(3, 0.5)
+        ShardConnection.opened = []
+        with mock.patch('TableSharder.PsycoConnection', ShardConnection), \
+                mock.patch('TableSharder.connectionPool', lambda psqldb, size, policy: (size, policy)):
+            dataComparator = compareShard(rows, rows, 'fake', 20, 40, 7, DataComparator, None, None,
+                                          poolSize=4, retryPolicy=retryPolicy)
+        self.assertEqual(2, len(ShardConnection.opened))
+        for connection in ShardConnection.opened:
+            # the worker's connections come from a pool with the run's size and retries, and read the range with
+            # a keyed scan, which fetchNext() can resume after its last key.
+            self.assertEqual((4, retryPolicy), connection.pool)
+            self.assertEqual([(None, 20, 40)], connection.scans)
+            self.assertTrue(connection.closed)
+        self.assertEqual(20, dataComparator.totalTableSizeA)
+        self.assertEqual(0, dataComparator.numCorruptionErrors)
+
+    def testMergedShardsMatchAFullScan(self):
+        rowsA = [(i, 'row %d' % i) for i in range(100)]
+        rowsB = [row for row in rowsA if row[0] not in (19, 20, 77)] + [(i, 'new %d' % i) for i in range(100, 105)]
+        rowsB[50] = (rowsB[50][0], 'corrupted')
+        expected = DataComparator()
+        expected.prepareDataChunks(list(rowsA), list(rowsB))
+        expected.finish()
+        with mock.patch('TableSharder.PsycoConnection', ShardConnection), \
+                mock.patch('TableSharder.connectionPool', lambda psqldb, size, policy: None):
+            merged = DataComparator()
+            for lo, hi in [(None, 20), (20, 40), (40, 80), (80, None)]:
+                merged.merge(compareShard(rowsA, rowsB, 'fake', lo, hi, 6, DataComparator, None, None))
+        for counter in ('numCorruptionErrors', 'numCopyOmissionErrors', 'numCreationErrors', 'totalTableSizeA',
+                        'totalTableSizeB'):
+            self.assertEqual(getattr(expected, counter), getattr(merged, counter), counter)
+        self.assertEqual(sorted(expected.corruptionErrors), sorted(merged.corruptionErrors))
+        self.assertEqual(sorted(expected.copyOmissionErrors), sorted(merged.copyOmissionErrors))
+        self.assertEqual(sorted(expected.creationErrors), sorted(merged.creationErrors))
+
+
+if __name__ == '__main__':
+    unittest.main()
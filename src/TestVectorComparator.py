@@ -0,0 +1,43 @@
+from VectorComparator import VectorComparator, np
+import TestDataComparator
+import unittest
+
+
+@unittest.skipIf(np is None, "numpy is not installed.")
+class TestVectorComparator(TestDataComparator.TestDataComparator):
+    '''
+    Runs every DataComparator verification test against the numpy engine, plus tests for the column types and
+    per column counts it adds.
+    '''
+    comparatorClass = VectorComparator
+
+    def testColumnMismatchCounts(self):
+        alist = [(1, 1, 'a', 1.5), (2, 2, 'b', 2.5), (3, 3, 'c', 3.5)]
+        blist = [(1, 1, 'a', 1.5), (2, 2, 'x', 2.5), (3, 4, 'y', 3.5)]
+        self.computeSingleChunk(alist, blist)
+        self.assertErrorCount(2, 0, 0)
+        self.assertEqual([0, 1, 2, 0], list(self.DataComparator.columnMismatchCounts))
+
+    def testColumnMismatchCountsAcrossChunks(self):
+        # rows 1 and 2 only find their partner in the next chunk, through the leftover hashmaps.
+        self.computeChunk([(1, 1, 'a'), (2, 2, 'b'), (3, 3, 'c')], [(3, 3, 'x')])
+        self.computeChunk([(4, 4, 'd')], [(1, 1, 'a'), (2, 5, 'y'), (4, 4, 'd')])
+        self.DataComparator.finish()
+        self.assertErrorCount(2, 0, 0)
+        self.assertEqual([0, 1, 2], list(self.DataComparator.columnMismatchCounts))
+
+    def testNullAndObjectColumns(self):
+        alist = [(1, None, [1, 2]), (2, None, [3]), (3, 5, None)]
+        blist = [(1, None, [1, 2]), (2, 0, [3]), (3, 5, [4])]
+        self.computeSingleChunk(alist, blist)
+        self.assertErrorCount(2, 0, 0)
+
+    def testUnevenRowWidths(self):
+        alist = [(1, 1), (2, 2)]
+        blist = [(1, 1, 'new'), (2, 3, 'new')]
+        self.computeSingleChunk(alist, blist)
+        self.assertErrorCount(1, 0, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
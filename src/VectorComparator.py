@@ -0,0 +1,163 @@
+from typing import List
+
+from DataComparator import DataComparator
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, only this comparison engine needs it.
+    np = None
+
+
+class VectorComparator(DataComparator):
+    """
+    Data comparator that compares the rows of each aligned chunk pair with whole-array numpy operations instead of
+    looping over rows and columns in Python.
+
+    Every chunk is transposed into one array per column. Primary keys present in both chunks are matched with
+    np.intersect1d, then each column of the matched rows is compared in a single vectorized operation, which also
+    counts the mismatches of every column. Integer, float and boolean columns become native numpy arrays; any
+    other column (text, dates, decimals, nulls...) is compared as an object array, which still avoids the Python
+    loop. Rows without a partner in the same chunk go through the regular DataComparator leftover hashmaps, and
+    the mismatching columns of those that find their partner there are counted one row at a time.
+
+    Requires numpy, which is not installed by requirements.txt.
+    """
+
+    CHECKPOINTED = DataComparator.CHECKPOINTED + ('columnMismatchCounts',)
+
+    def __init__(self, sinkFactory=None, rowDecoder=None):
+        if (np is None):
+            raise ImportError("VectorComparator requires numpy, install it with `pip install numpy`.")
+        super().__init__(sinkFactory, rowDecoder)
+        # number of mismatching values found in each column of matched rows.
+        self.columnMismatchCounts = np.zeros(0, dtype=np.int64)
+
+    def processDataChunks(self, alist:List, blist:List):
+        '''
+        Compares the rows that are present in both chunks with array operations and hands the remaining rows
+        to the hashmap based DataComparator.processDataChunks.
+        :param alist: the rows that just arrived from database A.
+        :param blist: the rows that just arrived from database B.
+        :return:
+        '''
+        width = len(alist[0]) if len(alist) > 0 else 0
+        if (len(alist) == 0 or len(blist) == 0 or not self.hasWidth(alist, width) or
+                not self.hasWidth(blist, width)):
+            # nothing to align, or rows of uneven width that only the row by row comparison handles.
+            super().processDataChunks(alist, blist)
+            return
+
+        columnsA = [self.toColumnArray(column) for column in zip(*alist)]
+        columnsB = [self.toColumnArray(column) for column in zip(*blist)]
+        try:
+            common, indexesA, indexesB = np.intersect1d(columnsA[0], columnsB[0], assume_unique=True,
+                                                        return_indices=True)
+        except TypeError:
+            # primary keys that cannot be sorted together.
+            super().processDataChunks(alist, blist)
+            return
+
+        self.growMismatchCounts(width)
+        mismatchedRows = np.zeros(len(common), dtype=bool)
+        for column in range(1, width):
+            mismatches = self.compareColumns(columnsA[column][indexesA], columnsB[column][indexesB])
+            self.columnMismatchCounts[column] += np.count_nonzero(mismatches)
+            mismatchedRows |= mismatches
+
+        for position in np.flatnonzero(mismatchedRows):
+            self.addCorruptionError(alist[indexesA[position]], blist[indexesB[position]])
+
+        unmatchedA = np.ones(len(alist), dtype=bool)
+        unmatchedA[indexesA] = False
+        unmatchedB = np.ones(len(blist), dtype=bool)
+        unmatchedB[indexesB] = False
+        super().processDataChunks([alist[i] for i in np.flatnonzero(unmatchedA)],
+                                  [blist[i] for i in np.flatnonzero(unmatchedB)])
+
+    def compareData(self, a, b):
+        '''
+        Compares a row matched through the leftover hashmaps, outside of its chunk, and counts the mismatches of
+        each of its columns like the vectorized comparison does.
+        :param a: the row from database A.
+        :param b: the row from database B.
+        :return: if the information is equivalent.
+        '''
+        if (super().compareData(a, b)):
+            return True
+        self.growMismatchCounts(len(a))
+        for column in range(1, len(a)):
+            if (a[column] != b[column]):
+                self.columnMismatchCounts[column] += 1
+        return False
+
+    def growMismatchCounts(self, width):
+        '''
+        Helper function that makes room in the per column mismatch counts for rows of the given width.
+        :param width: number of columns of the rows being compared.
+        :return:
+        '''
+        if (len(self.columnMismatchCounts) < width):
+            self.columnMismatchCounts = np.concatenate(
+                (self.columnMismatchCounts, np.zeros(width - len(self.columnMismatchCounts), dtype=np.int64)))
+
+    def hasWidth(self, rows, width):
+        '''
+        Helper function that checks every row of a chunk has the same number of columns.
+        :param rows: a chunk of rows.
+        :param width: the expected number of columns.
+        :return: True if all rows have that width.
+        '''
+        return all(len(row) == width for row in rows)
+
+    def toColumnArray(self, values):
+        '''
+        Helper function that turns the values of one column into a numpy array. Numeric and boolean columns get
+        a native dtype, everything else is kept as Python objects so equality keeps its Python meaning.
+        :param values: tuple of the column's values.
+        :return: a one dimensional numpy array.
+        '''
+        try:
+            array = np.array(values)
+            if (array.ndim == 1 and array.dtype.kind in 'biuf'):
+                return array
+        except (ValueError, TypeError, OverflowError):
+            pass
+        return np.fromiter(values, dtype=object, count=len(values))
+
+    def compareColumns(self, a, b):
+        '''
+        Helper function that compares the values of one column of the matched rows.
+        :param a: column values from database A.
+        :param b: column values from database B, in the same row order.
+        :return: boolean array, True where the values differ.
+        '''
+        if (a.dtype.kind in 'biuf' and b.dtype.kind in 'biuf'):
+            return a != b
+        # cells are compared with their own != operator, exactly as DataComparator.compareData does.
+        return np.not_equal(a.astype(object), b.astype(object)).astype(bool)
+
+    def merge(self, other):
+        '''
+        Adds the results of another VectorComparator, including its per column mismatch counts.
+        :param other: a finished VectorComparator.
+        :return:
+        '''
+        super().merge(other)
+        width = max(len(self.columnMismatchCounts), len(other.columnMismatchCounts))
+        counts = np.zeros(width, dtype=np.int64)
+        counts[:len(self.columnMismatchCounts)] += self.columnMismatchCounts
+        counts[:len(other.columnMismatchCounts)] += other.columnMismatchCounts
+        self.columnMismatchCounts = counts
+
+    def writeSummary(self, f):
+        '''
+        Writes the DataComparator summary followed by the number of mismatches found in each column.
+        :param f: a writable text file.
+        :return:
+        '''
+        super().writeSummary(f)
+        if (self.columnMismatchCounts.any()):
+            f.write("\nMismatched Values Per Column (of rows present in both databases):\n")
+            for column in np.flatnonzero(self.columnMismatchCounts):
+                f.write("\tColumn %d:\t%d\n" % (column, self.columnMismatchCounts[column]))